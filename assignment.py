@@ -0,0 +1,342 @@
+"""店舗ヘルプ希望への従業員の自動割り当て（割り当て案の作成）
+
+期間のシフト表で AM可 / PM可 / 1日可 のまま店舗が決まっていないセルを空き枠とし、
+店舗ヘルプ希望を午前・午後の枠に分けて、エリアごとに最小費用流で割り当てる。
+    - 従業員は同じエリア（組織のマスタの従業員・店舗のエリア）の店舗にだけ割り当てる
+    - AM可 は午前、PM可 は午後、1日可 は午前・午後の枠に1件ずつ入れる（同じ時間に2店舗は入らない）
+    - 割り当てる件数を最大にしたうえで、期間内の割り当て件数が少ない従業員を優先する
+    - 既にだれかが入っている希望の時間帯には割り当てない
+結果は従業員・日付ごとのシフト文字列の案で、write_queue からまとめて保存できる。
+
+    python cli.py assign --year 2024 --month 4 [--save]
+"""
+import heapq
+import numpy as np
+import pandas as pd
+from intervals import ShiftIntervalIndex, parse_time_ranges
+
+# 午前と午後の境目（0時からの分）
+HALF_DAY_SPLIT = 12 * 60
+AM, PM = 'AM', 'PM'
+# 空き枠として扱うシフトと、入れる枠
+AVAILABLE_HALVES = {'AM可': (AM,), 'PM可': (PM,), '1日可': (AM, PM)}
+# 割り当て件数1件あたりの費用（件数が増えるほど次の1件を高くし、少ない従業員から割り当てる）
+FAIRNESS_COST = 10
+# 1日可の従業員を半日の枠に使う費用（AM可 / PM可 の従業員を先に使い、1日可の枠を残す）
+FULL_DAY_SLOT_COST = 1
+
+REASON_UNPARSABLE = '時間を解釈できません'
+REASON_NO_EMPLOYEES = 'エリアに従業員がいません'
+REASON_NO_AVAILABILITY = '空いている従業員がいません'
+
+
+def format_help_time(start, end):
+    """(開始, 終了)（分）をシフト文字列の時間帯（9-12 / 12半-17）に変換"""
+    def format_time(minutes):
+        hour, minute = divmod(minutes, 60)
+        if minute == 0:
+            return str(hour)
+        if minute == 30:
+            return f'{hour}半'
+        return f'{hour}:{minute:02d}'
+    return f'{format_time(start)}-{format_time(end)}'
+
+
+def split_help_time(help_time):
+    """ヘルプ希望の時間帯を午前・午後の枠に分け、(枠, 開始, 終了) の一覧で返す"""
+    units = []
+    for start, end in parse_time_ranges(help_time):
+        if start < HALF_DAY_SPLIT:
+            units.append((AM, start, min(end, HALF_DAY_SPLIT)))
+        if end > HALF_DAY_SPLIT:
+            units.append((PM, max(start, HALF_DAY_SPLIT), end))
+    return units
+
+
+class MinCostFlow:
+    """最小費用流（ポテンシャル付きダイクストラ法による逐次最短路）"""
+
+    def __init__(self):
+        self.graph = []
+        self.to = []
+        self.capacity = []
+        self.cost = []
+
+    def add_node(self):
+        self.graph.append([])
+        return len(self.graph) - 1
+
+    def add_edge(self, u, v, capacity, cost):
+        """辺を追加して番号を返す（逆辺は番号 ^ 1）"""
+        edge = len(self.to)
+        self.to += [v, u]
+        self.capacity += [capacity, 0]
+        self.cost += [cost, -cost]
+        self.graph[u].append(edge)
+        self.graph[v].append(edge + 1)
+        return edge
+
+    def flow(self, source, sink):
+        """source から sink へ流せるだけ流し、(流量, 費用) を返す（費用は非負であること）"""
+        graph, to, capacity, cost = self.graph, self.to, self.capacity, self.cost
+        n = len(graph)
+        potential = [0] * n
+        total_flow = total_cost = 0
+        while True:
+            dist = [float('inf')] * n
+            prev_edge = [-1] * n
+            done = [False] * n
+            dist[source] = 0
+            heap = [(0, source)]
+            while heap:
+                d, u = heapq.heappop(heap)
+                if done[u]:
+                    continue
+                done[u] = True
+                if u == sink:
+                    break
+                base = d + potential[u]
+                for edge in graph[u]:
+                    if capacity[edge] > 0:
+                        v = to[edge]
+                        nd = base + cost[edge] - potential[v]
+                        if nd < dist[v]:
+                            dist[v] = nd
+                            prev_edge[v] = edge
+                            heapq.heappush(heap, (nd, v))
+            if not done[sink]:
+                break
+            # sink に届いた時点で探索を打ち切るため、未確定の頂点は sink までの距離で更新する
+            sink_dist = dist[sink]
+            for v in range(n):
+                potential[v] += dist[v] if done[v] else sink_dist
+
+            amount = float('inf')
+            v = sink
+            while v != source:
+                edge = prev_edge[v]
+                amount = min(amount, capacity[edge])
+                v = to[edge ^ 1]
+            v = sink
+            while v != source:
+                edge = prev_edge[v]
+                capacity[edge] -= amount
+                capacity[edge ^ 1] += amount
+                total_cost += amount * cost[edge]
+                v = to[edge ^ 1]
+            total_flow += amount
+        return total_flow, total_cost
+
+
+class AssignmentPlan:
+    """割り当て案
+
+    assignments: 割り当てた時間帯（date, employee, store, start, end, half）
+    unassigned: 割り当てられなかった希望（date, store, help_time, time, reason）
+    shifts: {(日付, 従業員): シフト文字列の案}
+    loads: 従業員ごとの割り当て件数（既存の割り当てを含む、半日単位）
+    """
+
+    def __init__(self, assignments, unassigned, shifts, loads):
+        self.assignments = assignments
+        self.unassigned = unassigned
+        self.shifts = shifts
+        self.loads = loads
+
+    def shift_rows(self):
+        """保存用の (date, employee, shift) の一覧"""
+        return [{'date': date, 'employee': employee, 'shift': shift} for (date, employee), shift in sorted(self.shifts.items())]
+
+    def to_frame(self):
+        """画面・CLIに表示する割り当て案の表"""
+        columns = ['date', 'employee', 'store', 'time', 'shift']
+        if self.assignments.empty:
+            return pd.DataFrame(columns=columns)
+        df = self.assignments.sort_values(['date', 'store', 'start'], kind='mergesort')
+        return pd.DataFrame({
+            'date': df['date'].to_numpy(),
+            'employee': df['employee'].to_numpy(),
+            'store': df['store'].to_numpy(),
+            'time': [format_help_time(start, end) for start, end in zip(df['start'], df['end'])],
+            'shift': [self.shifts[(date, employee)] for date, employee in zip(df['date'], df['employee'])],
+        }, columns=columns)
+
+
+def _existing_loads(index):
+    """既存の店舗割り当てを従業員ごとに半日単位で数える"""
+    df = index.intervals[index.intervals['store'] != '']
+    if df.empty:
+        return {}
+    halves = pd.DataFrame({
+        'employee': df['employee'].to_numpy(),
+        'date': df['date'].to_numpy(),
+        'am': (df['start'] < HALF_DAY_SPLIT).to_numpy(),
+        'pm': (df['end'] > HALF_DAY_SPLIT).to_numpy(),
+    }).groupby(['employee', 'date']).any()
+    return (halves['am'].astype(int) + halves['pm'].astype(int)).groupby(level='employee').sum().to_dict()
+
+
+def _available_slots(shift_data, employees):
+    """店舗が決まっていない AM可 / PM可 / 1日可 のセルを (日付, 従業員, シフト) の一覧で返す"""
+    columns = [employee for employee in shift_data.columns if employee in employees]
+    if not columns:
+        return []
+    values = shift_data[columns].to_numpy(dtype=object)
+    available = np.isin(values, list(AVAILABLE_HALVES))
+    rows, cols = np.nonzero(available)
+    dates = shift_data.index
+    return [(dates[row], columns[col], values[row, col]) for row, col in zip(rows, cols)]
+
+
+def _solve_area(units, slots, loads):
+    """1エリア分の割り当てを解く
+
+    同じ日付・枠（午前/午後）の希望はその枠の空き従業員のだれでも入れるため、
+    (日付, 枠) ごとに1つの頂点にまとめ、だれを選ぶかだけを最小費用流で決める。
+    units: 希望の枠 (日付, 店舗, 枠, 開始, 終了) の一覧
+    slots: 空き枠 (日付, 従業員, シフト) の一覧
+    Returns:
+        dict: {units の番号: 従業員}
+    """
+    groups = {}
+    for i in sorted(range(len(units)), key=lambda i: (units[i][1], units[i][3])):
+        date, _, half, _, _ = units[i]
+        groups.setdefault((date, half), []).append(i)
+
+    flow = MinCostFlow()
+    source, sink = flow.add_node(), flow.add_node()
+    group_nodes = {}
+    for key, members in groups.items():
+        group_nodes[key] = flow.add_node()
+        flow.add_edge(group_nodes[key], sink, len(members), 0)
+
+    employee_nodes = {}
+    slot_counts = {}
+    # 空き枠の辺の番号 -> (従業員, (日付, 枠))
+    slot_edges = {}
+    for date, employee, shift in slots:
+        halves = AVAILABLE_HALVES[shift]
+        slot_cost = FULL_DAY_SLOT_COST if len(halves) > 1 else 0
+        for half in halves:
+            node = group_nodes.get((date, half))
+            if node is None:
+                continue
+            if employee not in employee_nodes:
+                employee_nodes[employee] = flow.add_node()
+            slot_counts[employee] = slot_counts.get(employee, 0) + 1
+            slot_edges[flow.add_edge(employee_nodes[employee], node, 1, slot_cost)] = (employee, (date, half))
+
+    # k件目の割り当ての費用を (既存の件数 + k) に比例させ、件数の合計を均等にする
+    for employee, node in employee_nodes.items():
+        load = loads.get(employee, 0)
+        for k in range(min(slot_counts[employee], len(units))):
+            flow.add_edge(source, node, 1, FAIRNESS_COST * (load + k))
+
+    flow.flow(source, sink)
+    chosen = {}
+    for edge, (employee, key) in slot_edges.items():
+        if flow.capacity[edge] == 0:
+            chosen.setdefault(key, []).append(employee)
+
+    assigned = {}
+    for (date, half), members in groups.items():
+        if half != AM:
+            continue
+        # 午前・午後の両方に選ばれた従業員には、午前から午後へ続く同じ店舗の希望をまとめて割り当てる
+        afternoon = groups.get((date, PM), [])
+        both = set(chosen.get((date, AM), [])) & set(chosen.get((date, PM), []))
+        for employee in sorted(both):
+            pair = next(((i, j) for i in members if i not in assigned for j in afternoon
+                         if j not in assigned and units[i][1] == units[j][1] and units[i][4] == units[j][3]), None)
+            if pair is None:
+                # 続く希望がなければ、この従業員は下で午前・午後を別々に割り当てる
+                continue
+            assigned[pair[0]] = assigned[pair[1]] = employee
+            chosen[(date, AM)].remove(employee)
+            chosen[(date, PM)].remove(employee)
+    for key, members in groups.items():
+        employees = iter(sorted(chosen.get(key, [])))
+        for i in members:
+            if i not in assigned:
+                employee = next(employees, None)
+                if employee is None:
+                    break
+                assigned[i] = employee
+    return assigned
+
+
+def _proposed_shift(shift_type, parts):
+    """シフトの種類と (開始, 終了, 店舗) の一覧からシフト文字列を作る（同じ店舗で続く時間帯はまとめる）"""
+    merged = []
+    for start, end, store in sorted(parts):
+        if merged and merged[-1][2] == store and merged[-1][1] == start:
+            merged[-1] = (merged[-1][0], end, store)
+        else:
+            merged.append((start, end, store))
+    return ','.join([shift_type] + [f'{format_help_time(start, end)}@{store}' for start, end, store in merged])
+
+
+def solve_help_assignment(shift_data, store_help_requests, employee_areas=None, areas=None):
+    """期間のシフト表と店舗ヘルプ希望から割り当て案（AssignmentPlan）を作成する"""
+    if employee_areas is None or areas is None:
+        from organisation import current_organisation
+        organisation = current_organisation()
+        employee_areas = organisation.employee_areas if employee_areas is None else employee_areas
+        areas = organisation.areas if areas is None else areas
+    employee_area = {employee: area for area, employees in employee_areas.items() for employee in employees}
+    store_area = {store: area for area, stores in areas.items() for store in stores}
+
+    index = ShiftIntervalIndex(shift_data)
+    loads = _existing_loads(index)
+
+    # 希望を午前・午後の枠に分け、既にだれかが入っている枠は除く
+    units_by_area = {}
+    unassigned = []
+    if store_help_requests is not None and not store_help_requests.empty:
+        stacked = store_help_requests.stack()
+        stacked = stacked[stacked.notna() & (stacked != '-') & (stacked != '')]
+        for (date, store), help_time in stacked.items():
+            date = pd.Timestamp(date)
+            if date not in shift_data.index:
+                continue
+            units = split_help_time(help_time)
+            if not units:
+                unassigned.append((date, store, help_time, '', REASON_UNPARSABLE))
+                continue
+            occupied = index.store_intervals(date, store)
+            for half, start, end in units:
+                if any(other_start < end and other_end > start for _, other_start, other_end in occupied):
+                    continue
+                units_by_area.setdefault(store_area.get(store), []).append((date, store, half, start, end, help_time))
+
+    available = _available_slots(shift_data, employee_area)
+    slots_by_area = {}
+    for date, employee, shift in available:
+        slots_by_area.setdefault(employee_area[employee], []).append((date, employee, shift))
+
+    assigned_rows = []
+    for area, units in units_by_area.items():
+        slots = slots_by_area.get(area, [])
+        assigned = _solve_area([unit[:5] for unit in units], slots, loads) if slots else {}
+        for i, (date, store, half, start, end, help_time) in enumerate(units):
+            employee = assigned.get(i)
+            if employee is None:
+                reason = REASON_NO_AVAILABILITY if slots else REASON_NO_EMPLOYEES
+                unassigned.append((date, store, help_time, format_help_time(start, end), reason))
+            else:
+                assigned_rows.append((date, employee, store, start, end, half))
+
+    assignments = pd.DataFrame(assigned_rows, columns=['date', 'employee', 'store', 'start', 'end', 'half'])
+    parts = {}
+    for date, employee, store, start, end, _ in assigned_rows:
+        parts.setdefault((date, employee), []).append((start, end, store))
+    shifts = {(date, employee): _proposed_shift(shift_data.at[date, employee], cell_parts)
+              for (date, employee), cell_parts in parts.items()}
+
+    new_loads = assignments.groupby('employee').size().to_dict() if assigned_rows else {}
+    all_employees = sorted(set(loads) | set(new_loads) | {employee for _, employee, _ in available})
+    load_series = pd.Series({employee: loads.get(employee, 0) + new_loads.get(employee, 0) for employee in all_employees}, dtype=int)
+
+    unassigned = pd.DataFrame(unassigned, columns=['date', 'store', 'help_time', 'time', 'reason'])
+    unassigned = unassigned.sort_values(['date', 'store'], kind='mergesort').reset_index(drop=True)
+    return AssignmentPlan(assignments, unassigned, shifts, load_series)
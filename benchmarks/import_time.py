@@ -0,0 +1,66 @@
+"""モジュールのインポート時間の計測（コールドスタートの診断用）
+
+使い方（リポジトリ直下で実行）:
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --modules database pdf_generator --repeat 5
+"""
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# アプリ起動時に読み込まれるモジュールと、必要になったときだけ読み込む重い依存関係
+DEFAULT_MODULES = [
+    'constants', 'utils', 'database', 'period', 'pdf_cache', 'profiling',
+    'pdf_generator', 'streamlit', 'pandas', 'reportlab.platypus', 'jpholiday', 'supabase', 'dotenv',
+]
+
+_SNIPPET = """
+import sys, time, importlib
+started = time.perf_counter()
+importlib.import_module(sys.argv[1])
+print(time.perf_counter() - started)
+"""
+
+
+def measure_import_time(module, repeat=3):
+    """新しいPythonプロセスでmoduleをインポートし、秒数の一覧を返す（依存関係の読み込みを含む）"""
+    timings = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-c', _SNIPPET, module], cwd=REPO_DIR,
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'import failed')
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return timings
+
+
+def measure_import_times(modules=DEFAULT_MODULES, repeat=3):
+    """{'import:モジュール名': 中央値(秒)} を返す（読み込めないモジュールは省略）"""
+    results = {}
+    for module in modules:
+        key = f'import:{module}'
+        try:
+            timings = measure_import_time(module, repeat)
+        except RuntimeError as e:
+            print(f'{key:<50} 失敗: {e}')
+            continue
+        results[key] = statistics.median(timings)
+        print(f'{key:<50} 中央値 {results[key] * 1000:9.2f} ms  最小 {min(timings) * 1000:9.2f} ms')
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='モジュールのインポート時間の計測')
+    parser.add_argument('--modules', nargs='+', default=DEFAULT_MODULES)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+    measure_import_times(args.modules, args.repeat)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
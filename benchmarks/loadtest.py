@@ -0,0 +1,363 @@
+"""複数のセッションを同時に動かす負荷試験（Streamlitのテスト用API AppTest で main.py を実行する）
+
+--sessions 個のセッションをスレッドで並行に動かし、各セッションが期間の選択・シフトの編集と保存・
+繰り返し登録の日付の切り替え・PDFのダウンロードを --iterations 回繰り返す。
+AppTest は再実行のたびにStreamlitのランタイム（プロセスで1つ）を差し替えるため、同じプロセスの再実行は
+1つずつ行う（待った時間も所要時間に含め、平均を「待ち(ms)」に表示する）。
+--processes を指定すると、セッションを複数のプロセスに分けて同時に再実行する（データベースは共有）。
+データベースは一時ディレクトリのSQLite（local_database.SQLiteDB）に合成データを登録して使うため、
+ネットワークやSupabaseの認証情報がなくても実行できる。
+
+結果として、操作ごとの所要時間の分位点（p50 / p90 / p99）、1セッションあたりのメモリ、
+全体のスループット（操作/秒）と、書き込みキューの送信結果を表示する。
+エラー（画面の例外・操作できなかった要素）があれば終了コード 1 を返す。
+
+使い方（リポジトリ直下で実行）:
+    python -m benchmarks.loadtest --sessions 20 --iterations 5
+    python -m benchmarks.loadtest --sessions 50 --processes 4 --employees 100 --stores 50 --json loadtest.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import logging
+import resource
+import tempfile
+import threading
+from datetime import datetime
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN_SCRIPT = os.path.join(REPO_DIR, 'main.py')
+FONT_FILES = ['NotoSansJP-VariableFont_wght.ttf', 'NotoSansJP-Bold.ttf']
+# 保存するシフト（店舗・時間帯の入力が要らない種類）
+SHIFT_CHOICES = ['1日可', '休み', '-', '鹿屋', 'リクルート']
+PERCENTILES = [50, 90, 99]
+
+
+def prepare_environment(directory):
+    """一時ディレクトリのSQLite・書き込みキューなどを使うよう環境変数を設定する（アプリのモジュールを読み込む前に呼ぶ）"""
+    os.environ.update({
+        'HELP2_DATABASE': 'sqlite:///' + os.path.join(directory, 'help2.db'),
+        'HELP2_WRITE_QUEUE': os.path.join(directory, 'write_queue.db'),
+        'HELP2_FROZEN_DIR': os.path.join(directory, 'frozen'),
+        'HELP2_ROLLUPS': os.path.join(directory, 'rollups.db'),
+        # 他のセッションの保存を定期的に確認する処理は、操作の所要時間に含めない
+        'HELP2_LIVE_UPDATE_INTERVAL': '0',
+    })
+    for name in ('HELP2_TENANTS', 'HELP2_TENANT', 'HELP2_SHARED_CACHE', 'PDF_CACHE_DIR'):
+        os.environ.pop(name, None)
+
+
+def seed_database(n_employees, n_stores, year, months, seed=0):
+    """合成した組織と期間のシフト・店舗ヘルプ希望をデータベースに登録し、組織を返す"""
+    from benchmarks.synthetic import make_organisation, generate_period
+    from database import db
+
+    organisation = make_organisation(n_employees, n_stores)
+    db.save_organisation(organisation.employee_rows(), organisation.store_rows())
+    for month in months:
+        shifts, help_requests = generate_period(year, month, organisation, seed=seed + month)
+        db.save_shifts([{'date': date, 'employee': employee, 'shift': shift}
+                        for (date, employee), shift in shifts.stack().items() if shift != '-'])
+        db.save_store_help_requests([{'date': date, 'store': store, 'help_time': help_time}
+                                     for (date, store), help_time in help_requests.stack().items() if help_time != '-'])
+    return organisation
+
+
+def rss_bytes():
+    """現在のプロセスの常駐メモリ（バイト。取得できなければNone）"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux はキロバイト、macOS はバイト
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class SimulatedSession:
+    """1人の利用者の操作（AppTest の1セッション）。操作ごとに (名前, 秒, 待ち時間の秒, エラー) を記録する"""
+
+    def __init__(self, index, organisation, months, timeout, with_pdf, think_time, seed):
+        from streamlit.testing.v1 import AppTest
+
+        self.index = index
+        self.organisation = organisation
+        self.months = months
+        self.with_pdf = with_pdf
+        self.think_time = think_time
+        self.rng = random.Random(seed * 1000 + index)
+        self.app = AppTest.from_file(MAIN_SCRIPT, default_timeout=timeout)
+        self.records = []
+
+    def _interact(self, name, action):
+        """action（要素の操作と再実行）の所要時間を記録する
+
+        AppTest は再実行のたびにStreamlitのランタイム（プロセスで1つ）を差し替えるため、
+        同じプロセスの再実行は _RUN_LOCK で1つずつ行い、ロックを待った時間も所要時間に含める。
+        """
+        started = time.perf_counter()
+        error = None
+        with _RUN_LOCK:
+            acquired = time.perf_counter()
+            try:
+                action()
+                if self.app.exception:
+                    error = self.app.exception[0].value
+            except Exception as e:
+                error = f'{type(e).__name__}: {e}'
+        self.records.append((name, time.perf_counter() - started, acquired - started, error))
+        if self.think_time:
+            time.sleep(self.rng.uniform(0, self.think_time))
+        return error is None
+
+    def _sidebar(self, kind, label):
+        elements = [element for element in getattr(self.app.sidebar, kind) if element.label == label]
+        if not elements:
+            raise LookupError(f'{label} が見つかりません')
+        return elements[0]
+
+    def open(self):
+        return self._interact('open', self.app.run)
+
+    def select_period(self):
+        month = self.rng.choice(self.months)
+        self._interact('select_period', lambda: self.app.selectbox(key='month_selector').set_value(month).run())
+
+    def edit_shift(self, repeat=False):
+        """従業員・日付・種類を選んで保存する（repeat=True なら繰り返し登録で日付を切り替えてから保存する）"""
+        area = self.rng.choice([area for area, employees in self.organisation.employee_areas.items() if employees])
+        employee = self.rng.choice(self.organisation.employee_areas[area])
+        if not self._interact('select_employee', lambda: (
+                self.app.selectbox(key='employee_area_selector').set_value(area).run(),
+                self._sidebar('selectbox', '従業員を選択').set_value(employee).run())):
+            return
+        offset = self.rng.random()
+        self._interact('select_date', lambda: self._select_date(offset))
+        shift = self.rng.choice(SHIFT_CHOICES)
+        self._interact('select_shift_type', lambda: self._sidebar('selectbox', '種類').set_value(shift).run())
+        if repeat:
+            if not self._interact('toggle_repeat', lambda: self._sidebar('checkbox', '繰り返し登録をする').check().run()):
+                return
+            dates = [checkbox.key for checkbox in self.app.sidebar.checkbox
+                     if checkbox.key and checkbox.key.startswith('date_checkbox_')]
+            for key in self.rng.sample(dates, min(2, len(dates))):
+                self._interact('toggle_date', lambda key=key: self._toggle(key))
+        self._interact('save_shift', lambda: self._sidebar('button', '保存').click().run())
+        if repeat:
+            self._interact('toggle_repeat', lambda: self._sidebar('checkbox', '繰り返し登録をする').uncheck().run())
+
+    def _select_date(self, offset):
+        date_input = self._sidebar('date_input', '日付を選択')
+        date_input.set_value(date_input.min + (date_input.max - date_input.min) * offset).run()
+
+    def _toggle(self, key):
+        checkbox = self.app.checkbox(key=key)
+        checkbox.set_value(not checkbox.value).run()
+
+    def download_pdf(self):
+        self._interact('download_pdf', lambda: self._sidebar('button', 'PDFを生成').click().run())
+
+    def run(self, iterations):
+        for i in range(iterations):
+            self.select_period()
+            self.edit_shift(repeat=i % 2 == 1)
+            if self.with_pdf:
+                self.download_pdf()
+
+
+# AppTest の再実行をプロセスの中で1つずつ行うためのロック（SimulatedSession._interact を参照）
+_RUN_LOCK = threading.Lock()
+
+
+def summarize(records):
+    """操作ごとの回数・エラー数・分位点（ミリ秒）・ロックを待った時間の平均（ミリ秒）"""
+    by_name = {}
+    for name, seconds, waited, error in records:
+        timings, waits, errors = by_name.setdefault(name, ([], [], []))
+        timings.append(seconds)
+        waits.append(waited)
+        if error is not None:
+            errors.append(str(error))
+    summary = {}
+    for name, (timings, waits, errors) in by_name.items():
+        milliseconds = np.array(timings) * 1000
+        summary[name] = {
+            'count': len(timings),
+            'errors': len(errors),
+            **{f'p{p}': float(np.percentile(milliseconds, p)) for p in PERCENTILES},
+            'max': float(milliseconds.max()),
+            'mean_wait': float(np.mean(waits) * 1000),
+            'first_error': errors[0] if errors else None,
+        }
+    return summary
+
+
+def wait_for_write_queue(timeout):
+    """書き込みキューが空になるまで待ち、(待った秒数, キューの状態) を返す"""
+    from write_queue import write_queue
+
+    started = time.perf_counter()
+    while write_queue.stats()['depth'] and time.perf_counter() - started < timeout:
+        time.sleep(0.1)
+    return time.perf_counter() - started, write_queue.stats()
+
+
+def run_sessions(indices, months, iterations, timeout, think_time, ramp, with_pdf, seed):
+    """このプロセスで indices のセッションをスレッドで並行に動かし、操作の記録とメモリ・書き込みキューの状態を返す"""
+    from organisation import current_organisation
+
+    organisation = current_organisation()
+    # アプリのモジュールの読み込みと最初の期間の読み込みを済ませてから計測する
+    SimulatedSession(-1, organisation, months, timeout, False, 0, seed).open()
+    rss_before = rss_bytes()
+
+    sessions = [SimulatedSession(i, organisation, months, timeout, with_pdf, think_time, seed) for i in indices]
+    opened = threading.Barrier(len(sessions) + 1)
+
+    def run_session(session):
+        time.sleep(ramp * session.index / max(len(indices), 1))
+        try:
+            session.open()
+        finally:
+            opened.wait()
+        session.run(iterations)
+
+    threads = [threading.Thread(target=run_session, args=(session,), name=f'help2-loadtest-{session.index}')
+               for session in sessions]
+    for thread in threads:
+        thread.start()
+    opened.wait()
+    # 全セッションが画面を開いた時点のメモリ（セッションの状態と共有のキャッシュを含む）
+    rss_opened = rss_bytes()
+    for thread in threads:
+        thread.join()
+    drain_seconds, queue_stats = wait_for_write_queue(timeout)
+    return {
+        'records': [record for session in sessions for record in session.records],
+        'rss_before': rss_before,
+        'rss_opened': rss_opened,
+        'peak_rss': peak_rss_bytes(),
+        'drain_seconds': drain_seconds,
+        'write_queue': {name: queue_stats[name] for name in ('depth', 'flushed', 'conflicts', 'failures')},
+    }
+
+
+def _run_worker(arguments):
+    """別のプロセスで run_sessions を実行する（環境変数は親のプロセスから引き継ぐ）"""
+    import streamlit  # noqa: F401  ロガーを先に作成させてからレベルを変更する
+    logging.getLogger('streamlit.runtime.state.session_state_proxy').setLevel(logging.ERROR)
+    return run_sessions(*arguments)
+
+
+def run_load_test(sessions, iterations, employees, stores, periods, timeout, think_time, ramp, with_pdf,
+                  processes=1, seed=0):
+    year = datetime.now().year
+    months = list(range(1, periods + 1))
+    seed_database(employees, stores, year, months, seed)
+
+    processes = max(1, min(processes, sessions))
+    groups = [list(range(sessions))[i::processes] for i in range(processes)]
+    started = time.perf_counter()
+    if processes == 1:
+        results = [run_sessions(groups[0], months, iterations, timeout, think_time, ramp, with_pdf, seed)]
+    else:
+        import multiprocessing
+        # 親のプロセスのデータベースの接続・スレッドを引き継がないよう spawn で起動する
+        with multiprocessing.get_context('spawn').Pool(processes) as pool:
+            results = pool.map(_run_worker, [(group, months, iterations, timeout, think_time, ramp, with_pdf, seed)
+                                             for group in groups])
+    elapsed = time.perf_counter() - started
+
+    records = [record for result in results for record in result['records']]
+    memory_per_session = None
+    if all(result['rss_before'] is not None and result['rss_opened'] is not None for result in results):
+        memory_per_session = sum(max(result['rss_opened'] - result['rss_before'], 0) for result in results) / sessions
+    queue = {name: sum(result['write_queue'][name] for result in results)
+             for name in ('depth', 'flushed', 'conflicts', 'failures')}
+    return {
+        'sessions': sessions,
+        'processes': processes,
+        'iterations': iterations,
+        'employees': employees,
+        'stores': stores,
+        'elapsed_seconds': elapsed,
+        'interactions': len(records),
+        'throughput': len(records) / elapsed if elapsed else 0.0,
+        'memory': {'before_bytes': max(result['rss_before'] or 0 for result in results) or None,
+                   'opened_bytes': max(result['rss_opened'] or 0 for result in results) or None,
+                   'per_session_bytes': memory_per_session,
+                   'peak_bytes': max(result['peak_rss'] for result in results)},
+        'write_queue': {'drain_seconds': max(result['drain_seconds'] for result in results), **queue},
+        'summary': summarize(records),
+    }
+
+
+def _mb(value):
+    return '-' if value is None else f'{value / 1024 / 1024:.1f} MB'
+
+
+def print_report(result):
+    print(f"セッション数 {result['sessions']}（{result['processes']} プロセス）、1セッションあたり {result['iterations']} 回、"
+          f"従業員 {result['employees']} 人・店舗 {result['stores']} 店、所要時間 {result['elapsed_seconds']:.1f} 秒")
+    print(f"{'操作':<20}{'回数':>6}{'エラー':>6}" + ''.join(f'{f"p{p}(ms)":>11}' for p in PERCENTILES) + f"{'最大(ms)':>11}{'待ち(ms)':>11}")
+    for name, row in result['summary'].items():
+        print(f"{name:<20}{row['count']:>6}{row['errors']:>6}" + ''.join(f"{row[f'p{p}']:>11.1f}" for p in PERCENTILES)
+              + f"{row['max']:>11.1f}{row['mean_wait']:>11.1f}")
+    print(f"スループット: {result['throughput']:.2f} 操作/秒（{result['interactions']} 操作）")
+    memory = result['memory']
+    print(f"メモリ: 開始時 {_mb(memory['before_bytes'])}、全セッション表示後 {_mb(memory['opened_bytes'])}"
+          f"（1セッションあたり {_mb(memory['per_session_bytes'])}）、最大 {_mb(memory['peak_bytes'])}")
+    queue = result['write_queue']
+    print(f"書き込みキュー: 送信 {queue['flushed']} 件、競合 {queue['conflicts']} 件、失敗 {queue['failures']} 件、"
+          f"未送信 {queue['depth']} 件（終了後 {queue['drain_seconds']:.1f} 秒待機）")
+    for name, row in result['summary'].items():
+        if row['first_error']:
+            print(f"  {name} のエラー（最初の1件）: {row['first_error']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='複数セッションの負荷試験（AppTest・SQLite）')
+    parser.add_argument('--sessions', type=int, default=10, help='同時に動かすセッション数')
+    parser.add_argument('--iterations', type=int, default=3, help='1セッションあたりの操作の繰り返し回数')
+    parser.add_argument('--employees', type=int, default=21, help='従業員数')
+    parser.add_argument('--stores', type=int, default=27, help='店舗数')
+    parser.add_argument('--periods', type=int, default=3, help='データを登録する期間数（今年の1月から）')
+    parser.add_argument('--timeout', type=float, default=120, help='1回の再実行のタイムアウト（秒）')
+    parser.add_argument('--think-time', type=float, default=0, help='操作の間に待つ最大秒数（利用者の操作間隔）')
+    parser.add_argument('--ramp', type=float, default=0, help='全セッションを開き終えるまでの秒数')
+    parser.add_argument('--processes', type=int, default=1, help='セッションを分けて動かすプロセス数')
+    parser.add_argument('--no-pdf', action='store_true', help='PDFのダウンロードを省略する')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='結果をJSONで保存するパス')
+    args = parser.parse_args(argv)
+
+    with_pdf = not args.no_pdf and all(os.path.exists(font) for font in FONT_FILES)
+    if not args.no_pdf and not with_pdf:
+        print(f"フォントファイル（{', '.join(FONT_FILES)}）が見つからないため、PDFのダウンロードを省略します", file=sys.stderr)
+
+    with tempfile.TemporaryDirectory(prefix='help2-loadtest-') as directory:
+        prepare_environment(directory)
+        # スクリプト実行時のセッション状態に関する警告を抑制
+        import streamlit  # noqa: F401  ロガーを先に作成させてからレベルを変更する
+        logging.getLogger('streamlit.runtime.state.session_state_proxy').setLevel(logging.ERROR)
+        result = run_load_test(args.sessions, args.iterations, args.employees, args.stores, args.periods,
+                               args.timeout, args.think_time, args.ramp, with_pdf, args.processes, args.seed)
+
+    print_report(result)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f'結果を保存しました: {args.json}')
+    return 1 if any(row['errors'] for row in result['summary'].values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,175 @@
+"""主要処理のベンチマーク
+
+使い方（リポジトリ直下で実行）:
+    python -m benchmarks.run                       # 実行して基準値と比較
+    python -m benchmarks.run --save-baseline       # 基準値を保存
+    python -m benchmarks.run --employees 21 100 200 --stores 27 50
+    python -m benchmarks.run --imports             # インポート時間も計測
+
+基準値（benchmarks/baseline.json）は既定の規模で --save-baseline により作成したもの（PDF生成はフォントがないため含まない）。
+時間は実行するマシンに依存するため、別のマシンで比較する場合は先に変更前のコードで --save-baseline を実行して作り直す。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import statistics
+from benchmarks.synthetic import make_organisation, generate_period, use_organisation
+from benchmarks.import_time import measure_import_times
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+FONT_FILES = ['NotoSansJP-VariableFont_wght.ttf', 'NotoSansJP-Bold.ttf']
+YEAR, MONTH = 2024, 4
+
+
+def measure(func, repeat):
+    """funcをrepeat回実行し、各回の秒数を返す"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def build_cases(shifts, help_requests, organisation):
+    """(名前, 実行する関数)の一覧を作成"""
+    from utils import parse_shift, format_shifts, calculate_shift_count
+    from write_queue import WriteQueue
+    from period import build_shift_frame, build_store_pdf_data
+    from assignment import solve_help_assignment
+    from intervals import ShiftIntervalIndex
+    from fulfilment import fulfilment_report, fulfilment_styles
+    from period import get_period_range, KIND_SHIFTS
+    from period_range import employee_range_summary, store_range_summary, fiscal_year_range
+    from constants import WEEKDAY_JA
+
+    cells = shifts.values.ravel().tolist()
+    shift_data = build_shift_frame(shifts, YEAR, MONTH)
+
+    help_table = help_requests.copy()
+    help_table['日付'] = help_table.index.strftime('%Y-%m-%d')
+    help_table['曜日'] = help_table.index.strftime('%a').map(WEEKDAY_JA)
+    help_table = help_table.reset_index(drop=True)
+
+    # 全セル分の未反映の編集のうち、書き込みキューに残っているもの（半分）を確認する場合
+    overlay = {(date, employee): shift_data.at[date, employee] for date in shift_data.index for employee in organisation.employees}
+    queue = WriteQueue(':memory:')
+    queue.enqueue_shifts([(date, employee, shift, None) for (date, employee), shift in list(overlay.items())[::2]])
+
+    # 年度（12期間）の集計は、生成した1期間分を各期間の日付にずらして読み込ませる
+    period_start, _ = get_period_range(YEAR, MONTH)
+
+    def load_shifted(kind, year, month):
+        frame = shift_data if kind == KIND_SHIFTS else help_requests
+        return frame.set_axis(frame.index + (get_period_range(year, month)[0] - period_start))
+
+    cases = [
+        ('parse_shift', lambda: [parse_shift(cell) for cell in cells]),
+        ('format_shifts', lambda: [format_shifts(cell) for cell in cells]),
+        ('calculate_shift_count', lambda: calculate_shift_count(shift_data)),
+        # ヘルプ希望の表の色分け（時間帯の索引の作成から）
+        ('fulfilment_report', lambda: fulfilment_styles(help_table, fulfilment_report(help_requests, ShiftIntervalIndex(shift_data), organisation.areas))),
+        ('pending_shifts', lambda: queue.pending_shifts(list(overlay))),
+        ('employee_range_summary', lambda: employee_range_summary(load_shifted, *fiscal_year_range(YEAR), organisation.employee_areas)),
+        ('store_range_summary', lambda: store_range_summary(load_shifted, *fiscal_year_range(YEAR), organisation.areas)),
+        ('solve_help_assignment', lambda: solve_help_assignment(shift_data, help_requests, organisation.employee_areas, organisation.areas)),
+    ]
+
+    if all(os.path.exists(font) for font in FONT_FILES):
+        from pdf_generator import generate_help_table_pdf, generate_individual_pdf, generate_store_pdf
+        # 画面と同じくエリア単位でヘルプ表を作成（最も人数の多いエリア）
+        area = max(organisation.employee_areas, key=lambda a: len(organisation.employee_areas[a]))
+        employee = organisation.employees[0]
+        store = organisation.stores[0]
+        store_data = build_store_pdf_data(shift_data, help_requests, store, YEAR, MONTH)
+        cases += [
+            ('generate_help_table_pdf', lambda: generate_help_table_pdf(shift_data[organisation.employee_areas[area]], YEAR, MONTH, area)),
+            ('generate_individual_pdf', lambda: generate_individual_pdf(shift_data[employee], employee, YEAR, MONTH)),
+            ('generate_store_pdf', lambda: generate_store_pdf(store_data, store, YEAR, MONTH)),
+        ]
+    else:
+        print(f"フォントファイル（{', '.join(FONT_FILES)}）が見つからないため、PDF生成のベンチマークを省略します", file=sys.stderr)
+    return cases
+
+
+def run_benchmarks(employee_counts, store_counts, repeat, seed=0):
+    """各規模でベンチマークを実行し、{名前: 中央値(秒)} を返す"""
+    results = {}
+    for n_employees in employee_counts:
+        for n_stores in store_counts:
+            organisation = make_organisation(n_employees, n_stores)
+            shifts, help_requests = generate_period(YEAR, MONTH, organisation, seed=seed)
+            with use_organisation(organisation):
+                for name, func in build_cases(shifts, help_requests, organisation):
+                    key = f'{name}[{n_employees}x{n_stores}]'
+                    try:
+                        timings = measure(func, repeat)
+                    except Exception as e:
+                        print(f'{key:<50} 失敗: {type(e).__name__}: {str(e)[:80]}')
+                        continue
+                    results[key] = statistics.median(timings)
+                    print(f'{key:<50} 中央値 {results[key] * 1000:9.2f} ms  最小 {min(timings) * 1000:9.2f} ms')
+    return results
+
+
+def compare_with_baseline(results, baseline, threshold):
+    """基準値よりthreshold以上遅くなった項目を返す"""
+    regressions = []
+    for key, value in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        ratio = value / base if base > 0 else float('inf')
+        if ratio > 1 + threshold:
+            regressions.append((key, base, value, ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='主要処理のベンチマーク')
+    parser.add_argument('--employees', type=int, nargs='+', default=[21, 100, 200], help='従業員数（複数指定可）')
+    parser.add_argument('--stores', type=int, nargs='+', default=[27, 50], help='店舗数（複数指定可）')
+    parser.add_argument('--repeat', type=int, default=5, help='各ベンチマークの実行回数')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='基準値ファイルのパス')
+    parser.add_argument('--save-baseline', action='store_true', help='今回の結果を基準値として保存')
+    parser.add_argument('--imports', action='store_true', help='モジュールのインポート時間も計測')
+    parser.add_argument('--threshold', type=float, default=0.25, help='遅くなったと判定する割合（0.25 = 25%%）')
+    args = parser.parse_args(argv)
+
+    # スクリプト実行時のセッション状態に関する警告を抑制
+    import streamlit  # noqa: F401  ロガーを先に作成させてからレベルを変更する
+    logging.getLogger('streamlit.runtime.state.session_state_proxy').setLevel(logging.ERROR)
+
+    results = run_benchmarks(args.employees, args.stores, args.repeat, args.seed)
+    if args.imports:
+        results.update(measure_import_times(repeat=args.repeat))
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f'基準値を保存しました: {args.baseline}')
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f'基準値ファイルがありません（--save-baseline で作成）: {args.baseline}')
+        return 0
+
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare_with_baseline(results, baseline, args.threshold)
+    if not regressions:
+        print('基準値からの性能低下はありません')
+        return 0
+
+    print('基準値より遅くなった項目:')
+    for key, base, value, ratio in regressions:
+        print(f'  {key:<50} {base * 1000:9.2f} ms -> {value * 1000:9.2f} ms ({ratio:.2f}倍)')
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
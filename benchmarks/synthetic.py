@@ -0,0 +1,104 @@
+"""ベンチマーク用の合成データ生成"""
+import random
+import pandas as pd
+from constants import AREAS, EMPLOYEE_AREAS, STORE_COLORS
+from organisation import Organisation, organisation_loader
+from period import get_period_range
+
+# シフトの種類ごとの出現比率（既定値）
+DEFAULT_SHIFT_MIX = {
+    '-': 0.30,
+    '休み': 0.15,
+    'AM可': 0.10,
+    'PM可': 0.10,
+    '1日可': 0.15,
+    'multi': 0.08,   # 複数店舗（例: 1日可,9-12@本店,13-18@武店）
+    'その他': 0.07,
+    'special': 0.05,  # 鹿屋・かご北・リクルート
+}
+
+HELP_TIMES = ['9-12', '13-18', '9-18', '10-15', '12半-17']
+
+
+def make_organisation(n_employees=21, n_stores=27):
+    """指定人数・店舗数の組織を作成（既存の名前を優先して使い、不足分を追加）"""
+    area_names = [area for area in AREAS.keys() if area != 'なし']
+
+    areas = {'なし': []}
+    real_stores = [(area, store) for area in area_names for store in AREAS[area]]
+    for i in range(n_stores):
+        if i < len(real_stores):
+            area, store = real_stores[i]
+        else:
+            area, store = area_names[i % len(area_names)], f'テスト店{i + 1:03d}'
+        areas.setdefault(area, []).append(store)
+
+    employee_areas = {}
+    real_employees = [(area, employee) for area, employees in EMPLOYEE_AREAS.items() for employee in employees]
+    employee_area_names = list(EMPLOYEE_AREAS.keys())
+    for i in range(n_employees):
+        if i < len(real_employees):
+            area, employee = real_employees[i]
+        else:
+            area, employee = employee_area_names[i % len(employee_area_names)], f'従業員{i + 1:03d}'
+        employee_areas.setdefault(area, []).append(employee)
+
+    return Organisation(employee_areas, areas, STORE_COLORS)
+
+
+def _random_time(rng):
+    start = rng.randint(8, 15)
+    end = rng.randint(start + 2, 20)
+    return f'{start}半-{end}' if rng.random() < 0.2 else f'{start}-{end}'
+
+
+def _random_shift(rng, stores, mix):
+    kind = rng.choices(list(mix.keys()), weights=list(mix.values()))[0]
+    if kind in ('-', '休み'):
+        return kind
+    if kind == 'special':
+        return rng.choice(['鹿屋', 'かご北', 'リクルート'])
+    if kind == 'その他':
+        content = rng.choice(['研修', '会議', '棚卸'])
+        if rng.random() < 0.5:
+            return f'その他,{content}'
+        return f'その他,{content},{_random_time(rng)}@{rng.choice(stores)}'
+    if kind == 'multi':
+        shift_type = rng.choice(['AM可', 'PM可', '1日可'])
+        parts = [f'{_random_time(rng)}@{store}' for store in rng.sample(stores, min(len(stores), rng.randint(2, 3)))]
+        return f"{shift_type},{','.join(parts)}"
+    # AM可/PM可/1日可 は半分を店舗割り当て済みにする
+    if rng.random() < 0.5:
+        return kind
+    return f'{kind},{_random_time(rng)}@{rng.choice(stores)}'
+
+
+def generate_period(year, month, organisation, shift_mix=None, help_ratio=0.3, seed=0):
+    """get_shifts / get_store_help_requests と同じ形式の合成データを作成
+
+    Returns:
+        tuple: (シフトのピボット表, 店舗ヘルプ希望のピボット表)
+    """
+    rng = random.Random(seed)
+    mix = shift_mix or DEFAULT_SHIFT_MIX
+    start_date, end_date = get_period_range(year, month)
+    date_range = pd.date_range(start=start_date, end=end_date)
+
+    shifts = pd.DataFrame(
+        {employee: [_random_shift(rng, organisation.stores, mix) for _ in date_range] for employee in organisation.employees},
+        index=date_range,
+    )
+    shifts.index.name = 'date'
+    shifts.columns.name = 'employee'
+
+    help_requests = pd.DataFrame(
+        {store: [rng.choice(HELP_TIMES) if rng.random() < help_ratio else '-' for _ in date_range] for store in organisation.stores},
+        index=date_range,
+    )
+    help_requests.index.name = 'date'
+    return shifts, help_requests
+
+
+def use_organisation(organisation):
+    """ベンチマーク中だけ各モジュールが参照する組織構成を差し替える（データベースは参照しない）"""
+    return organisation_loader.override(organisation)
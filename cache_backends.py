@@ -0,0 +1,138 @@
+"""複数プロセス（Streamlitサーバーの複数台構成）で期間スナップショットを共有するキャッシュの保存先
+
+環境変数 HELP2_SHARED_CACHE で指定する:
+    sqlite:///path/to/cache.db   SQLiteファイル（同じホスト・共有ボリューム上のプロセス間で共有）
+    memory                       プロセス内の辞書（ローカル実行・動作確認用）
+    未指定                        共有しない
+キーの '/' より前はテナントの名前空間（既定のテナントは接頭辞なし）。保存するスナップショットは
+名前空間ごとに HELP2_SHARED_CACHE_MAX_PERIODS 件までとし、超えた分は保存時刻の古いものから削除する（0なら無制限）。
+"""
+import os
+import time
+import zlib
+import pickle
+import sqlite3
+import threading
+
+# 名前空間（テナント）ごとに共有キャッシュへ保存するスナップショットの上限
+SHARED_CACHE_MAX_ENTRIES = int(os.environ.get('HELP2_SHARED_CACHE_MAX_PERIODS', 96))
+
+
+def key_namespace(key):
+    """共有キャッシュのキーの名前空間（'/' より前。既定のテナントは空文字）"""
+    namespace, separator, _ = key.rpartition('/')
+    return namespace if separator else ''
+
+
+class MemoryBackend:
+    """プロセス内の辞書に保存する（外部のキー・バリューストアの代わり）"""
+
+    def __init__(self, max_entries=SHARED_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._snapshots = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def current_version(self, key):
+        with self._lock:
+            return self._versions.get(key, 0)
+
+    def bump_version(self, key):
+        with self._lock:
+            self._versions[key] = self._versions.get(key, 0) + 1
+            self._snapshots.pop(key, None)
+            return self._versions[key]
+
+    def get(self, key):
+        """(バージョン, 保存時刻, 値) を返す（なければNone）"""
+        with self._lock:
+            return self._snapshots.get(key)
+
+    def put(self, key, version, value):
+        with self._lock:
+            # 読み込み中に新しいバージョンになった場合は古いデータを保存しない
+            if version == self._versions.get(key, 0):
+                self._snapshots[key] = (version, time.time(), value)
+                self._evict(key_namespace(key))
+
+    def _evict(self, namespace):
+        """名前空間のスナップショットを max_entries 件までにする（self._lock を取得して呼ぶ）"""
+        keys = [key for key in self._snapshots if key_namespace(key) == namespace]
+        if not self.max_entries or len(keys) <= self.max_entries:
+            return
+        keys.sort(key=lambda key: self._snapshots[key][1])
+        for key in keys[:len(keys) - self.max_entries]:
+            del self._snapshots[key]
+
+
+class SQLiteBackend:
+    """SQLiteファイルに保存する（同じファイルを参照するプロセス間で共有される）"""
+
+    def __init__(self, path, max_entries=SHARED_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS snapshot_versions (key TEXT PRIMARY KEY, version INTEGER NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS snapshots (key TEXT PRIMARY KEY, version INTEGER NOT NULL, '
+                         'stored_at REAL NOT NULL, data BLOB NOT NULL)')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def current_version(self, key):
+        row = self._connection().execute('SELECT version FROM snapshot_versions WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else 0
+
+    def bump_version(self, key):
+        with self._connection() as conn:
+            conn.execute('INSERT INTO snapshot_versions (key, version) VALUES (?, 1) '
+                         'ON CONFLICT(key) DO UPDATE SET version = version + 1', (key,))
+            conn.execute('DELETE FROM snapshots WHERE key = ?', (key,))
+            return conn.execute('SELECT version FROM snapshot_versions WHERE key = ?', (key,)).fetchone()[0]
+
+    def get(self, key):
+        row = self._connection().execute('SELECT version, stored_at, data FROM snapshots WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        version, stored_at, data = row
+        return version, stored_at, pickle.loads(zlib.decompress(data))
+
+    def put(self, key, version, value):
+        data = sqlite3.Binary(zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)))
+        with self._connection() as conn:
+            # 読み込み中に新しいバージョンになった場合は古いデータを保存しない
+            conn.execute('INSERT INTO snapshots (key, version, stored_at, data) '
+                         'SELECT ?, ?, ?, ? WHERE ? = COALESCE((SELECT version FROM snapshot_versions WHERE key = ?), 0) '
+                         'ON CONFLICT(key) DO UPDATE SET version = excluded.version, stored_at = excluded.stored_at, data = excluded.data',
+                         (key, version, time.time(), data, version, key))
+            if self.max_entries:
+                self._evict(conn, key_namespace(key))
+
+    def _evict(self, conn, namespace):
+        """名前空間のスナップショットを max_entries 件まで（保存時刻の新しいものから）残す"""
+        if namespace:
+            condition, params = 'substr(key, 1, ?) = ?', (len(namespace) + 1, f'{namespace}/')
+        else:
+            condition, params = "instr(key, '/') = 0", ()
+        conn.execute(f'DELETE FROM snapshots WHERE key IN (SELECT key FROM snapshots WHERE {condition} '
+                     'ORDER BY stored_at DESC LIMIT -1 OFFSET ?)', params + (self.max_entries,))
+
+
+def create_backend(url=None):
+    """URLから共有キャッシュの保存先を作成する（未指定ならNone）"""
+    url = url if url is not None else os.environ.get('HELP2_SHARED_CACHE', '')
+    if not url:
+        return None
+    if url == 'memory':
+        return MemoryBackend()
+    if url.startswith('sqlite:///'):
+        return SQLiteBackend(url[len('sqlite:///'):])
+    raise ValueError(f'共有キャッシュの指定が正しくありません: {url}')
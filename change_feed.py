@@ -0,0 +1,122 @@
+"""保存した変更を開いている他のセッションへ通知する変更フィード
+
+保存を送信したプロセスが共有の表に反映してから (期間, 日付, 従業員/店舗) の変更イベントを発行し、
+同じプロセスの各セッションは購読しているイベントを受け取ってセッションの未反映の編集を整理する。
+現在の実装はプロセス内のブローカーのみのため、他のプロセスで送信された保存のイベントは届かない
+（その場合は共有キャッシュのバージョン・有効期限で期間を読み込み直す）。
+"""
+import os
+import uuid
+import threading
+import weakref
+from collections import deque
+from tenants import TenantScoped
+
+# 変更の種類
+CHANGE_SHIFT = 'shift'
+CHANGE_STORE_HELP = 'store_help'
+
+# 受け取られないまま溜まったイベントはこの件数を超えたら古いものから捨てる
+SUBSCRIPTION_MAX_EVENTS = int(os.environ.get('HELP2_CHANGE_FEED_MAX_EVENTS', 1000))
+
+
+class ChangeEvent:
+    """1セル分の変更（kind が shift なら key は従業員、store_help なら店舗）"""
+
+    def __init__(self, kind, year, month, date, key, value, version=None, source=None):
+        self.kind = kind
+        self.year = year
+        self.month = month
+        self.date = date
+        self.key = key
+        self.value = value
+        self.version = version
+        self.source = source
+
+    @property
+    def period(self):
+        return (self.year, self.month)
+
+    def __repr__(self):
+        return (f'ChangeEvent(kind={self.kind!r}, period={self.year}-{self.month:02d}, date={self.date}, '
+                f'key={self.key!r}, value={self.value!r}, version={self.version}, source={self.source!r})')
+
+
+class Subscription:
+    """セッションごとの購読（購読中の期間のイベントだけを受け取る）"""
+
+    def __init__(self, broker, periods=None, max_events=SUBSCRIPTION_MAX_EVENTS):
+        self.id = uuid.uuid4().hex
+        self._broker = broker
+        self._periods = set(periods or [])
+        self._events = deque(maxlen=max_events)
+        self._lock = threading.Lock()
+        self.dropped = False
+
+    def set_periods(self, periods):
+        with self._lock:
+            self._periods = set(periods)
+
+    def wants(self, event):
+        # 自分の保存のイベントも受け取る（バックグラウンドで送信された結果を画面に反映するため）
+        with self._lock:
+            return not self._periods or event.period in self._periods
+
+    def deliver(self, event):
+        with self._lock:
+            if len(self._events) == self._events.maxlen:
+                # 取りこぼした場合は期間全体を再読み込みさせる
+                self.dropped = True
+            self._events.append(event)
+
+    def pending(self):
+        with self._lock:
+            return len(self._events)
+
+    def drain(self):
+        """受け取ったイベントを古い順に返して空にする"""
+        with self._lock:
+            events = list(self._events)
+            self._events.clear()
+            return events
+
+    def close(self):
+        self._broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """同じプロセス内のセッション間でイベントを配信する"""
+
+    def __init__(self):
+        # セッションが終了して購読が参照されなくなったら自動的に外れる
+        self._subscriptions = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def subscribe(self, periods=None):
+        subscription = Subscription(self, periods)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            if subscription.wants(event):
+                subscription.deliver(event)
+
+
+def create_broker(url=None):
+    """変更フィードのブローカーを作成する（HELP2_CHANGE_FEED、既定はプロセス内）"""
+    url = url if url is not None else os.environ.get('HELP2_CHANGE_FEED', 'memory')
+    if url == 'memory':
+        return InProcessBroker()
+    raise ValueError(f'変更フィードの指定が正しくありません: {url}')
+
+
+# 変更フィードのシングルトンインスタンスを作成（テナントごと。他のテナントのセッションには通知しない）
+change_feed = TenantScoped(lambda tenant: create_broker())
@@ -0,0 +1,537 @@
+"""ヘルプ管理アプリのコマンドライン版（Streamlitを使わずにPDFを一括出力）
+
+使い方:
+    python cli.py export --year 2024 --month 4 --kind store --kind area --out ./pdf
+    python cli.py export --year 2024 --month 4 --kind individual --out ./pdf
+    python cli.py freeze --year 2024 --month 4
+    python cli.py assign --year 2024 --month 4 --save
+    python cli.py report --year 2024 --month 4 --by store --out report.csv
+    python cli.py import shifts.xlsx --kind shifts
+    python cli.py export-data --start 2024-04-16 --end 2024-07-15 --data shifts --layout long --format parquet --out shifts.parquet
+    python cli.py range-summary --fiscal-year 2024 --by employee --monthly --out employees.csv
+    python cli.py rollup-backfill --fiscal-year 2024
+    python cli.py rollup-report --fiscal-year 2023 --fiscal-year 2024 --by fiscal_year --by employee --by store --stores-only
+"""
+import os
+import sys
+import time
+import argparse
+import logging
+from datetime import datetime
+from organisation import current_organisation
+from tenants import TENANTS, default_tenant, use_tenant
+from resilience import DatabaseUnavailableError
+
+EXPORT_KINDS = ['store', 'individual', 'area']
+
+
+def _kind_targets(kind):
+    """種類ごとの出力対象（店舗名・従業員名・エリア名）の一覧を返す"""
+    organisation = current_organisation()
+    if kind == 'store':
+        return organisation.stores
+    if kind == 'individual':
+        return organisation.employees
+    return list(organisation.employee_areas.keys())
+
+
+def _export_targets(kinds, names):
+    """(種類, 対象)の一覧を返す（名前が指定された場合はそれに絞り込む）"""
+    targets = [(kind, target) for kind in kinds for target in _kind_targets(kind)]
+    if names:
+        unknown = [name for name in names if all(target != name for _, target in targets)]
+        if unknown:
+            raise ValueError(f"存在しない名前です: {', '.join(unknown)}")
+        targets = [(kind, target) for kind, target in targets if target in names]
+    return targets
+
+
+def _render(kind, target, period):
+    """1つのPDFを生成して(ファイル名, バイト列)を返す"""
+    # PDF関連の読み込みは実際に出力するときだけ行う
+    from pdf_generator import generate_help_table_pdf, generate_individual_pdf, generate_store_pdf
+    from period import build_store_pdf_data
+
+    year, month = period.year, period.month
+    if kind == 'store':
+        store_data = build_store_pdf_data(period.shifts, period.store_help_requests, target, year, month)
+        pdf = generate_store_pdf(store_data, target, year, month)
+        file_name = f'{month}月_{target}.pdf'
+    elif kind == 'individual':
+        pdf = generate_individual_pdf(period.shifts[target], target, year, month)
+        file_name = f'{target}さん_{period.start_date.strftime("%Y年%m月%d日")}～{period.end_date.strftime("%Y年%m月%d日")}_シフト.pdf'
+    else:
+        pdf = generate_help_table_pdf(period.shifts[current_organisation().employee_areas[target]], year, month, target)
+        file_name = f'{target}_{year}_{month}.pdf'
+    return file_name, pdf.getvalue()
+
+
+def export(args):
+    from database import db
+    from period import load_period
+
+    kinds = args.kind or EXPORT_KINDS
+    targets = _export_targets(kinds, args.name)
+    os.makedirs(args.out, exist_ok=True)
+
+    started = time.perf_counter()
+    period = load_period(db, args.year, args.month)
+    print(f'期間データ取得: {time.perf_counter() - started:.3f}秒')
+
+    failures = 0
+    for kind, target in targets:
+        render_started = time.perf_counter()
+        try:
+            file_name, data = _render(kind, target, period)
+        except Exception as e:
+            failures += 1
+            print(f'[{kind}] {target}: PDFの生成エラー: {e}', file=sys.stderr)
+            continue
+        with open(os.path.join(args.out, file_name), 'wb') as f:
+            f.write(data)
+        print(f'[{kind}] {file_name}: {time.perf_counter() - render_started:.3f}秒 ({len(data)} bytes)')
+
+    print(f'合計: {len(targets) - failures}/{len(targets)} 件, {time.perf_counter() - started:.3f}秒')
+    return 1 if failures else 0
+
+
+def _invalidate_period(year, month):
+    """期間のキャッシュを破棄する（共有キャッシュのバージョンを上げ、画面のプロセスに読み込み直させる）"""
+    from period import KIND_SHIFTS, KIND_HELP_REQUESTS
+    from period_cache import period_cache
+
+    for kind in (KIND_SHIFTS, KIND_HELP_REQUESTS):
+        period_cache.invalidate(kind, year, month)
+
+
+def freeze(args):
+    from database import db
+    from period import get_period_range, KIND_SHIFTS, KIND_HELP_REQUESTS
+    from period_cache import load_period_data
+    from frozen_periods import frozen_periods
+
+    _, end_date = get_period_range(args.year, args.month)
+    if end_date.date() >= datetime.now().date() and not args.force:
+        print(f'{args.year}年{args.month}月の期間はまだ終わっていないため固定できません（--force で固定できます）', file=sys.stderr)
+        return 1
+
+    started = time.perf_counter()
+    # 固定済みでもデータベースから取得し直して上書きする
+    snapshot = load_period_data(db, KIND_SHIFTS, args.year, args.month, use_frozen=False)
+    store_help_requests = load_period_data(db, KIND_HELP_REQUESTS, args.year, args.month, use_frozen=False)
+    manifest = frozen_periods.freeze(args.year, args.month, {KIND_SHIFTS: snapshot.frame, KIND_HELP_REQUESTS: store_help_requests})
+    _invalidate_period(args.year, args.month)
+    print(f"{args.year}年{args.month}月を固定しました: {manifest['rows']} ({time.perf_counter() - started:.3f}秒)")
+    return 0
+
+
+def unfreeze(args):
+    from frozen_periods import frozen_periods
+
+    if not frozen_periods.unfreeze(args.year, args.month):
+        print(f'{args.year}年{args.month}月は固定されていません', file=sys.stderr)
+        return 1
+    _invalidate_period(args.year, args.month)
+    print(f'{args.year}年{args.month}月の固定を解除しました')
+    return 0
+
+
+def list_frozen(args):
+    from frozen_periods import frozen_periods
+
+    for year, month in frozen_periods.frozen_periods():
+        manifest = frozen_periods.manifest(year, month) or {}
+        print(f"{year}-{month:02d}\t{manifest.get('frozen_at', '')}\t{manifest.get('rows', '')}")
+    return 0
+
+
+def check(args):
+    from database import db
+    from period import load_period
+    from intervals import ShiftIntervalIndex
+
+    period = load_period(db, args.year, args.month)
+    index = ShiftIntervalIndex(period.shifts)
+    overlaps = index.employee_overlaps()
+    coverage = index.store_coverage(period.store_help_requests)
+    coverage = coverage[coverage['status'] != 'OK']
+
+    print(f'従業員の時間帯の重複: {len(overlaps)} 件')
+    for row in overlaps.itertuples():
+        print(f'  {row.date:%Y-%m-%d} {row.employee}: {row.interval} と {row.overlaps_with}')
+    print(f'店舗ヘルプの過不足: {len(coverage)} 件')
+    for row in coverage.itertuples():
+        print(f'  {row.date:%Y-%m-%d} {row.store} [{row.status}] 希望: {row.help_time or "-"} 割り当て: {row.assigned or "-"}')
+    # 従業員の重複はデータの誤りなので終了コードで知らせる
+    return 1 if not overlaps.empty else 0
+
+
+def _update_rollups(rows):
+    """保存したシフトの従業員について、期間の集計を作り直す（期間はデータベースから読み込み直す）"""
+    from period_cache import period_of
+    from rollups import rollup_store
+
+    employees_by_period = {}
+    for row in rows:
+        employees_by_period.setdefault(period_of(row['date']), set()).add(row['employee'])
+    for (year, month), employees in employees_by_period.items():
+        rollup_store.update_period(year, month, _load_frame('shifts', year, month), sorted(employees))
+
+
+def assign(args):
+    from database import db
+    from period import KIND_SHIFTS, KIND_HELP_REQUESTS
+    from period_cache import load_period_data
+    from frozen_periods import frozen_periods
+    from assignment import solve_help_assignment
+
+    if args.save and frozen_periods.is_frozen(args.year, args.month):
+        print(f'{args.year}年{args.month}月は固定済みのため保存できません', file=sys.stderr)
+        return 1
+
+    started = time.perf_counter()
+    snapshot = load_period_data(db, KIND_SHIFTS, args.year, args.month)
+    store_help_requests = load_period_data(db, KIND_HELP_REQUESTS, args.year, args.month)
+    plan = solve_help_assignment(snapshot.frame, store_help_requests)
+    print(f'割り当て案: {len(plan.assignments)} 件 / 割り当てられない希望: {len(plan.unassigned)} 件'
+          f' ({time.perf_counter() - started:.3f}秒)')
+    for row in plan.to_frame().itertuples():
+        print(f'  {row.date:%Y-%m-%d} {row.store} {row.time}: {row.employee} ({row.shift})')
+    for row in plan.unassigned.itertuples():
+        print(f'  {row.date:%Y-%m-%d} {row.store} {row.time or row.help_time}: 割り当てなし（{row.reason}）')
+    if not args.save:
+        return 0
+
+    # 読み込んだときのバージョンを渡し、その後に更新されたセルは上書きしない
+    conflicts = 0
+    for row in plan.shift_rows():
+        result = db.save_shift_row(row['date'], row['employee'], row['shift'],
+                                   snapshot.expected_version(row['date'], row['employee']))
+        conflicts += bool(result.conflict)
+    _update_rollups(plan.shift_rows())
+    _invalidate_period(args.year, args.month)
+    print(f'{len(plan.shifts) - conflicts} 件のシフトを保存しました')
+    if conflicts:
+        print(f'{conflicts} 件は他のユーザーが先に更新したため保存していません', file=sys.stderr)
+        return 1
+    return 0
+
+
+def _write_csv(frame, out):
+    """表をBOM付きUTF-8のCSV（Excelでそのまま開ける）で out に、out が空なら標準出力に書き出す"""
+    data = frame.to_csv(index=False).encode('utf-8-sig')
+    if out:
+        with open(out, 'wb') as f:
+            f.write(data)
+        print(f'{out} に出力しました（{len(frame)} 行）')
+    else:
+        sys.stdout.write(data.decode('utf-8-sig'))
+    return 0
+
+
+def report(args):
+    from database import db
+    from period import KIND_SHIFTS, KIND_HELP_REQUESTS
+    from period_cache import load_period_data
+    from fulfilment import fulfilment_report, summarize_fulfilment, COLUMN_LABELS
+    from utils import label_columns
+
+    snapshot = load_period_data(db, KIND_SHIFTS, args.year, args.month)
+    store_help_requests = load_period_data(db, KIND_HELP_REQUESTS, args.year, args.month)
+    frame = fulfilment_report(store_help_requests, snapshot.interval_index())
+    if args.by != 'detail':
+        frame = summarize_fulfilment(frame, args.by)
+    return _write_csv(label_columns(frame, COLUMN_LABELS), args.out)
+
+
+def import_data(args):
+    from database import db
+    from period_cache import period_of
+    from frozen_periods import frozen_periods
+    from importer import import_file, IMPORT_SHIFTS
+
+    saved_shifts = []
+    saved_periods = set()
+
+    def save_shifts(rows):
+        # 保存したシフトは、後で期間の集計を作り直す
+        db.save_shifts(rows)
+        saved_shifts.extend(rows)
+        saved_periods.update(period_of(row['date']) for row in rows)
+
+    def save_store_help_requests(rows):
+        db.save_store_help_requests(rows)
+        saved_periods.update(period_of(row['date']) for row in rows)
+
+    save = None if args.dry_run else save_shifts if args.kind == IMPORT_SHIFTS else save_store_help_requests
+    started = time.perf_counter()
+    result = import_file(args.file, args.kind, save, skip_invalid=args.skip_invalid,
+                         is_frozen=lambda date: frozen_periods.is_frozen(*period_of(date)))
+    for issue in result.issues:
+        print(issue, file=sys.stderr)
+    if saved_shifts:
+        _update_rollups(saved_shifts)
+    # 保存した期間は、画面のプロセスに読み込み直させる
+    for year, month in sorted(saved_periods):
+        _invalidate_period(year, month)
+    if result.saved:
+        print(f'{result.imported} 件を取り込みました（{result.rows} 行, {time.perf_counter() - started:.3f}秒）')
+    elif args.dry_run:
+        print(f'取り込めるセル: {result.imported} 件 / エラー: {len(result.issues)} 件（保存していません）')
+    else:
+        print(f'エラーが {len(result.issues)} 件あるため取り込んでいません（--skip-invalid でエラーのあるセルを除いて取り込めます）',
+              file=sys.stderr)
+    return 0 if result.ok else 1
+
+
+def _date_range(args):
+    """--start/--end、--fiscal-year、--year/--month のいずれかから出力する日付の範囲を返す"""
+    from period import get_period_range
+    from period_range import fiscal_year_range
+
+    if args.start and args.end:
+        return args.start, args.end
+    if args.fiscal_year:
+        return fiscal_year_range(args.fiscal_year)
+    if args.year and args.month:
+        return get_period_range(args.year, args.month)
+    raise ValueError('--year と --month、--start と --end、または --fiscal-year を指定してください')
+
+
+def _load_frame(kind, year, month):
+    """期間の表を1つ読み込む（範囲の処理は期間ごとに呼び出し、読み込んだ表を保持しない）"""
+    from database import db
+    from period import KIND_SHIFTS
+    from period_cache import load_period_data
+
+    data = load_period_data(db, kind, year, month)
+    return data.frame if kind == KIND_SHIFTS else data
+
+
+def export_data(args):
+    from exporter import export_data as write_export
+
+    start_date, end_date = _date_range(args)
+    started = time.perf_counter()
+    rows = write_export(_load_frame, args.data, args.layout, args.format, args.out, start_date, end_date)
+    print(f'{args.out} に出力しました（{rows} 行, {time.perf_counter() - started:.3f}秒）')
+    return 0
+
+
+def range_summary(args):
+    from period_range import employee_range_summary, store_range_summary, COLUMN_LABELS
+    from utils import label_columns
+
+    start_date, end_date = _date_range(args)
+    if args.by == 'employee':
+        totals, monthly = employee_range_summary(_load_frame, start_date, end_date)
+        frame = totals.merge(monthly, on='employee') if args.monthly else totals
+    else:
+        frame = store_range_summary(_load_frame, start_date, end_date)
+    return _write_csv(label_columns(frame, COLUMN_LABELS), args.out)
+
+
+def rollup_backfill(args):
+    from period_range import periods_in_range
+    from rollups import rollup_store
+
+    start_date, end_date = _date_range(args)
+    periods = periods_in_range(start_date, end_date)
+    if args.missing_only:
+        periods = rollup_store.missing_periods(periods)
+    started = time.perf_counter()
+    for year, month in periods:
+        rows = rollup_store.update_period(year, month, _load_frame('shifts', year, month))
+        print(f'{year}年{month}月: {rows} 行')
+    print(f'{len(periods)} 期間の集計を作成しました（{time.perf_counter() - started:.3f}秒）')
+    return 0
+
+
+def rollup_report(args):
+    from period_range import fiscal_year_range
+    from period_cache import period_of
+    from rollups import rollup_store, COLUMN_LABELS
+    from utils import label_columns
+
+    start = end = None
+    if args.fiscal_year:
+        start = period_of(fiscal_year_range(min(args.fiscal_year))[0])
+        end = period_of(fiscal_year_range(max(args.fiscal_year))[1])
+    by = args.by or ['fiscal_year', 'employee']
+    frame = rollup_store.query(by, start, end, stores_only=args.stores_only)
+    if args.fiscal_year and 'fiscal_year' in by:
+        frame = frame[frame['fiscal_year'].isin(args.fiscal_year)]
+    return _write_csv(label_columns(frame, COLUMN_LABELS), args.out)
+
+
+def org_seed(args):
+    from database import db
+    from organisation import DEFAULT_ORGANISATION
+
+    employee_rows, _ = db.get_organisation()
+    if employee_rows and not args.force:
+        raise ValueError('従業員・店舗が登録済みです（上書きする場合は --force）')
+    db.save_organisation(DEFAULT_ORGANISATION.employee_rows(), DEFAULT_ORGANISATION.store_rows())
+    print(f'constants.py の従業員 {len(DEFAULT_ORGANISATION.employees)} 人・店舗 {len(DEFAULT_ORGANISATION.stores)} 店を登録しました')
+    return 0
+
+
+def org_import(args):
+    import pandas as pd
+    from database import db
+    from organisation import organisation_from_lists
+
+    # 画面の「従業員・店舗の管理」と同じ列（エリア・従業員 / エリア・店舗・色）のCSV
+    employees = pd.read_csv(args.employees, encoding='utf-8-sig', dtype=str).fillna('')
+    stores = pd.read_csv(args.stores, encoding='utf-8-sig', dtype=str).fillna('').reindex(columns=['エリア', '店舗', '色'], fill_value='')
+    organisation = organisation_from_lists(employees[['エリア', '従業員']].itertuples(index=False, name=None),
+                                           stores.itertuples(index=False, name=None))
+    db.save_organisation(organisation.employee_rows(), organisation.store_rows())
+    print(f'従業員 {len(organisation.employees)} 人・店舗 {len(organisation.stores)} 店を登録しました（バージョン {organisation.version}）')
+    return 0
+
+
+def org_list(args):
+    organisation = current_organisation()
+    print(f'バージョン {organisation.version}')
+    for area, employees in organisation.employee_areas.items():
+        print(f"{area}: {', '.join(employees)}")
+    for area, stores in organisation.areas.items():
+        if stores:
+            print(f"{area}: {', '.join(f'{store}({organisation.store_color(store)})' for store in stores)}")
+    return 0
+
+
+def list_tenants(args):
+    from database import tenant_database_url
+
+    for tenant in TENANTS.values():
+        url = tenant_database_url(tenant)
+        database = url if url else f"Supabase（スキーマ {tenant.schema or 'public'}）"
+        print(f'{tenant.id}\t{tenant.name}\t{database}')
+    return 0
+
+
+def _add_range_arguments(parser):
+    parser.add_argument('--year', type=int)
+    parser.add_argument('--month', type=int, choices=range(1, 13), metavar='MONTH')
+    parser.add_argument('--start', help='開始日（YYYY-MM-DD、--end と組み合わせて期間の代わりに指定）')
+    parser.add_argument('--end', help='終了日（YYYY-MM-DD）')
+    parser.add_argument('--fiscal-year', type=int, help='年度（4月16日～翌年4月15日）を指定')
+
+
+def _add_period_arguments(parser):
+    parser.add_argument('--year', type=int, required=True)
+    parser.add_argument('--month', type=int, required=True, choices=range(1, 13), metavar='MONTH')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='help2', description='ヘルプ管理アプリのコマンドライン版')
+    parser.add_argument('--tenant', help='対象のテナント（地域）のID（既定は HELP2_TENANT・設定ファイルの最初のテナント）')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help='期間のPDFを一括出力')
+    _add_period_arguments(export_parser)
+    export_parser.add_argument('--kind', action='append', choices=EXPORT_KINDS,
+                               help='出力するPDFの種類（複数指定可、省略時はすべて）')
+    export_parser.add_argument('--name', action='append',
+                               help='出力対象の店舗名・従業員名・エリア名（複数指定可、省略時はすべて）')
+    export_parser.add_argument('--out', required=True, help='出力先ディレクトリ')
+    export_parser.set_defaults(func=export)
+
+    freeze_parser = subparsers.add_parser('freeze', help='確定済みの期間をファイルに固定（以降はデータベースに問い合わせない）')
+    _add_period_arguments(freeze_parser)
+    freeze_parser.add_argument('--force', action='store_true', help='終わっていない期間も固定する')
+    freeze_parser.set_defaults(func=freeze)
+
+    unfreeze_parser = subparsers.add_parser('unfreeze', help='期間の固定を解除')
+    _add_period_arguments(unfreeze_parser)
+    unfreeze_parser.set_defaults(func=unfreeze)
+
+    check_parser = subparsers.add_parser('check', help='シフトの重複・店舗ヘルプの過不足を一覧表示')
+    _add_period_arguments(check_parser)
+    check_parser.set_defaults(func=check)
+
+    assign_parser = subparsers.add_parser('assign', help='店舗ヘルプ希望への割り当て案を作成')
+    _add_period_arguments(assign_parser)
+    assign_parser.add_argument('--save', action='store_true', help='割り当て案をシフトとして保存する')
+    assign_parser.set_defaults(func=assign)
+
+    report_parser = subparsers.add_parser('report', help='店舗ヘルプ希望の充足状況をCSVで出力')
+    _add_period_arguments(report_parser)
+    report_parser.add_argument('--by', choices=['detail', 'area', 'store', 'date'], default='detail',
+                               help='集計単位（detail は希望ごとの明細）')
+    report_parser.add_argument('--out', help='出力先のCSVファイル（省略時は標準出力）')
+    report_parser.set_defaults(func=report)
+
+    import_parser = subparsers.add_parser('import', help='CSV/Excelからシフト・店舗ヘルプ希望を一括取り込み')
+    import_parser.add_argument('file', help='CSV または Excel（.xlsx）ファイル')
+    import_parser.add_argument('--kind', choices=['shifts', 'help_requests'], required=True, help='取り込む内容')
+    import_parser.add_argument('--skip-invalid', action='store_true', help='エラーのあるセルを除いて取り込む')
+    import_parser.add_argument('--dry-run', action='store_true', help='検証だけ行い保存しない')
+    import_parser.set_defaults(func=import_data)
+
+    export_data_parser = subparsers.add_parser('export-data', help='シフト・店舗ヘルプ希望をCSV/Excel/Parquetで出力')
+    _add_range_arguments(export_data_parser)
+    export_data_parser.add_argument('--data', choices=['shifts', 'store_help_requests'], default='shifts', help='出力する内容')
+    export_data_parser.add_argument('--layout', choices=['long', 'pivot'], default='long', help='縦持ち（1行1セル）または横持ち（日付×従業員/店舗）')
+    export_data_parser.add_argument('--format', choices=['csv', 'xlsx', 'parquet'], default='csv')
+    export_data_parser.add_argument('--out', required=True, help='出力先のファイル')
+    export_data_parser.set_defaults(func=export_data)
+
+    range_summary_parser = subparsers.add_parser('range-summary', help='期間をまたぐ範囲（四半期・年度など）の従業員別・店舗別の集計をCSVで出力')
+    _add_range_arguments(range_summary_parser)
+    range_summary_parser.add_argument('--by', choices=['employee', 'store'], default='employee', help='集計単位')
+    range_summary_parser.add_argument('--monthly', action='store_true', help='従業員別の集計に期間ごとの出勤日数の列を追加')
+    range_summary_parser.add_argument('--out', help='出力先のCSVファイル（省略時は標準出力）')
+    range_summary_parser.set_defaults(func=range_summary)
+
+    rollup_backfill_parser = subparsers.add_parser('rollup-backfill', help='過去の期間の集計（期間×従業員×店舗×種類）を作成')
+    _add_range_arguments(rollup_backfill_parser)
+    rollup_backfill_parser.add_argument('--missing-only', action='store_true', help='集計がない・作り直しが必要な期間だけ作成')
+    rollup_backfill_parser.set_defaults(func=rollup_backfill)
+
+    rollup_report_parser = subparsers.add_parser('rollup-report', help='集計済みの日数・時間・回数をCSVで出力')
+    rollup_report_parser.add_argument('--fiscal-year', type=int, action='append', help='年度（複数指定可）')
+    rollup_report_parser.add_argument('--by', action='append', choices=['fiscal_year', 'year', 'month', 'employee', 'store', 'shift_type'],
+                                      help='集計単位（複数指定可。省略時は fiscal_year と employee）')
+    rollup_report_parser.add_argument('--stores-only', action='store_true', help='店舗に入ったシフト（ヘルプ）だけを集計')
+    rollup_report_parser.add_argument('--out', help='出力先のCSVファイル（省略時は標準出力）')
+    rollup_report_parser.set_defaults(func=rollup_report)
+
+    org_seed_parser = subparsers.add_parser('org-seed', help='constants.py の従業員・店舗をデータベースに登録')
+    org_seed_parser.add_argument('--force', action='store_true', help='登録済みでも上書きする')
+    org_seed_parser.set_defaults(func=org_seed)
+
+    org_import_parser = subparsers.add_parser('org-import', help='CSVの従業員・店舗の一覧でデータベースの内容を置き換える')
+    org_import_parser.add_argument('--employees', required=True, help='エリア・従業員の列のCSV')
+    org_import_parser.add_argument('--stores', required=True, help='エリア・店舗・色の列のCSV')
+    org_import_parser.set_defaults(func=org_import)
+
+    org_list_parser = subparsers.add_parser('org-list', help='現在の従業員・店舗の一覧')
+    org_list_parser.set_defaults(func=org_list)
+
+    tenants_parser = subparsers.add_parser('tenants', help='テナント（地域）の一覧')
+    tenants_parser.set_defaults(func=list_tenants)
+
+    frozen_parser = subparsers.add_parser('frozen', help='固定済みの期間の一覧')
+    frozen_parser.set_defaults(func=list_frozen)
+    return parser
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s %(name)s: %(message)s')
+    args = build_parser().parse_args(argv)
+    try:
+        with use_tenant(args.tenant or default_tenant()):
+            return args.func(args)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    except DatabaseUnavailableError as e:
+        print(f'データベースに接続できません: {e}', file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,3 +1,4 @@
+# 従業員・店舗・店舗の色の初期値（データベースに登録がない場合に使う。実際の一覧は organisation.current_organisation() で参照する）
 EMPLOYEE_AREAS = {
     '中央エリア': ['大塚', '和田', '新門', '大田', '山下', '大久保(祐)','石崎', '栗原', '石田', '米山'],
     '北エリア': ['大久保(あ)','小山'],
@@ -18,6 +19,8 @@ AREAS = {
 }
 
 SHIFT_TYPES = ['AM可', 'PM可', '1日可', '時間指定', '-', '休み', '鹿屋', 'かご北', 'リクルート', 'その他']
+# シフト登録画面で選べる種類（CSV/Excelの取り込みもこの種類で検証する）
+EDITABLE_SHIFT_TYPES = [shift_type for shift_type in SHIFT_TYPES if shift_type != '時間指定']
 
 STORE_COLORS = {
     # 中央エリア
@@ -59,6 +62,7 @@ STORE_COLORS = {
 
 WEEKDAY_JA = {'Mon': '月', 'Tue': '火', 'Wed': '水', 'Thu': '木', 'Fri': '金', 'Sat': '土', 'Sun': '日'}
 FILLED_HELP_BG_COLOR = 'background-color: #D9D9D9'
+PARTIAL_HELP_BG_COLOR = 'background-color: #FFF2CC'  # 一部だけ埋まっているヘルプ希望
 SATURDAY_BG_COLOR = '#E6F2FF'  # 薄い青色
 SUNDAY_BG_COLOR = '#FFE6E6'    # 薄い赤色
 HOLIDAY_BG_COLOR = '#FFE6E6'  # 休み用の背景色
@@ -66,4 +70,7 @@ KANOYA_BG_COLOR = "#C0FF80"   # 鹿屋用の背景色
 KAGOKITA_BG_COLOR = "#C0FF80" # かご北用の背景色
 RECRUIT_BG_COLOR = "#c2a5ff" # かご北用の背景色
 DARK_GREY_TEXT_COLOR = "#666666"
-SPECIAL_SHIFT_TYPES = ['休み', '鹿屋', 'かご北','リクルート', 'その他']
\ No newline at end of file
+SPECIAL_SHIFT_TYPES = ['休み', '鹿屋', 'かご北','リクルート', 'その他']
+
+# PDFのレイアウトを変更した場合は更新する（PDFキャッシュのキーに含まれる）
+PDF_TEMPLATE_VERSION = 1
\ No newline at end of file
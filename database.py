@@ -1,17 +1,79 @@
 import os
+import sys
+import logging
+import threading
 from datetime import datetime
 import pandas as pd
-from supabase import create_client, Client
-import streamlit as st
-from constants import AREAS
-from dotenv import load_dotenv
+from profiling import timed_function
+from resilience import CircuitBreaker, DatabaseUnavailableError, call_with_retry, DB_TIMEOUT, DB_RETRIES
+from tenants import TenantScoped
 
-# ローカル環境の場合のみ.envファイルを読み込む
-if not os.environ.get('STREAMLIT_CLOUD'):
-    load_dotenv()
+logger = logging.getLogger(__name__)
+
+# 日付ごとに集計済みのビュー（migrations/002_period_views.sql）から期間データを取得する
+PERIOD_VIEWS = os.environ.get('HELP2_PERIOD_VIEWS', '') == '1'
+# 従業員・店舗のマスタをテーブル（migrations/003_organisation.sql）から読み込む
+ORGANISATION_TABLES = os.environ.get('HELP2_ORGANISATION_TABLES', '') == '1'
+
+def show_error(message):
+    """Streamlitから実行されている場合は画面に、CLIなどではログに出力"""
+    st = sys.modules.get('streamlit')
+    if st is not None:
+        st.error(message)
+    else:
+        logger.error(message)
+
+class SaveResult:
+    """保存結果（真偽値として評価すると保存できたかどうか）
+
+    conflict が True の場合は他のユーザーが先に更新しており、row に最新の行が入る。
+    """
+
+    def __init__(self, ok, conflict=False, row=None):
+        self.ok = ok
+        self.conflict = conflict
+        self.row = row
+
+    def __bool__(self):
+        return self.ok
+
+    def __repr__(self):
+        return f'SaveResult(ok={self.ok}, conflict={self.conflict}, row={self.row})'
 
 class SupabaseDB:
-    def __init__(self):
+    def __init__(self, schema=None):
+        # テナントごとのスキーマ（Noneなら public）
+        self.schema = schema
+        # supabaseクライアントは最初にデータベースへアクセスするときに作成する
+        self._client = None
+        self._client_lock = threading.Lock()
+        # 失敗が続いたらしばらく呼び出さず、キャッシュ済みのデータを表示させる
+        self.breaker = CircuitBreaker()
+        self.period_views = PERIOD_VIEWS
+        self.organisation_tables = ORGANISATION_TABLES
+
+    @property
+    def supabase(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self._connect()
+        return self._client
+
+    def _call(self, description, func, retries=DB_RETRIES):
+        """タイムアウト付きのクライアントで func を呼び出し、失敗したら間隔をあけて再試行する"""
+        return call_with_retry(func, self.breaker, retries, description)
+
+    def _connect(self):
+        # 読み込みに時間がかかるため、接続時にインポートする
+        from supabase import create_client
+        from supabase.lib.client_options import ClientOptions
+        from dotenv import load_dotenv
+
+        # ローカル環境の場合のみ.envファイルを読み込む
+        if not os.environ.get('STREAMLIT_CLOUD'):
+            load_dotenv()
+
         try:
             # デプロイ環境ではst.secretsから読み込む
             # ローカル環境では.envから読み込む
@@ -20,7 +82,8 @@ class SupabaseDB:
             
             # まずSecrets APIから取得を試みる
             try:
-                if "database" in st.secrets:
+                st = sys.modules.get('streamlit')
+                if st is not None and "database" in st.secrets:
                     supabase_url = st.secrets["database"]["supabase_url"]
                     supabase_key = st.secrets["database"]["supabase_key"]
             except:
@@ -34,122 +97,224 @@ class SupabaseDB:
             
             # 接続情報がない場合はエラー
             if not supabase_url or not supabase_key:
-                st.error("データベース接続情報が見つかりません")
+                show_error("データベース接続情報が見つかりません")
                 raise Exception("Supabase の認証情報が設定されていません")
             
             # デバッグ表示は削除（デプロイには不要）
-            self.supabase: Client = create_client(supabase_url, supabase_key)
+            # 応答のないリクエストで画面が止まらないよう、1回の呼び出しにタイムアウトを設定する
+            options = ClientOptions(postgrest_client_timeout=DB_TIMEOUT, **({'schema': self.schema} if self.schema else {}))
+            return create_client(supabase_url, supabase_key, options=options)
             
         except Exception as e:
-            st.error(f"データベース接続エラー: {str(e)}")
+            show_error(f"データベース接続エラー: {str(e)}")
             raise
     
+    @timed_function('db.init_db')
     def init_db(self):
         try:
             # テーブルの存在確認
-            self.supabase.table('shifts').select("*").limit(1).execute()
-            self.supabase.table('store_help_requests').select("*").limit(1).execute()
+            self._call('shifts テーブルの確認', lambda: self.supabase.table('shifts').select("*").limit(1).execute())
+            self._call('store_help_requests テーブルの確認',
+                       lambda: self.supabase.table('store_help_requests').select("*").limit(1).execute())
             return True
         except Exception as e:
-            st.error(f"データベース接続エラー: {e}")
+            show_error(f"データベース接続エラー: {e}")
             return False
 
-    def get_shifts(self, start_date, end_date):
-        try:
-            start_date_str = start_date.strftime('%Y-%m-%d')
-            end_date_str = end_date.strftime('%Y-%m-%d')
-            
-            # Supabaseからデータを取得
-            response = self.supabase.table('shifts')\
-                .select("*")\
-                .gte('date', start_date_str)\
-                .lte('date', end_date_str)\
-                .execute()
-            
-            if not response.data:
-                return pd.DataFrame()
-            
-            # データフレームに変換
-            df = pd.DataFrame(response.data)
-            df['date'] = pd.to_datetime(df['date'])
-            
-            # ピボットテーブルを作成
-            pivot_df = df.pivot(index='date', columns='employee', values='shift')
-            return pivot_df
-            
-        except Exception as e:
-            st.error(f"シフトデータの取得エラー: {e}")
+    @timed_function('db.get_shift_rows')
+    def get_shift_rows(self, start_date, end_date):
+        """シフトを1行1セルの形式で取得（version列はマイグレーション適用後のみ含まれる）
+
+        取得できなかった場合は空の表ではなく DatabaseUnavailableError を送出する
+        （「シフトなし」と区別し、キャッシュ済みのデータを表示できるようにするため）。
+        """
+        start_date_str = start_date.strftime('%Y-%m-%d')
+        end_date_str = end_date.strftime('%Y-%m-%d')
+        
+        # Supabaseからデータを取得
+        response = self._call('シフトデータの取得', lambda: self.supabase.table('shifts')\
+            .select("*")\
+            .gte('date', start_date_str)\
+            .lte('date', end_date_str)\
+            .execute())
+        
+        if not response.data:
             return pd.DataFrame()
+        
+        # データフレームに変換
+        df = pd.DataFrame(response.data)
+        df['date'] = pd.to_datetime(df['date'])
+        return df
+
+    @timed_function('db.get_shifts')
+    def get_shifts(self, start_date, end_date):
+        df = self.get_shift_rows(start_date, end_date)
+        if df.empty:
+            return df
+        
+        # ピボットテーブルを作成
+        pivot_df = df.pivot(index='date', columns='employee', values='shift')
+        return pivot_df
+
+    @timed_function('db.save_shift')
+    def save_shift(self, date, employee, shift_str, expected_version=None):
+        """シフトを保存する
 
-    def save_shift(self, date, employee, shift_str):
+        expected_version を指定すると、読み込んだときのバージョンと一致する場合だけ保存する
+        （0 は行がまだないことを期待する）。一致しない場合は conflict=True と最新の行を返す。
+        """
         try:
-            date_str = date.strftime('%Y-%m-%d')
-            
-            # データをUpsert（更新または挿入）
-            self.supabase.table('shifts')\
-                .upsert({
-                    'date': date_str,
-                    'employee': employee,
-                    'shift': shift_str
-                })\
-                .execute()
-            
-            return True
+            return self.save_shift_row(date, employee, shift_str, expected_version)
         except Exception as e:
-            st.error(f"シフトの保存エラー: {e}")
-            return False
+            show_error(f"シフトの保存エラー: {e}")
+            return SaveResult(False)
+
+    def save_shift_row(self, date, employee, shift_str, expected_version=None):
+        """save_shift と同じだが、保存できなかった場合は例外を送出する（画面には表示しない）"""
+        date_str = pd.Timestamp(date).strftime('%Y-%m-%d')
+        
+        if expected_version is None:
+            rows = self.save_shifts([{'date': date_str, 'employee': employee, 'shift': shift_str}])
+            return SaveResult(True, row=rows[0] if rows else None)
+        
+        # バージョンが一致する場合だけ更新（migrations/001_shift_row_versions.sql）
+        response = self._call('シフトの保存', lambda: self.supabase.rpc('save_shift_versioned', {
+            'p_date': date_str,
+            'p_employee': employee,
+            'p_shift': shift_str,
+            'p_expected_version': int(expected_version)
+        }).execute())
+        row = response.data[0] if response.data else None
+        if row is None:
+            raise DatabaseUnavailableError('シフトの保存結果を取得できませんでした')
+        conflict = bool(row.pop('conflict', False))
+        if conflict and row.get('shift') == shift_str and row.get('version') == int(expected_version) + 1:
+            # 保存できたが応答が届かずに再試行した場合は、自分の保存と競合したことになるので成功とみなす
+            conflict = False
+        return SaveResult(not conflict, conflict=conflict, row=row)
+
+    @timed_function('db.save_shifts')
+    def save_shifts(self, rows):
+        """複数のシフト（date, employee, shift）を1回のUpsertで保存し、保存後の行を返す（失敗したら例外）"""
+        if not rows:
+            return []
+        response = self._call('シフトの保存', lambda: self.supabase.table('shifts').upsert(rows).execute())
+        return response.data or []
 
+    @timed_function('db.save_store_help_request')
     def save_store_help_request(self, date, store, help_time):
         try:
             date_str = date.strftime('%Y-%m-%d')
             
             # データをUpsert
-            self.supabase.table('store_help_requests')\
-                .upsert({
-                    'date': date_str,
-                    'store': store,
-                    'help_time': help_time
-                })\
-                .execute()
+            self.save_store_help_requests([{'date': date_str, 'store': store, 'help_time': help_time}])
             
             return True
         except Exception as e:
-            st.error(f"店舗ヘルプ希望の保存エラー: {e}")
+            show_error(f"店舗ヘルプ希望の保存エラー: {e}")
             return False
 
+    @timed_function('db.save_store_help_requests')
+    def save_store_help_requests(self, rows):
+        """複数の店舗ヘルプ希望（date, store, help_time）を1回のUpsertで保存する（失敗したら例外）"""
+        if not rows:
+            return
+        self._call('店舗ヘルプ希望の保存', lambda: self.supabase.table('store_help_requests').upsert(rows).execute())
+
+    @timed_function('db.get_store_help_requests')
     def get_store_help_requests(self, start_date, end_date):
-        try:
-            start_date_str = start_date.strftime('%Y-%m-%d')
-            end_date_str = end_date.strftime('%Y-%m-%d')
-            
-            # Supabaseからデータを取得
-            response = self.supabase.table('store_help_requests')\
-                .select("*")\
-                .gte('date', start_date_str)\
-                .lte('date', end_date_str)\
-                .execute()
-            
-            if not response.data:
-                return pd.DataFrame()
-            
-            # データフレームに変換
-            df = pd.DataFrame(response.data)
-            df['date'] = pd.to_datetime(df['date'])
-            
-            # ピボットテーブルを作成
-            pivot_df = df.pivot(index='date', columns='store', values='help_time').fillna('-')
-            
-            # 全ての店舗列が存在することを確認
-            all_stores = [store for stores in AREAS.values() for store in stores]
-            for store in all_stores:
-                if store not in pivot_df.columns:
-                    pivot_df[store] = '-'
-            
-            return pivot_df
-            
-        except Exception as e:
-            st.error(f"店舗ヘルプ希望の取得エラー: {e}")
+        """店舗ヘルプ希望を日付×店舗の表で取得（取得できなければ DatabaseUnavailableError）"""
+        start_date_str = start_date.strftime('%Y-%m-%d')
+        end_date_str = end_date.strftime('%Y-%m-%d')
+        
+        # Supabaseからデータを取得
+        response = self._call('店舗ヘルプ希望の取得', lambda: self.supabase.table('store_help_requests')\
+            .select("*")\
+            .gte('date', start_date_str)\
+            .lte('date', end_date_str)\
+            .execute())
+        
+        if not response.data:
             return pd.DataFrame()
+        
+        # データフレームに変換
+        df = pd.DataFrame(response.data)
+        df['date'] = pd.to_datetime(df['date'])
+        
+        # ピボットテーブルを作成
+        pivot_df = df.pivot(index='date', columns='store', values='help_time').fillna('-')
+        
+        # 全ての店舗列が存在することを確認
+        from organisation import current_organisation
+        all_stores = current_organisation().stores
+        return pivot_df.reindex(columns=list(pivot_df.columns) + [store for store in all_stores if store not in pivot_df.columns],
+                                fill_value='-')
+
+    @timed_function('db.get_shift_days')
+    def get_shift_days(self, start_date, end_date):
+        """期間のシフトを日付ごとの (日付, {従業員: シフト}, {従業員: バージョン}) の一覧で取得（shift_days ビュー）"""
+        response = self._call('シフトデータの取得', lambda: self.supabase.table('shift_days')\
+            .select('date,shifts,versions')\
+            .gte('date', start_date.strftime('%Y-%m-%d'))\
+            .lte('date', end_date.strftime('%Y-%m-%d'))\
+            .execute())
+        return [(pd.Timestamp(row['date']), row['shifts'] or {}, row.get('versions') or {}) for row in response.data or []]
+
+    @timed_function('db.get_store_help_days')
+    def get_store_help_days(self, start_date, end_date):
+        """期間の店舗ヘルプ希望を日付ごとの (日付, {店舗: 時間帯}) の一覧で取得（store_help_days ビュー）"""
+        response = self._call('店舗ヘルプ希望の取得', lambda: self.supabase.table('store_help_days')\
+            .select('date,help_times')\
+            .gte('date', start_date.strftime('%Y-%m-%d'))\
+            .lte('date', end_date.strftime('%Y-%m-%d'))\
+            .execute())
+        return [(pd.Timestamp(row['date']), row['help_times'] or {}) for row in response.data or []]
+
+    @timed_function('db.get_organisation_version')
+    def get_organisation_version(self):
+        """組織のマスタのバージョン（テーブルを使わない設定ならNone）"""
+        if not self.organisation_tables:
+            return None
+        response = self._call('組織のマスタのバージョンの取得',
+                              lambda: self.supabase.table('organisation_meta').select('version').eq('id', 1).execute())
+        return response.data[0]['version'] if response.data else 0
+
+    @timed_function('db.get_organisation')
+    def get_organisation(self):
+        """従業員（name, area, sort_order）と店舗（name, area, color, sort_order）の行の一覧を返す"""
+        employees = self._call('従業員の取得', lambda: self.supabase.table('employees').select('name,area,sort_order').execute())
+        stores = self._call('店舗の取得', lambda: self.supabase.table('stores').select('name,area,color,sort_order').execute())
+        return employees.data or [], stores.data or []
+
+    @timed_function('db.save_organisation')
+    def save_organisation(self, employee_rows, store_rows):
+        """従業員・店舗の一覧を置き換える（失敗したら例外）"""
+        if not self.organisation_tables:
+            raise ValueError('組織のマスタのテーブルを使う設定になっていません（HELP2_ORGANISATION_TABLES=1）')
+        self._call('組織のマスタの保存', lambda: self.supabase.rpc('replace_organisation', {
+            'p_employees': employee_rows, 'p_stores': store_rows}).execute())
+
+def create_database(url=None, schema=None):
+    """データベースを作成する（HELP2_DATABASE に sqlite:///path を指定するとローカルのSQLiteを使う）"""
+    url = url if url is not None else os.environ.get('HELP2_DATABASE', '')
+    if not url:
+        return SupabaseDB(schema)
+    if url.startswith('sqlite:///'):
+        from local_database import SQLiteDB
+        return SQLiteDB(url[len('sqlite:///'):])
+    raise ValueError(f'データベースの指定が正しくありません: {url}')
+
+def tenant_database_url(tenant):
+    """テナントのデータベース（指定しない場合は HELP2_DATABASE。SQLiteならファイルをテナントごとに分ける）"""
+    if tenant.database is not None:
+        return tenant.database
+    url = os.environ.get('HELP2_DATABASE', '')
+    if url.startswith('sqlite:///'):
+        return 'sqlite:///' + tenant.path(url[len('sqlite:///'):])
+    return url
+
+def _tenant_database(tenant):
+    return create_database(tenant_database_url(tenant), schema=tenant.schema)
 
-# データベースのシングルトンインスタンスを作成
-db = SupabaseDB()
\ No newline at end of file
+# データベースのシングルトンインスタンスを作成（テナントごと。接続が止まっても他のテナントには影響しない）
+db = TenantScoped(_tenant_database)
\ No newline at end of file
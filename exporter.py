@@ -0,0 +1,168 @@
+"""シフト・店舗ヘルプ希望の表形式（CSV / Excel / Parquet）での出力
+
+期間（または日付の範囲）のデータを、期間ごとのスナップショットから順に変換して書き出す。
+表示用の装飾した表は作らず、期間ごとの表をそのまま次の形にして1期間ずつ書き込む。
+    縦持ち（long）: 1行1セル。シフトは 日付・エリア・従業員・シフト・種類・日数、
+        ヘルプ希望は 日付・エリア・店舗・時間帯（空欄・'-' は出力しない）
+    横持ち（pivot）: 日付・曜日と、従業員（ヘルプ希望は店舗）ごとの列（画面の表と同じ形）。
+        '-' と値のないセルは空欄にする（importer は空欄のセルを変更しないため、取り込み直しても値のあるセルだけを保存する）
+CSV・Excel は見出しが日本語で、importer でそのまま取り込める。Parquet は英語の列名で日付は date 型。
+
+    python cli.py export-data --year 2024 --month 4 --data shifts --layout long --format parquet --out shifts.parquet
+"""
+import io
+import numpy as np
+import pandas as pd
+from constants import WEEKDAY_JA
+from organisation import current_organisation
+from period import KIND_SHIFTS, KIND_HELP_REQUESTS
+from period_range import iter_range_frames
+from utils import parse_shift, count_shift
+
+LAYOUT_LONG = 'long'
+LAYOUT_PIVOT = 'pivot'
+LAYOUTS = [LAYOUT_LONG, LAYOUT_PIVOT]
+FORMATS = {'csv': 'text/csv', 'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+           'parquet': 'application/vnd.apache.parquet'}
+PARQUET_COMPRESSION = 'zstd'
+
+LONG_COLUMNS = {
+    KIND_SHIFTS: ['date', 'area', 'employee', 'shift', 'shift_type', 'days'],
+    KIND_HELP_REQUESTS: ['date', 'area', 'store', 'help_time'],
+}
+COLUMN_LABELS = {
+    'date': '日付', 'weekday': '曜日', 'area': 'エリア', 'employee': '従業員', 'shift': 'シフト',
+    'shift_type': '種類', 'days': '日数', 'store': '店舗', 'help_time': '時間帯',
+}
+SHEET_NAMES = {KIND_SHIFTS: 'シフト', KIND_HELP_REQUESTS: '店舗ヘルプ希望'}
+
+
+def _targets(kind):
+    organisation = current_organisation()
+    if kind == KIND_SHIFTS:
+        return organisation.employees, {employee: area for area, employees in organisation.employee_areas.items()
+                                        for employee in employees}
+    return organisation.stores, {store: area for area, stores in organisation.areas.items() for store in stores}
+
+
+def _long_frame(frame, kind, targets, target_area):
+    """期間の表（日付×従業員/店舗）を1行1セルの表にする（値の種類ごとに一度だけ解析する）"""
+    columns = LONG_COLUMNS[kind]
+    frame = frame.reindex(columns=[target for target in targets if target in frame.columns])
+    values = frame.to_numpy(dtype=object)
+    codes, uniques = pd.factorize(values.ravel())
+    uniques = np.asarray(uniques, dtype=object)
+    keep = np.array([value not in ('-', '') for value in uniques] + [False], dtype=bool)
+    codes = np.where(codes < 0, len(uniques), codes)
+    cells = np.flatnonzero(keep[codes])
+    rows, cols = np.divmod(cells, max(frame.shape[1], 1))
+    # 空の期間（列のない表）でも、従業員・店舗と値の列は文字列（object）にする
+    target_names = np.asarray(frame.columns, dtype=object)[cols]
+    long = {
+        'date': frame.index.to_numpy()[rows],
+        'area': np.array([target_area.get(target, '') for target in target_names], dtype=object),
+        'employee' if kind == KIND_SHIFTS else 'store': target_names,
+        'shift' if kind == KIND_SHIFTS else 'help_time': uniques[codes[cells]] if len(uniques) else np.array([], dtype=object),
+    }
+    if kind == KIND_SHIFTS:
+        shift_types = np.array([parse_shift(value)[0] or '' for value in uniques] + [''], dtype=object)
+        days = np.array([count_shift(value) for value in uniques] + [0], dtype=float)
+        long['shift_type'] = shift_types[codes[cells]]
+        long['days'] = days[codes[cells]]
+    return pd.DataFrame(long, columns=columns)
+
+
+def _pivot_frame(frame, dates, targets):
+    pivot = frame.reindex(index=dates, columns=targets).astype(object)
+    pivot = pivot.where(pivot.notna() & (pivot != '-'), None)
+    pivot.insert(0, 'weekday', dates.strftime('%a').map(WEEKDAY_JA))
+    pivot.insert(0, 'date', dates)
+    return pivot.reset_index(drop=True)
+
+
+def iter_export_frames(load, kind, layout, start_date, end_date):
+    """期間ごとに出力する表を返す（load(種類, 年, 月) で期間の表を取得する）
+
+    何も出力しない範囲でも、見出しを書けるように空の表を1つ返す。
+    """
+    targets, target_area = _targets(kind)
+    for _, _, dates, frame in iter_range_frames(load, kind, start_date, end_date):
+        yield _long_frame(frame, kind, targets, target_area) if layout == LAYOUT_LONG else _pivot_frame(frame, dates, targets)
+
+
+def _with_labels(chunk):
+    chunk = chunk.assign(date=pd.to_datetime(chunk['date']).dt.strftime('%Y-%m-%d'))
+    return chunk.rename(columns=COLUMN_LABELS)
+
+
+def write_csv(chunks, out):
+    """BOM付きUTF-8のCSVを1期間ずつ書き込み、書き込んだ行数を返す"""
+    handle = io.TextIOWrapper(out, encoding='utf-8-sig', newline='')
+    total = 0
+    try:
+        for i, chunk in enumerate(chunks):
+            _with_labels(chunk).to_csv(handle, header=i == 0, index=False)
+            total += len(chunk)
+    finally:
+        handle.detach()
+    return total
+
+
+def write_xlsx(chunks, out, sheet_name):
+    """書き込み専用モードのExcelに1行ずつ追加し、書き込んだ行数を返す"""
+    import openpyxl
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(sheet_name)
+    total = 0
+    for i, chunk in enumerate(chunks):
+        if i == 0:
+            sheet.append([COLUMN_LABELS.get(column, column) for column in chunk.columns])
+        chunk = chunk.assign(date=pd.to_datetime(chunk['date']).dt.date)
+        for row in chunk.itertuples(index=False):
+            sheet.append(list(row))
+        total += len(chunk)
+    workbook.save(out)
+    return total
+
+
+def write_parquet(chunks, out):
+    """1期間を1つの行グループとしてParquetに書き込み、書き込んだ行数を返す"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    writer = None
+    total = 0
+    try:
+        for chunk in chunks:
+            chunk = chunk.assign(date=pd.to_datetime(chunk['date']).dt.date)
+            if writer is None:
+                schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+                # 空の期間から始まっても型が決まるよう、日付以外は文字列・日数は小数にする
+                schema = pa.schema([pa.field(name, pa.date32() if name == 'date' else pa.float64() if name == 'days' else pa.string())
+                                    for name in schema.names])
+                writer = pq.ParquetWriter(out, schema, compression=PARQUET_COMPRESSION)
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            total += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return total
+
+
+def export_data(load, kind, layout, fmt, out, start_date, end_date):
+    """期間（日付の範囲）のデータを fmt（csv / xlsx / parquet）で out（パスまたはバイナリのファイル）に書き出し、行数を返す"""
+    if layout not in LAYOUTS:
+        raise ValueError(f'出力の形が不正です: {layout}')
+    if fmt not in FORMATS:
+        raise ValueError(f'出力形式が不正です: {fmt}')
+    if pd.Timestamp(end_date) < pd.Timestamp(start_date):
+        # 書き込み始める前に確認する（iter_range_frames でも確認する）
+        raise ValueError('終了日が開始日より前です')
+    chunks = iter_export_frames(load, kind, layout, start_date, end_date)
+    if fmt == 'csv':
+        if isinstance(out, str):
+            with open(out, 'wb') as f:
+                return write_csv(chunks, f)
+        return write_csv(chunks, out)
+    if fmt == 'xlsx':
+        return write_xlsx(chunks, out, SHEET_NAMES[kind])
+    return write_parquet(chunks, out)
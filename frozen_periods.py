@@ -0,0 +1,109 @@
+"""確定済みの期間を圧縮したParquetファイルとして固定し、データベースに問い合わせずに読み込む
+
+過去の期間は変更されないため、固定（freeze）するとシフトと店舗ヘルプ希望を
+HELP2_FROZEN_DIR（既定はアプリと同じディレクトリの frozen/）に保存し、以降はファイルから読み込む。
+修正が必要になった場合は固定を解除（unfreeze）する。
+
+    python cli.py freeze --year 2024 --month 4
+    python cli.py unfreeze --year 2024 --month 4
+"""
+import os
+import json
+import shutil
+import tempfile
+from datetime import datetime
+import pandas as pd
+from tenants import TenantScoped
+
+FROZEN_DIR = os.environ.get('HELP2_FROZEN_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'frozen'))
+FROZEN_COMPRESSION = 'zstd'
+MANIFEST = 'manifest.json'
+
+
+class FrozenPeriodStore:
+    """期間ごとのディレクトリ（年-月）にParquetファイルと manifest.json を保存する
+
+    manifest.json はすべてのファイルを書き終えてから置くため、manifest.json があれば固定済みとみなす。
+    """
+
+    def __init__(self, directory=FROZEN_DIR):
+        self.directory = directory
+
+    def _period_dir(self, year, month):
+        return os.path.join(self.directory, f'{year}-{month:02d}')
+
+    def _file(self, year, month, kind):
+        return os.path.join(self._period_dir(year, month), f'{kind}.parquet')
+
+    def is_frozen(self, year, month):
+        return os.path.exists(os.path.join(self._period_dir(year, month), MANIFEST))
+
+    def manifest(self, year, month):
+        """固定した期間の情報（固定日時・行数）を返す（固定していなければNone）"""
+        try:
+            with open(os.path.join(self._period_dir(year, month), MANIFEST), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def frozen_periods(self):
+        """固定済みの期間の(年, 月)の一覧を返す"""
+        if not os.path.isdir(self.directory):
+            return []
+        periods = []
+        for name in sorted(os.listdir(self.directory)):
+            year, _, month = name.partition('-')
+            if year.isdigit() and month.isdigit() and self.is_frozen(int(year), int(month)):
+                periods.append((int(year), int(month)))
+        return periods
+
+    def freeze(self, year, month, frames):
+        """期間データ（種類 -> 表）を固定する（固定済みなら上書きする）。空の表はファイルを作らない"""
+        os.makedirs(self.directory, exist_ok=True)
+        # 一時ディレクトリに書き終えてから置き換え、読み込み中に途中のファイルが見えないようにする
+        work_dir = tempfile.mkdtemp(prefix=f'.{year}-{month:02d}-', dir=self.directory)
+        try:
+            os.chmod(work_dir, 0o755)
+            for kind, frame in frames.items():
+                if not frame.empty:
+                    frame.to_parquet(os.path.join(work_dir, f'{kind}.parquet'), compression=FROZEN_COMPRESSION)
+            manifest = {
+                'year': year,
+                'month': month,
+                'frozen_at': datetime.now().isoformat(timespec='seconds'),
+                'rows': {kind: len(frame) for kind, frame in frames.items()},
+            }
+            with open(os.path.join(work_dir, MANIFEST), 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+            period_dir = self._period_dir(year, month)
+            if os.path.exists(period_dir):
+                shutil.rmtree(period_dir)
+            os.replace(work_dir, period_dir)
+        except BaseException:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            raise
+        return manifest
+
+    def unfreeze(self, year, month):
+        """固定を解除する（固定していなければFalse）"""
+        period_dir = self._period_dir(year, month)
+        if not os.path.exists(period_dir):
+            return False
+        # manifest.json を先に消し、削除の途中で固定済みと判定されないようにする
+        manifest_path = os.path.join(period_dir, MANIFEST)
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+        shutil.rmtree(period_dir)
+        return True
+
+    def load(self, kind, year, month):
+        """固定済みの期間データを読み込む（ファイルがなければ空の表）"""
+        path = self._file(year, month, kind)
+        if not os.path.exists(path):
+            return pd.DataFrame()
+        return pd.read_parquet(path)
+
+
+# 固定済み期間の保存先のシングルトンインスタンスを作成（テナントごと）
+frozen_periods = TenantScoped(lambda tenant: FrozenPeriodStore(tenant.path(FROZEN_DIR)))
@@ -0,0 +1,153 @@
+"""店舗ヘルプ希望の充足状況（充足・一部・未充足）のレポート
+
+店舗ヘルプ希望と、シフトの時間帯の索引（intervals.ShiftIntervalIndex）を
+(日付, 店舗) で結合し、希望の時間帯のうち割り当てで埋まっている分数を1回の表計算で求める。
+    充足: 希望の時間帯がすべて埋まっている（時間を解釈できない希望・割り当ては店舗に入っていれば充足）
+    一部: 一部だけ埋まっている
+    未充足: だれも入っていない
+ヘルプ希望の表の色分けと、エリア・店舗・日付ごとの集計はこのレポートから作る。
+"""
+import numpy as np
+import pandas as pd
+from intervals import parse_time_ranges
+from constants import FILLED_HELP_BG_COLOR, PARTIAL_HELP_BG_COLOR
+from utils import label_columns
+
+STATUS_FILLED = '充足'
+STATUS_PARTIAL = '一部'
+STATUS_OPEN = '未充足'
+STATUSES = [STATUS_FILLED, STATUS_PARTIAL, STATUS_OPEN]
+
+REPORT_COLUMNS = ['date', 'area', 'store', 'help_time', 'requested_minutes', 'covered_minutes', 'helpers', 'status']
+# 集計の単位と、その列
+ROLLUPS = {'area': ['area'], 'store': ['area', 'store'], 'date': ['date']}
+COLUMN_LABELS = {
+    'date': '日付', 'area': 'エリア', 'store': '店舗', 'help_time': '希望時間', 'requested_minutes': '希望（分）',
+    'covered_minutes': '割り当て済み（分）', 'helpers': '人数', 'status': '状況', 'requests': '希望件数', 'coverage_rate': '充足率',
+}
+STATUS_STYLES = {STATUS_FILLED: FILLED_HELP_BG_COLOR, STATUS_PARTIAL: PARTIAL_HELP_BG_COLOR}
+
+
+def _requests(store_help_requests):
+    """ヘルプ希望のピボット表を (date, store, help_time) の1行1希望に変換"""
+    if store_help_requests is None or store_help_requests.empty:
+        return pd.DataFrame({'date': pd.DatetimeIndex([]), 'store': pd.Series(dtype=object), 'help_time': pd.Series(dtype=object)})
+    values = store_help_requests.to_numpy(dtype=object)
+    rows, columns = np.nonzero(pd.notna(values) & (values != '-') & (values != ''))
+    return pd.DataFrame({
+        'date': pd.to_datetime(store_help_requests.index)[rows],
+        'store': store_help_requests.columns.to_numpy()[columns],
+        'help_time': values[rows, columns],
+    })
+
+
+def _windows(requests):
+    """希望ごとの時間帯を (request, start, end) に展開（時間帯は種類ごとに一度だけ解析する）"""
+    codes, uniques = pd.factorize(requests['help_time'])
+    parsed = [parse_time_ranges(help_time) for help_time in uniques]
+    per_unique = np.array([len(ranges) for ranges in parsed], dtype=np.int64)
+    counts = per_unique[codes]
+    request = np.repeat(np.arange(len(requests)), counts)
+    # 種類ごとの時間帯を1列に並べた配列での位置
+    offsets = np.concatenate([[0], np.cumsum(per_unique)])
+    within = np.arange(len(request)) - np.repeat(np.cumsum(counts) - counts, counts)
+    flat = np.array([time_range for ranges in parsed for time_range in ranges], dtype=np.int64).reshape(-1, 2)
+    bounds = flat[offsets[codes[request]] + within]
+    return pd.DataFrame({
+        'request': request,
+        'date': requests['date'].to_numpy()[request],
+        'store': requests['store'].to_numpy()[request],
+        'start': bounds[:, 0],
+        'end': bounds[:, 1],
+    })
+
+
+def fulfilment_report(store_help_requests, index, areas=None):
+    """ヘルプ希望ごとの充足状況の表（REPORT_COLUMNS）を返す
+
+    index: 期間のシフトの ShiftIntervalIndex
+    """
+    if areas is None:
+        from organisation import current_organisation
+        areas = current_organisation().areas
+    store_area = {store: area for area, stores in areas.items() for store in stores}
+    requests = _requests(store_help_requests)
+    n = len(requests)
+    windows = _windows(requests)
+
+    # 希望の時間帯と割り当ての時間帯を (日付, 店舗) で結合し、重なっている部分だけ残す
+    assigned = index.intervals[['date', 'store', 'employee', 'start', 'end']]
+    joined = windows.reset_index(names='window').merge(assigned, on=['date', 'store'], suffixes=('', '_assigned'))
+    joined['start'] = np.maximum(joined['start'], joined['start_assigned'])
+    joined['end'] = np.minimum(joined['end'], joined['end_assigned'])
+    joined = joined[joined['end'] > joined['start']].sort_values(['window', 'start'], kind='mergesort')
+    # 同じ時間に複数人いても二重に数えないよう、それまでの終了時刻の最大値より後の部分だけを数える
+    previous_end = joined.groupby('window')['end'].cummax().groupby(joined['window']).shift()
+    covered_part = joined['end'] - np.maximum(joined['start'], previous_end.fillna(-1).astype(np.int64))
+    covered = np.bincount(joined['request'], weights=covered_part.clip(lower=0), minlength=n)
+    helpers = joined.drop_duplicates(['request', 'employee'])['request'].value_counts().reindex(range(n), fill_value=0).to_numpy()
+
+    requested = np.bincount(windows['request'], weights=windows['end'] - windows['start'], minlength=n)
+    timed = np.bincount(windows['request'], minlength=n) > 0
+
+    # 時間なしで店舗に入っている従業員は、その日の希望をすべて埋めているとみなす
+    keys = pd.MultiIndex.from_frame(requests[['date', 'store']]) if n else pd.MultiIndex.from_tuples([], names=['date', 'store'])
+    untimed = index.untimed.groupby(['date', 'store'])['employee'].nunique()
+    untimed_helpers = untimed.reindex(keys, fill_value=0).to_numpy() if n else np.zeros(0, dtype=np.int64)
+    covered = np.where(untimed_helpers > 0, requested, covered)
+    helpers = helpers + untimed_helpers
+    if not timed.all():
+        # 時間を解釈できない希望は、その店舗にだれかが入っていれば充足とする
+        anyone = assigned.groupby(['date', 'store']).size().reindex(keys, fill_value=0).to_numpy()
+        helpers = np.where(timed, helpers, anyone + untimed_helpers)
+
+    status = np.where(timed,
+                      np.select([covered >= requested, covered > 0], [STATUS_FILLED, STATUS_PARTIAL], STATUS_OPEN),
+                      np.where(helpers > 0, STATUS_FILLED, STATUS_OPEN))
+    report = pd.DataFrame({
+        'date': requests['date'].to_numpy(),
+        'area': requests['store'].map(store_area).fillna('').to_numpy(),
+        'store': requests['store'].to_numpy(),
+        'help_time': requests['help_time'].to_numpy(),
+        'requested_minutes': np.where(timed, requested, np.nan),
+        'covered_minutes': np.where(timed, covered, np.nan),
+        'helpers': helpers.astype(np.int64),
+        'status': status,
+    }, columns=REPORT_COLUMNS)
+    return report.sort_values(['date', 'store'], kind='mergesort').reset_index(drop=True)
+
+
+def summarize_fulfilment(report, by):
+    """エリア・店舗・日付（ROLLUPS のキー）ごとに状況別の件数と、希望時間のうち埋まっている割合を集計"""
+    keys = ROLLUPS[by]
+    counts = report.groupby(keys)['status'].value_counts().unstack(fill_value=0).reindex(columns=STATUSES, fill_value=0)
+    minutes = report.groupby(keys)[['requested_minutes', 'covered_minutes']].sum()
+    summary = counts.join(minutes)
+    summary.insert(0, 'requests', counts.sum(axis=1))
+    summary['coverage_rate'] = (summary['covered_minutes'] / summary['requested_minutes'].where(summary['requested_minutes'] > 0)).round(3)
+    summary.columns.name = None
+    return summary.reset_index()
+
+
+def fulfilment_styles(table, report):
+    """ヘルプ希望の表と同じ形の、充足状況に応じた背景色のCSSの表（Styler.apply(..., axis=None) 用）
+
+    table は '日付'（YYYY-MM-DD）列と店舗の列を持つ表示用の表。
+    """
+    styles = pd.DataFrame('', index=table.index, columns=table.columns)
+    if report.empty:
+        return styles
+    css = pd.DataFrame({
+        'date': report['date'].dt.strftime('%Y-%m-%d'),
+        'store': report['store'],
+        'css': report['status'].map(STATUS_STYLES).fillna(''),
+    }).pivot(index='date', columns='store', values='css')
+    stores = [column for column in table.columns if column in css.columns]
+    styles[stores] = css.reindex(index=table['日付'], columns=stores).fillna('').to_numpy()
+    return styles
+
+
+def to_csv_bytes(frame):
+    """Excelでそのまま開けるよう、BOM付きUTF-8のCSVにする"""
+    frame = frame.assign(date=frame['date'].dt.strftime('%Y-%m-%d')) if 'date' in frame.columns else frame
+    return label_columns(frame, COLUMN_LABELS).to_csv(index=False).encode('utf-8-sig')
@@ -0,0 +1,301 @@
+"""シフト・店舗ヘルプ希望のCSV/Excelからの一括取り込み
+
+表の形式（1行目は見出し）:
+    横持ち: 1列目が日付、2列目以降が従業員（シフト）または店舗（ヘルプ希望）。曜日の列は無視する。
+        日付,曜日,大塚,和田 / 2024-04-16,火,"AM可,9-12@本店",休み
+    縦持ち: 日付・従業員・シフト（ヘルプ希望は 日付・店舗・時間帯）の3列
+        日付,従業員,シフト / 2024-04-16,大塚,"AM可,9-12@本店"
+空欄のセルは取り込まない（変更しない）。'-' はシフト・ヘルプ希望を消す。同じセルが複数あれば後の値を使う。
+
+ファイルは1行ずつ読み、セルごとに検証して IMPORT_BATCH 件ずつ save に渡す（まとめてupsertする）。
+skip_invalid=False の場合は先に全行を検証し、エラーが1件でもあれば何も保存しない。
+
+    python cli.py import shifts.xlsx --kind shifts
+"""
+import io
+import os
+import csv
+from datetime import date as date_type, datetime
+import pandas as pd
+from constants import EDITABLE_SHIFT_TYPES
+from organisation import current_organisation
+from intervals import parse_time_range, parse_time_ranges
+
+IMPORT_SHIFTS = 'shifts'
+IMPORT_HELP_REQUESTS = 'help_requests'
+IMPORT_KINDS = [IMPORT_SHIFTS, IMPORT_HELP_REQUESTS]
+# 1回の保存（upsert）で送る件数
+IMPORT_BATCH = int(os.environ.get('HELP2_IMPORT_BATCH', 500))
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm')
+# CSVの文字コード（Excelで保存したCSVはShift_JIS のことが多い）
+CSV_ENCODINGS = ('utf-8-sig', 'cp932')
+
+DATE_HEADERS = {'日付', 'date'}
+IGNORED_HEADERS = {'曜日', 'weekday'}
+# 縦持ちの見出し（種類ごとに 対象の列, 値の列）
+LONG_HEADERS = {
+    IMPORT_SHIFTS: ({'従業員', 'employee'}, {'シフト', 'shift'}),
+    IMPORT_HELP_REQUESTS: ({'店舗', 'store'}, {'時間帯', '希望時間', 'help_time'}),
+}
+# 保存する行の列名（db.save_shifts / db.save_store_help_requests と同じ）
+ROW_KEYS = {IMPORT_SHIFTS: ('employee', 'shift'), IMPORT_HELP_REQUESTS: ('store', 'help_time')}
+
+# シフト登録画面と同じ種類（constants.EDITABLE_SHIFT_TYPES）で検証する
+# 時間帯を付けられる種類（AM可・PM可・1日可）
+AVAILABLE_SHIFTS = [shift_type for shift_type in EDITABLE_SHIFT_TYPES if shift_type.endswith('可')]
+# 時間帯を付けない種類（'その他' は内容・時間帯を付けるため除く）
+SINGLE_SHIFTS = [shift_type for shift_type in EDITABLE_SHIFT_TYPES if shift_type not in AVAILABLE_SHIFTS and shift_type != 'その他']
+
+
+class ImportIssue:
+    """取り込めなかったセル（row はファイルの行番号、1行目が見出し）"""
+
+    def __init__(self, row, column, value, message):
+        self.row = row
+        self.column = column
+        self.value = value
+        self.message = message
+
+    def __str__(self):
+        return f'{self.row}行目 {self.column}: {self.message}（{self.value}）'
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.issues = []
+        self.saved = False
+
+    @property
+    def ok(self):
+        return not self.issues
+
+    def issues_frame(self):
+        return pd.DataFrame([(issue.row, issue.column, issue.value, issue.message) for issue in self.issues],
+                            columns=['行', '列', '値', 'エラー'])
+
+
+def _all_stores():
+    return set(current_organisation().stores)
+
+
+def _cell_text(value):
+    """セルの値を文字列に変換（空欄はNone）"""
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = str(value).strip()
+    return text or None
+
+
+def _parse_date(value):
+    """日付のセル（Excelの日付、2024-04-16、2024/4/16）を Timestamp に変換（解釈できなければNone）"""
+    if isinstance(value, (datetime, date_type)):
+        return pd.Timestamp(value).normalize()
+    text = _cell_text(value)
+    if text is None:
+        return None
+    try:
+        return pd.Timestamp(text.replace('/', '-')).normalize()
+    except ValueError:
+        return None
+
+
+def _time_parts_error(parts, stores):
+    for part in parts:
+        time, _, store = part.strip().partition('@')
+        if parse_time_range(time) is None:
+            return f'時間「{time}」を解釈できません'
+        if store and store not in stores:
+            return f'店舗「{store}」が登録されていません'
+    return None
+
+
+def validate_shift(shift, stores=None):
+    """シフト文字列をシフト登録画面と同じ規則で検証し、エラーの内容を返す（正しければNone）"""
+    stores = _all_stores() if stores is None else stores
+    if shift in SINGLE_SHIFTS:
+        return None
+    parts = shift.split(',')
+    if parts[0] in AVAILABLE_SHIFTS:
+        return _time_parts_error(parts[1:], stores)
+    if parts[0] == 'その他':
+        if len(parts) > 1 and not parts[1].strip():
+            return 'その他の内容がありません'
+        return _time_parts_error(parts[2:], stores)
+    return f'シフトの種類「{parts[0]}」が不正です'
+
+
+def validate_help_time(help_time):
+    """店舗ヘルプ希望の時間帯を検証し、エラーの内容を返す（正しければNone）"""
+    if help_time == '-' or parse_time_ranges(help_time):
+        return None
+    return f'時間帯「{help_time}」を解釈できません'
+
+
+def read_rows(file, filename=None):
+    """CSV/Excelファイル（パスまたはファイルオブジェクト）を1行ずつ（セルの値のリスト）返す"""
+    name = (filename or (file if isinstance(file, str) else getattr(file, 'name', '')) or '').lower()
+    if name.endswith(EXCEL_EXTENSIONS):
+        # Excelは読み取り専用モードで開き、シート全体を読み込まずに1行ずつ返す
+        import openpyxl
+        if not isinstance(file, str):
+            file.seek(0)
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        try:
+            for row in workbook.active.iter_rows(values_only=True):
+                yield list(row)
+        finally:
+            workbook.close()
+        return
+
+    for encoding in CSV_ENCODINGS:
+        if isinstance(file, str):
+            handle = open(file, encoding=encoding, newline='')
+        else:
+            file.seek(0)
+            handle = io.TextIOWrapper(file, encoding=encoding, newline='')
+        emitted = False
+        try:
+            for row in csv.reader(handle):
+                emitted = True
+                yield row
+            return
+        except UnicodeDecodeError:
+            # 先頭から別の文字コードで読み直す（途中まで返した場合は読み直せない）
+            if emitted:
+                raise ValueError(f'CSVの文字コードを判別できません（{encoding} で読み込めない行があります）')
+        finally:
+            if isinstance(file, str):
+                handle.close()
+            else:
+                handle.detach()
+    raise ValueError('CSVの文字コードを判別できません（UTF-8 または Shift_JIS で保存してください）')
+
+
+def _cells(rows, kind):
+    """行から (行番号, 列名, 日付のセル, 対象, 値) を返す（見出しの誤りは ImportIssue を返す）"""
+    targets = set(current_organisation().employees) if kind == IMPORT_SHIFTS else _all_stores()
+    target_label = '従業員' if kind == IMPORT_SHIFTS else '店舗'
+    rows = iter(rows)
+    header = [(_cell_text(value) or '') for value in next(rows, [])]
+    if not header or header[0] not in DATE_HEADERS:
+        yield ImportIssue(1, header[0] if header else '', '', '1列目の見出しは「日付」にしてください')
+        return
+
+    target_headers, value_headers = LONG_HEADERS[kind]
+    target_column = next((i for i, name in enumerate(header) if name in target_headers), None)
+    value_column = next((i for i, name in enumerate(header) if name in value_headers), None)
+    long_format = target_column is not None and value_column is not None
+
+    columns = []
+    if not long_format:
+        for i, name in enumerate(header[1:], start=1):
+            if name in IGNORED_HEADERS or not name:
+                continue
+            if name not in targets:
+                yield ImportIssue(1, name, name, f'{target_label}「{name}」が登録されていません')
+                continue
+            columns.append((i, name))
+
+    for line, row in enumerate(rows, start=2):
+        if not any(_cell_text(value) for value in row):
+            continue
+        if long_format:
+            target = _cell_text(row[target_column]) if target_column < len(row) else None
+            value = row[value_column] if value_column < len(row) else None
+            if target is not None and target not in targets:
+                yield ImportIssue(line, header[target_column], target, f'{target_label}「{target}」が登録されていません')
+                continue
+            yield line, header[value_column], row[0], target, value
+        else:
+            for i, name in columns:
+                yield line, name, row[0], name, row[i] if i < len(row) else None
+
+
+def _validate(rows, kind, is_frozen, result):
+    """検証済みの保存する行を1件ずつ返し、エラーは result.issues に追加する"""
+    target_key, value_key = ROW_KEYS[kind]
+    stores = _all_stores()
+    seen_lines = set()
+    frozen_dates = {}
+    bad_date_lines = set()
+    for cell in _cells(rows, kind):
+        if isinstance(cell, ImportIssue):
+            result.issues.append(cell)
+            if cell.row > 1:
+                seen_lines.add(cell.row)
+            continue
+        line, column, date_value, target, value = cell
+        seen_lines.add(line)
+        text = _cell_text(value)
+        if text is None:
+            continue
+        date = _parse_date(date_value)
+        if date is None:
+            # 日付の誤りは行ごとに1件だけ報告する
+            if line not in bad_date_lines:
+                bad_date_lines.add(line)
+                result.issues.append(ImportIssue(line, '日付', _cell_text(date_value) or '', '日付を解釈できません'))
+            continue
+        if target is None:
+            result.issues.append(ImportIssue(line, column, text, '対象の列が空欄です'))
+            continue
+        error = validate_shift(text, stores) if kind == IMPORT_SHIFTS else validate_help_time(text)
+        if error is None and is_frozen is not None:
+            if date not in frozen_dates:
+                frozen_dates[date] = is_frozen(date)
+            if frozen_dates[date]:
+                error = '確定済みの期間のため取り込めません'
+        if error is not None:
+            result.issues.append(ImportIssue(line, column, text, error))
+            continue
+        yield {'date': date.strftime('%Y-%m-%d'), target_key: target, value_key: text}
+    result.rows = len(seen_lines)
+
+
+def import_rows(rows, kind, save=None, skip_invalid=False, is_frozen=None, batch_size=IMPORT_BATCH, reread=None):
+    """行（read_rows の結果）を検証し、正しいセルを batch_size 件ずつ save(行の一覧) に渡す
+
+    save がNoneの場合は検証だけ行う。skip_invalid=False でエラーがあれば何も保存しない
+    （その場合は reread() で行を読み直して2回目に保存する）。
+    is_frozen(日付) が真の日付は取り込まない。
+    """
+    if kind not in IMPORT_KINDS:
+        raise ValueError(f'取り込みの種類が不正です: {kind}')
+    result = ImportResult()
+    if save is not None and not skip_invalid:
+        if reread is None:
+            raise ValueError('エラーのある行を除かずに取り込む場合は reread が必要です')
+        # 1回目は検証だけ行い、エラーがなければ読み直して保存する
+        for _ in _validate(rows, kind, is_frozen, result):
+            pass
+        if result.issues:
+            return result
+        rows = reread()
+        result = ImportResult()
+
+    # 同じセルが2回あれば後の値を使う（1回のupsertに同じキーを2回含めない）
+    target_key = ROW_KEYS[kind][0]
+    batch = {}
+    for row in _validate(rows, kind, is_frozen, result):
+        result.imported += 1
+        if save is None:
+            continue
+        batch[(row['date'], row[target_key])] = row
+        if len(batch) >= batch_size:
+            save(list(batch.values()))
+            batch = {}
+    if save is not None:
+        if batch:
+            save(list(batch.values()))
+        result.saved = True
+    return result
+
+
+def import_file(file, kind, save=None, filename=None, skip_invalid=False, is_frozen=None, batch_size=IMPORT_BATCH):
+    """CSV/Excelファイルを取り込む（import_rows を参照）"""
+    return import_rows(read_rows(file, filename), kind, save, skip_invalid, is_frozen, batch_size,
+                       reread=lambda: read_rows(file, filename))
@@ -0,0 +1,281 @@
+"""シフトの時間帯（従業員・日付・開始・終了・店舗）の索引と、重複・過不足のチェック
+
+シフト文字列は種類ごとに一度だけ解析し、期間内の全セルを配列に展開して保持する。
+    - 従業員の時間帯の重複（例: AM可,9-12@本店,11-14@武店）
+    - 店舗ヘルプ希望に対する不足・重複・希望のない店舗への割り当て
+を期間全体のレポートとして、また保存時に1セル分だけチェックできる。
+"""
+import re
+import functools
+import numpy as np
+import pandas as pd
+from utils import parse_shift
+
+# 9-12 / 9:30-12 / 9半-12 / 9時-12時半 / 13:00〜15:00 などの時間帯
+_TIME = r'(\d{1,2})(?:[:：](\d{2})|時?(半)|時)?'
+TIME_RANGE_PATTERN = re.compile(_TIME + r'\s*[-~〜～ー]\s*' + _TIME)
+
+INTERVAL_COLUMNS = ['date', 'employee', 'store', 'start', 'end']
+
+
+def _minutes(hour, minute, half):
+    return int(hour) * 60 + (30 if half else int(minute or 0))
+
+
+@functools.lru_cache(maxsize=8192)
+def parse_time_range(text):
+    """時間帯の文字列を (開始, 終了)（0時からの分）に変換（解釈できなければNone）"""
+    if not isinstance(text, str):
+        return None
+    match = TIME_RANGE_PATTERN.search(text)
+    if match is None:
+        return None
+    start = _minutes(*match.group(1, 2, 3))
+    end = _minutes(*match.group(4, 5, 6))
+    if end <= start:
+        return None
+    return start, end
+
+
+def parse_time_ranges(text):
+    """カンマ・読点区切りの複数の時間帯を (開始, 終了) の一覧に変換（解釈できないものは除く）"""
+    if not isinstance(text, str):
+        return []
+    ranges = (parse_time_range(part) for part in re.split(r'[,、]', text))
+    return [time_range for time_range in ranges if time_range is not None]
+
+
+def format_minutes(minutes):
+    return f'{minutes // 60}:{minutes % 60:02d}'
+
+
+def format_interval(start, end):
+    return f'{format_minutes(start)}-{format_minutes(end)}'
+
+
+@functools.lru_cache(maxsize=8192)
+def shift_intervals(shift):
+    """シフト文字列の時間帯を (開始, 終了, 店舗) のタプルで返す（時間を解釈できないものは除く）"""
+    if not isinstance(shift, str):
+        return ()
+    shift_type, times, stores = parse_shift(shift)
+    if shift_type == 'その他' and times:
+        # 「その他」は先頭が内容なので時間帯から除く
+        times = times[1:]
+    intervals = []
+    for time, store in zip(times, stores):
+        time_range = parse_time_range(time)
+        if time_range is not None:
+            intervals.append((time_range[0], time_range[1], store))
+    return tuple(intervals)
+
+
+@functools.lru_cache(maxsize=8192)
+def untimed_stores(shift):
+    """時間を解釈できない時間帯が割り当てられている店舗（例: 1日可,未定@本店）"""
+    if not isinstance(shift, str):
+        return ()
+    shift_type, times, stores = parse_shift(shift)
+    if shift_type == 'その他' and times:
+        times = times[1:]
+    return tuple(store for time, store in zip(times, stores) if store and parse_time_range(time) is None)
+
+
+def find_overlaps(intervals):
+    """(開始, 終了, 店舗) の一覧から、重なっている組み合わせを返す"""
+    ordered = sorted(intervals)
+    overlaps = []
+    for i, (start, end, store) in enumerate(ordered):
+        for other_start, other_end, other_store in ordered[i + 1:]:
+            if other_start >= end:
+                break
+            overlaps.append(((start, end, store), (other_start, other_end, other_store)))
+    return overlaps
+
+
+def _covered_minutes(window, intervals):
+    """window（開始, 終了）のうち、intervals のいずれかで埋まっている分数"""
+    window_start, window_end = window
+    covered = 0
+    cursor = window_start
+    for start, end in sorted(intervals):
+        start, end = max(start, cursor), min(end, window_end)
+        if end > start:
+            covered += end - start
+            cursor = end
+    return covered
+
+
+def _max_concurrent(intervals):
+    """同時に重なっている時間帯の最大数"""
+    events = sorted([(start, 1) for start, _ in intervals] + [(end, -1) for _, end in intervals])
+    current = peak = 0
+    for _, delta in events:
+        current += delta
+        peak = max(peak, current)
+    return peak
+
+
+class ShiftIntervalIndex:
+    """期間のシフト表（日付×従業員）から作る時間帯の索引"""
+
+    def __init__(self, shift_data):
+        values = shift_data.to_numpy().ravel()
+        # セルの値を種類ごとにまとめ、種類ごとに一度だけ解析する
+        codes, uniques = pd.factorize(values)
+        parsed = [shift_intervals(value) for value in uniques]
+        counts = np.array([len(intervals) for intervals in parsed] + [0], dtype=np.int64)
+        codes = np.where(codes < 0, len(parsed), codes)
+
+        cell_counts = counts[codes]
+        cells = np.flatnonzero(cell_counts)
+        repeats = cell_counts[cells]
+        cell_of_interval = np.repeat(cells, repeats)
+        # 種類ごとの時間帯を1列に並べた配列での位置
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        within = np.arange(repeats.sum()) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+        flat_index = offsets[codes[cell_of_interval]] + within
+        flat = [interval for intervals in parsed for interval in intervals]
+
+        n_columns = shift_data.shape[1]
+        self.intervals = pd.DataFrame({
+            'date': shift_data.index.to_numpy()[cell_of_interval // n_columns],
+            'employee': shift_data.columns.to_numpy()[cell_of_interval % n_columns],
+            'store': np.array([interval[2] for interval in flat], dtype=object)[flat_index],
+            'start': np.array([interval[0] for interval in flat], dtype=np.int64)[flat_index],
+            'end': np.array([interval[1] for interval in flat], dtype=np.int64)[flat_index],
+        }, columns=INTERVAL_COLUMNS)
+
+        # 時間なしで店舗だけ割り当てられているセル（少ないのでセルごとに展開する）
+        untimed = [untimed_stores(value) for value in uniques]
+        has_untimed = np.array([bool(stores) for stores in untimed] + [False])
+        self.untimed = pd.DataFrame([
+            (shift_data.index[cell // n_columns], shift_data.columns[cell % n_columns], store)
+            for cell in np.flatnonzero(has_untimed[codes]) for store in untimed[codes[cell]]
+        ], columns=['date', 'employee', 'store'])
+        self._shift_data = shift_data
+        self._by_store = None
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def _store_buckets(self):
+        # 店舗ごとの検索は保存のたびに使うため、初回に(日付, 店舗)ごとにまとめておく
+        if self._by_store is None:
+            by_store = {}
+            df = self.intervals
+            for date, store, employee, start, end in zip(df['date'], df['store'], df['employee'], df['start'], df['end']):
+                by_store.setdefault((pd.Timestamp(date), store), []).append((employee, int(start), int(end)))
+            self._by_store = by_store
+        return self._by_store
+
+    def store_intervals(self, date, store):
+        """日付・店舗の時間帯を (従業員, 開始, 終了) の一覧で返す"""
+        return self._store_buckets().get((pd.Timestamp(date), store), [])
+
+    def employee_overlaps(self):
+        """従業員の時間帯が重なっているセルの一覧（日付, 従業員, シフト, 時間帯, 重なる時間帯）"""
+        columns = ['date', 'employee', 'shift', 'interval', 'overlaps_with']
+        df = self.intervals.sort_values(['date', 'employee', 'start', 'end'], kind='mergesort').reset_index(drop=True)
+        if df.empty:
+            return pd.DataFrame(columns=columns)
+        # 同じ日付・従業員の中で、それより前に始まった時間帯の終了時刻の最大値と比べ、重なりのあるセルだけを残す
+        first = df['date'].ne(df['date'].shift()) | df['employee'].ne(df['employee'].shift())
+        previous_end = df.groupby(['date', 'employee'], sort=False)['end'].cummax().shift()
+        previous_end[first] = -1
+        flagged = df.loc[df['start'] < previous_end, ['date', 'employee']].drop_duplicates()
+        if flagged.empty:
+            return pd.DataFrame(columns=columns)
+
+        # 重なりのあるセルの時間帯どうしを組み合わせる（1セルの時間帯は数件なので組み合わせは少ない）
+        cells = df.reset_index().merge(flagged, on=['date', 'employee'])
+        pairs = cells.merge(cells, on=['date', 'employee'], suffixes=('', '_other'))
+        pairs = pairs[(pairs['index'] < pairs['index_other']) & (pairs['start_other'] < pairs['end'])]
+        shift_data = self._shift_data
+        return pd.DataFrame({
+            'date': pairs['date'].to_numpy(),
+            'employee': pairs['employee'].to_numpy(),
+            'shift': [shift_data.at[date, employee] for date, employee in zip(pairs['date'], pairs['employee'])],
+            'interval': [f'{format_interval(start, end)}@{store}' for start, end, store in zip(pairs['start'], pairs['end'], pairs['store'])],
+            'overlaps_with': [f'{format_interval(start, end)}@{store}'
+                              for start, end, store in zip(pairs['start_other'], pairs['end_other'], pairs['store_other'])],
+        }, columns=columns)
+
+    def store_coverage(self, store_help_requests):
+        """店舗ヘルプ希望ごとの割り当て状況（不足・重複・未割当・希望なし）の一覧
+
+        希望の時間帯は1人分として扱い、同じ時間に2人以上いれば「重複」とする。
+        """
+        rows = []
+        requested = set()
+        if store_help_requests is not None and not store_help_requests.empty:
+            stacked = store_help_requests.stack()
+            stacked = stacked[stacked.notna() & (stacked != '-') & (stacked != '')]
+            for (date, store), help_time in stacked.items():
+                date = pd.Timestamp(date)
+                requested.add((date, store))
+                rows.append(self._coverage_row(date, store, help_time, parse_time_ranges(help_time), self.store_intervals(date, store)))
+
+        # 希望のない店舗・日付への割り当て
+        for (date, store), assigned in self._store_buckets().items():
+            if store and (date, store) not in requested:
+                rows.append({'date': date, 'store': store, 'help_time': '', 'assigned': self._describe(assigned),
+                             'uncovered_minutes': 0, 'max_helpers': _max_concurrent([(start, end) for _, start, end in assigned]),
+                             'status': '希望なし'})
+        columns = ['date', 'store', 'help_time', 'assigned', 'uncovered_minutes', 'max_helpers', 'status']
+        return pd.DataFrame(rows, columns=columns).sort_values(['date', 'store'], kind='mergesort').reset_index(drop=True)
+
+    @staticmethod
+    def _describe(assigned):
+        return ', '.join(f'{employee} {format_interval(start, end)}' for employee, start, end in assigned)
+
+    def _coverage_row(self, date, store, help_time, windows, assigned):
+        spans = [(start, end) for _, start, end in assigned]
+        if windows:
+            uncovered = sum(end - start - _covered_minutes((start, end), spans) for start, end in windows)
+            # 希望の時間帯の中で同時にいる人数
+            clipped = [(max(start, window_start), min(end, window_end))
+                       for start, end in spans for window_start, window_end in windows
+                       if min(end, window_end) > max(start, window_start)]
+            max_helpers = _max_concurrent(clipped)
+        else:
+            # 時間を解釈できない希望は人数だけで判定する
+            uncovered = 0
+            max_helpers = len(spans)
+        if not spans:
+            status = '未割当'
+        elif max_helpers > 1:
+            status = '重複'
+        elif uncovered:
+            status = '不足'
+        else:
+            status = 'OK'
+        return {'date': date, 'store': store, 'help_time': help_time, 'assigned': self._describe(assigned),
+                'uncovered_minutes': uncovered, 'max_helpers': max_helpers, 'status': status}
+
+    def check_shift(self, date, employee, shift_str, store_help_requests=None):
+        """保存する前に1セル分のシフトをチェックし、(エラー, 警告) のメッセージの一覧を返す
+
+        エラー: 同じ従業員の時間帯が重なっている（保存しない）
+        警告: 同じ店舗・時間に他の従業員がいる、その日に店舗のヘルプ希望がない
+        """
+        date = pd.Timestamp(date)
+        intervals = shift_intervals(shift_str)
+        errors = [f"{format_interval(a[0], a[1])}@{a[2]} と {format_interval(b[0], b[1])}@{b[2]} の時間が重なっています"
+                  for a, b in find_overlaps(intervals)]
+
+        warnings = []
+        for start, end, store in intervals:
+            if not store:
+                continue
+            for other, other_start, other_end in self.store_intervals(date, store):
+                if other == employee or other_start >= end or other_end <= start:
+                    continue
+                warnings.append(f"{store}の{format_interval(other_start, other_end)}には{other}さんが入っています")
+            if store_help_requests is not None:
+                help_time = None
+                if date in store_help_requests.index and store in store_help_requests.columns:
+                    help_time = store_help_requests.at[date, store]
+                if help_time is None or pd.isna(help_time) or help_time in ('-', ''):
+                    warnings.append(f"{date:%m/%d}の{store}にはヘルプ希望がありません")
+        return errors, warnings
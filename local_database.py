@@ -0,0 +1,198 @@
+"""ローカルのSQLiteファイルを使うデータベース（SupabaseDB と同じメソッドを持つ）
+
+Supabaseに接続できない環境での動作確認や、1台だけで運用する場合に使う。
+HELP2_DATABASE=sqlite:///path/to/help2.db で有効になる。
+shift_days / store_help_days ビューは migrations/002_period_views.sql と同じ形のデータを返す。
+"""
+import os
+import json
+import sqlite3
+import threading
+import pandas as pd
+from database import SaveResult, show_error
+from profiling import timed_function
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS shifts (date TEXT NOT NULL, employee TEXT NOT NULL, shift TEXT, '
+    "version INTEGER NOT NULL DEFAULT 1, updated_at TEXT NOT NULL DEFAULT (datetime('now')), PRIMARY KEY (date, employee))",
+    'CREATE TABLE IF NOT EXISTS store_help_requests (date TEXT NOT NULL, store TEXT NOT NULL, help_time TEXT, '
+    'PRIMARY KEY (date, store))',
+    'CREATE VIEW IF NOT EXISTS shift_days AS SELECT date, json_group_object(employee, shift) AS shifts, '
+    'json_group_object(employee, version) AS versions FROM shifts GROUP BY date',
+    'CREATE VIEW IF NOT EXISTS store_help_days AS SELECT date, json_group_object(store, help_time) AS help_times '
+    'FROM store_help_requests GROUP BY date',
+    # 組織のマスタ（migrations/003_organisation.sql と同じ。変更のたびに organisation_meta.version を上げる）
+    'CREATE TABLE IF NOT EXISTS employees (name TEXT PRIMARY KEY, area TEXT NOT NULL, sort_order INTEGER NOT NULL DEFAULT 0)',
+    'CREATE TABLE IF NOT EXISTS stores (name TEXT PRIMARY KEY, area TEXT NOT NULL, color TEXT, sort_order INTEGER NOT NULL DEFAULT 0)',
+    'CREATE TABLE IF NOT EXISTS organisation_meta (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL DEFAULT 0)',
+    'INSERT OR IGNORE INTO organisation_meta (id, version) VALUES (1, 0)',
+] + [
+    f'CREATE TRIGGER IF NOT EXISTS {table}_bump_organisation_version_{event.lower()} AFTER {event} ON {table} '
+    'BEGIN UPDATE organisation_meta SET version = version + 1 WHERE id = 1; END'
+    for table in ('employees', 'stores') for event in ('INSERT', 'UPDATE', 'DELETE')
+]
+
+# 同じ(日付, 従業員)への保存はバージョンを上げる（Supabaseのトリガーと同じ動作）
+UPSERT_SHIFT = ('INSERT INTO shifts (date, employee, shift) VALUES (?, ?, ?) '
+                "ON CONFLICT (date, employee) DO UPDATE SET shift = excluded.shift, version = version + 1, updated_at = datetime('now')")
+
+
+def _date_str(date):
+    return pd.Timestamp(date).strftime('%Y-%m-%d')
+
+
+class SQLiteDB:
+    # 日付ごとに集計済みのビューと組織のマスタのテーブルを常に使う
+    period_views = True
+    organisation_tables = True
+
+    def __init__(self, path):
+        self.path = path
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        with self._connection() as conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            if self.path != ':memory:':
+                conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def _shift_row(self, conn, date_str, employee):
+        row = conn.execute('SELECT date, employee, shift, version, updated_at FROM shifts WHERE date = ? AND employee = ?',
+                           (date_str, employee)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('date', 'employee', 'shift', 'version', 'updated_at'), row))
+
+    @timed_function('db.init_db')
+    def init_db(self):
+        try:
+            self._connection().execute('SELECT 1 FROM shifts LIMIT 1')
+            return True
+        except Exception as e:
+            show_error(f"データベース接続エラー: {e}")
+            return False
+
+    @timed_function('db.get_shift_rows')
+    def get_shift_rows(self, start_date, end_date):
+        """シフトを1行1セルの形式で取得"""
+        df = pd.read_sql_query('SELECT date, employee, shift, version FROM shifts WHERE date BETWEEN ? AND ?',
+                               self._connection(), params=(_date_str(start_date), _date_str(end_date)))
+        if df.empty:
+            return pd.DataFrame()
+        df['date'] = pd.to_datetime(df['date'])
+        return df
+
+    @timed_function('db.get_shifts')
+    def get_shifts(self, start_date, end_date):
+        df = self.get_shift_rows(start_date, end_date)
+        if df.empty:
+            return df
+        return df.pivot(index='date', columns='employee', values='shift')
+
+    @timed_function('db.get_shift_days')
+    def get_shift_days(self, start_date, end_date):
+        """期間のシフトを日付ごとの (日付, {従業員: シフト}, {従業員: バージョン}) の一覧で取得（shift_days ビュー）"""
+        rows = self._connection().execute('SELECT date, shifts, versions FROM shift_days WHERE date BETWEEN ? AND ? ORDER BY date',
+                                          (_date_str(start_date), _date_str(end_date))).fetchall()
+        return [(pd.Timestamp(date), json.loads(shifts), json.loads(versions)) for date, shifts, versions in rows]
+
+    @timed_function('db.save_shift')
+    def save_shift(self, date, employee, shift_str, expected_version=None):
+        try:
+            return self.save_shift_row(date, employee, shift_str, expected_version)
+        except Exception as e:
+            show_error(f"シフトの保存エラー: {e}")
+            return SaveResult(False)
+
+    def save_shift_row(self, date, employee, shift_str, expected_version=None):
+        """シフトを保存する（expected_version の扱いは save_shift_versioned と同じ）"""
+        date_str = _date_str(date)
+        with self._connection() as conn:
+            if expected_version is None:
+                conn.execute(UPSERT_SHIFT, (date_str, employee, shift_str))
+                return SaveResult(True, row=self._shift_row(conn, date_str, employee))
+            if int(expected_version) == 0:
+                saved = conn.execute('INSERT INTO shifts (date, employee, shift) VALUES (?, ?, ?) ON CONFLICT DO NOTHING',
+                                     (date_str, employee, shift_str)).rowcount
+            else:
+                saved = conn.execute("UPDATE shifts SET shift = ?, version = version + 1, updated_at = datetime('now') "
+                                     'WHERE date = ? AND employee = ? AND version = ?',
+                                     (shift_str, date_str, employee, int(expected_version))).rowcount
+            row = self._shift_row(conn, date_str, employee)
+        return SaveResult(bool(saved), conflict=not saved, row=row)
+
+    @timed_function('db.save_shifts')
+    def save_shifts(self, rows):
+        """複数のシフト（date, employee, shift）を1つのトランザクションで保存し、保存後の行を返す"""
+        with self._connection() as conn:
+            conn.executemany(UPSERT_SHIFT, [(_date_str(row['date']), row['employee'], row['shift']) for row in rows])
+            return [self._shift_row(conn, _date_str(row['date']), row['employee']) for row in rows]
+
+    @timed_function('db.save_store_help_request')
+    def save_store_help_request(self, date, store, help_time):
+        try:
+            self.save_store_help_requests([{'date': date, 'store': store, 'help_time': help_time}])
+            return True
+        except Exception as e:
+            show_error(f"店舗ヘルプ希望の保存エラー: {e}")
+            return False
+
+    @timed_function('db.save_store_help_requests')
+    def save_store_help_requests(self, rows):
+        with self._connection() as conn:
+            conn.executemany('INSERT INTO store_help_requests (date, store, help_time) VALUES (?, ?, ?) '
+                             'ON CONFLICT (date, store) DO UPDATE SET help_time = excluded.help_time',
+                             [(_date_str(row['date']), row['store'], row['help_time']) for row in rows])
+
+    @timed_function('db.get_store_help_requests')
+    def get_store_help_requests(self, start_date, end_date):
+        df = pd.read_sql_query('SELECT date, store, help_time FROM store_help_requests WHERE date BETWEEN ? AND ?',
+                               self._connection(), params=(_date_str(start_date), _date_str(end_date)))
+        if df.empty:
+            return pd.DataFrame()
+        df['date'] = pd.to_datetime(df['date'])
+        pivot_df = df.pivot(index='date', columns='store', values='help_time').fillna('-')
+        from organisation import current_organisation
+        all_stores = current_organisation().stores
+        return pivot_df.reindex(columns=list(pivot_df.columns) + [store for store in all_stores if store not in pivot_df.columns],
+                                fill_value='-')
+
+    @timed_function('db.get_store_help_days')
+    def get_store_help_days(self, start_date, end_date):
+        """期間の店舗ヘルプ希望を日付ごとの (日付, {店舗: 時間帯}) の一覧で取得（store_help_days ビュー）"""
+        rows = self._connection().execute('SELECT date, help_times FROM store_help_days WHERE date BETWEEN ? AND ? ORDER BY date',
+                                          (_date_str(start_date), _date_str(end_date))).fetchall()
+        return [(pd.Timestamp(date), json.loads(help_times)) for date, help_times in rows]
+
+    @timed_function('db.get_organisation_version')
+    def get_organisation_version(self):
+        row = self._connection().execute('SELECT version FROM organisation_meta WHERE id = 1').fetchone()
+        return row[0] if row else 0
+
+    @timed_function('db.get_organisation')
+    def get_organisation(self):
+        conn = self._connection()
+        employees = [dict(zip(('name', 'area', 'sort_order'), row))
+                     for row in conn.execute('SELECT name, area, sort_order FROM employees').fetchall()]
+        stores = [dict(zip(('name', 'area', 'color', 'sort_order'), row))
+                  for row in conn.execute('SELECT name, area, color, sort_order FROM stores').fetchall()]
+        return employees, stores
+
+    @timed_function('db.save_organisation')
+    def save_organisation(self, employee_rows, store_rows):
+        """従業員・店舗の一覧を1つのトランザクションで置き換える"""
+        with self._connection() as conn:
+            conn.execute('DELETE FROM employees')
+            conn.execute('DELETE FROM stores')
+            conn.executemany('INSERT INTO employees (name, area, sort_order) VALUES (?, ?, ?)',
+                             [(row['name'], row['area'], row.get('sort_order') or 0) for row in employee_rows])
+            conn.executemany('INSERT INTO stores (name, area, color, sort_order) VALUES (?, ?, ?, ?)',
+                             [(row['name'], row['area'], row.get('color'), row.get('sort_order') or 0) for row in store_rows])
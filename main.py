@@ -1,75 +1,317 @@
 import streamlit as st
 st.set_page_config(layout="wide")
 
-@st.cache_data(ttl=3600)
-def get_cached_shifts(year, month):
-    start_date = pd.Timestamp(year, month, 16)
-    end_date = start_date + pd.DateOffset(months=1) - pd.Timedelta(days=1)
-    return db.get_shifts(start_date, end_date)
-
 import pandas as pd
 from datetime import datetime
 import io
 import base64
+import os
 import asyncio
-from database import db
-from pdf_generator import generate_help_table_pdf, generate_individual_pdf, generate_store_pdf
-from constants import EMPLOYEES, EMPLOYEE_AREAS, SHIFT_TYPES, STORE_COLORS, WEEKDAY_JA, AREAS
-from utils import parse_shift, format_shifts, update_session_state_shifts, highlight_weekend_and_holiday, highlight_filled_shifts
+from database import db, DatabaseUnavailableError
+from pdf_cache import pdf_cache
+from period import build_store_pdf_data, apply_shift_overlay
+from profiling import timed, timed_function, start_rerun, profile_rerun, render_debug_panel
+from period_cache import period_cache, start_cache_warmer, load_period_data, period_of, adjacent_periods, KIND_SHIFTS, KIND_HELP_REQUESTS
+from change_feed import change_feed, ChangeEvent, CHANGE_SHIFT, CHANGE_STORE_HELP
+from write_queue import write_queue, start_write_flusher, FrozenPeriodError, WRITE_SHIFT, WRITE_STORE_HELP
+from frozen_periods import frozen_periods
+from rollups import rollup_store, COLUMN_LABELS as ROLLUP_LABELS
+from intervals import ShiftIntervalIndex
+from importer import import_file, IMPORT_SHIFTS, IMPORT_HELP_REQUESTS
+from exporter import export_data, FORMATS, LAYOUT_LONG, LAYOUT_PIVOT
+from period_range import employee_range_summary, store_range_summary, periods_in_range, fiscal_year_range, fiscal_year_of, COLUMN_LABELS as RANGE_LABELS
+from fulfilment import fulfilment_report, summarize_fulfilment, fulfilment_styles, to_csv_bytes, COLUMN_LABELS as FULFILMENT_LABELS
+from constants import SHIFT_TYPES, EDITABLE_SHIFT_TYPES, WEEKDAY_JA
+from organisation import current_organisation, organisation_loader, organisation_from_lists
+from tenants import TENANTS, get_tenant, default_tenant, set_current_tenant
+from utils import parse_shift, highlight_weekend_and_holiday, calculate_shift_count, shift_formatter, label_columns
+
+# 他のセッションの保存を確認する間隔（秒）。0なら自動で確認しない
+LIVE_UPDATE_INTERVAL = int(os.environ.get('HELP2_LIVE_UPDATE_INTERVAL', 10))
+
+def select_tenant():
+    """セッションのテナント（サイドバーの選択 → ?tenant=ID → 既定の順）を現在のテナントにする
+
+    テナントを切り替えた場合は、前のテナントの編集中の内容・購読などセッションの状態をすべて破棄する。
+    テナントはアクセス制御ではない（誰でも ?tenant=ID で切り替えられる。tenants.py を参照）。
+    """
+    tenant_id = st.session_state.get('tenant_selector') or st.query_params.get('tenant') or default_tenant().id
+    try:
+        tenant = get_tenant(tenant_id)
+    except ValueError as e:
+        st.error(str(e))
+        st.stop()
+    if st.session_state.get('tenant') not in (None, tenant.id):
+        subscription = st.session_state.get('change_subscription')
+        if subscription is not None:
+            subscription.close()
+        for key in [key for key in st.session_state if key != 'tenant_selector']:
+            del st.session_state[key]
+    st.session_state.tenant = tenant.id
+    if len(TENANTS) > 1:
+        st.query_params['tenant'] = tenant.id
+    return set_current_tenant(tenant)
+
+def _load_period_data(kind, year, month):
+    return load_period_data(db, kind, year, month)
+
+def get_cached_shift_snapshot(year, month):
+    return period_cache.get(KIND_SHIFTS, year, month, _load_period_data)
+
+def get_cached_shifts(year, month):
+    # 全セッションで共有する期間のシフト表（読み取り専用。変更する場合はコピーする）
+    return get_cached_shift_snapshot(year, month).frame
+
+def get_cached_store_help_requests(year, month):
+    try:
+        return period_cache.get(KIND_HELP_REQUESTS, year, month, _load_period_data).copy()
+    except DatabaseUnavailableError as e:
+        # 一度も読み込めていない期間はヘルプ希望なしとして表示する
+        st.error(f"店舗ヘルプ希望の取得エラー: {e}")
+        return pd.DataFrame()
+
+def patch_shift_snapshots(rows):
+    """保存した行だけを共有のシフト表に反映する（期間全体は再読み込みしない）"""
+    rows_by_period = {}
+    for row in rows:
+        rows_by_period.setdefault(period_of(row['date']), []).append(row)
+    for (year, month), period_rows in rows_by_period.items():
+        period_cache.patch(KIND_SHIFTS, year, month, lambda snapshot, period_rows=period_rows: snapshot.with_rows(period_rows))
+
+def invalidate_periods(kind, dates):
+    """保存した日付を含む期間のキャッシュを破棄し、前後の期間はバックグラウンドで再読み込みする"""
+    periods = {period_of(d) for d in dates}
+    for year, month in periods:
+        period_cache.invalidate(kind, year, month)
+    neighbours = {p for year, month in periods for p in adjacent_periods(year, month)}
+    start_cache_warmer(db).request_refresh({(kind, year, month) for year, month in neighbours})
+
+def get_change_subscription(year, month):
+    """セッションの変更フィードの購読を返す（表示中の期間のイベントだけを受け取る）"""
+    subscription = st.session_state.get('change_subscription')
+    if subscription is None:
+        subscription = change_feed.subscribe()
+        st.session_state.change_subscription = subscription
+    subscription.set_periods([(year, month)])
+    return subscription
+
+def update_rollups(rows):
+    """保存した従業員の、その期間の集計だけを作り直す（共有のシフト表がなければ期間を読み込む）"""
+    employees_by_period = {}
+    for row in rows:
+        employees_by_period.setdefault(period_of(row['date']), set()).add(row['employee'])
+    for (year, month), employees in employees_by_period.items():
+        try:
+            snapshot = period_cache.peek(KIND_SHIFTS, year, month) or load_period_data(db, KIND_SHIFTS, year, month)
+            rollup_store.update_period(year, month, snapshot.frame, sorted(employees))
+        except Exception:
+            # 作り直せなかった期間は集計の画面に表示し、rollup-backfill で作り直す
+            rollup_store.mark_incomplete(year, month)
+
+def on_writes_flushed(flushed):
+    """書き込みキューから送信できた保存を共有の表に反映し、開いているセッションへ通知する（送信スレッドから呼ばれる）"""
+    # 保存した行（競合した場合は最新の行）だけを共有のシフト表に反映
+    shift_rows = [write.row for write in flushed if write.kind == WRITE_SHIFT]
+    patch_shift_snapshots(shift_rows)
+    update_rollups(shift_rows)
+    help_dates = [write.payload['date'] for write in flushed if write.kind == WRITE_STORE_HELP]
+    if help_dates:
+        invalidate_periods(KIND_HELP_REQUESTS, help_dates)
+    for write in flushed:
+        if write.kind == WRITE_SHIFT:
+            event = (CHANGE_SHIFT, write.row['date'], write.row['employee'], write.row['shift'], write.row.get('version'))
+        else:
+            event = (CHANGE_STORE_HELP, write.payload['date'], write.payload['store'], write.payload['help_time'], None)
+        kind, date, key, value, version = event
+        year, month = period_of(date)
+        change_feed.publish(ChangeEvent(kind, year, month, pd.Timestamp(date), key, value, version, write.payload.get('source')))
+
+@timed_function()
+def apply_change_events(subscription):
+    """保存された変更をセッションの差分に反映する
+
+    共有の表は送信したプロセスが on_writes_flushed で1回だけ更新するため、ここでは更新しない。
+    """
+    events = subscription.drain()
+    if subscription.dropped:
+        # 取りこぼしがあれば購読中の期間を読み込み直す
+        subscription.dropped = False
+        for year, month in {event.period for event in events}:
+            period_cache.invalidate(KIND_SHIFTS, year, month)
+            period_cache.invalidate(KIND_HELP_REQUESTS, year, month)
+        st.session_state.shift_overlay = {}
+        return
+
+    for event in events:
+        # 店舗ヘルプ希望は送信したプロセスが期間のキャッシュを破棄済み
+        if event.kind == CHANGE_SHIFT and event.source != subscription.id:
+            # 他のユーザーの保存が新しいので、このセッションの未反映の編集は表示しない
+            st.session_state.shift_overlay.pop((event.date, event.key), None)
+
+def prune_shift_overlay():
+    """送信し終えた（保存できた・競合した）保存の編集をセッションの差分から削除する
+
+    値が共有の表と一致したかではなく、書き込みキューに残っているかで判断するため、
+    他のプロセスで送信された場合や、その後に他のユーザーが更新した場合も古い編集を表示し続けない。
+    """
+    overlay = st.session_state.get('shift_overlay')
+    if not overlay:
+        return
+    pending = write_queue.pending_shifts(list(overlay))
+    for key in [key for key in overlay if key not in pending]:
+        del overlay[key]
+
+def pop_shift_conflicts(subscription):
+    """このセッションの保存のうち、他のユーザーが先に更新していて保存されなかったものを返す
+
+    送信結果が届いた直後にも画面が再実行されるため、次に保存するか期間を変えるまで表示し続ける。
+    """
+    conflicts = write_queue.pop_conflicts(subscription.id)
+    for conflict in conflicts:
+        st.session_state.shift_overlay.pop((pd.Timestamp(conflict['date']), conflict['employee']), None)
+    st.session_state.shift_conflicts = st.session_state.get('shift_conflicts', []) + conflicts
+    return st.session_state.shift_conflicts
+
+def show_stale_data_warning(year, month):
+    # データベースに接続できず、最後に読み込めたデータを表示している場合に知らせる
+    stale_since = [period_cache.stale_since(kind, year, month) for kind in (KIND_SHIFTS, KIND_HELP_REQUESTS)]
+    stale_since = [stored_at for stored_at in stale_since if stored_at is not None]
+    if stale_since:
+        st.warning(f"データベースに接続できないため、{datetime.fromtimestamp(min(stale_since)):%m/%d %H:%M}時点のデータを表示しています。"
+                   "接続が回復すると自動的に最新のデータに切り替わります。")
+
+@st.experimental_fragment(run_every=LIVE_UPDATE_INTERVAL or None)
+def watch_changes():
+    # 他のセッションの保存を受け取っていれば画面全体を再実行して反映する
+    subscription = st.session_state.get('change_subscription')
+    if subscription is not None and subscription.pending():
+        st.experimental_rerun()
 
 async def save_shift_async(date, employee, shift_str, repeat_weekly=False, selected_dates=None):
-    if not repeat_weekly:
-        await asyncio.to_thread(db.save_shift, date, employee, shift_str)
-    else:
-        # 選択された日付のみ保存
-        for target_date in selected_dates:
-            await asyncio.to_thread(db.save_shift, target_date, employee, shift_str)
-    
-    current_month = date.replace(day=1)
-    next_month = current_month + pd.DateOffset(months=1)
-    previous_month = current_month - pd.DateOffset(months=1)
+    # 繰り返し登録の場合は選択された日付のみ保存
+    target_dates = selected_dates if repeat_weekly else [date]
+    writes = []
+    errors = []
+    warnings = []
+    for target_date in target_dates:
+        target_date = pd.Timestamp(target_date)
+        year, month = period_of(target_date)
+        snapshot = get_cached_shift_snapshot(year, month)
+        # 同じ従業員の時間帯の重複は保存せず、店舗の重複・希望のない店舗は警告だけ表示する
+        date_errors, date_warnings = snapshot.interval_index().check_shift(
+            target_date, employee, shift_str, get_cached_store_help_requests(year, month))
+        errors += [f"{target_date:%Y/%m/%d} {employee}さん: {message}" for message in date_errors]
+        warnings += [f"{target_date:%Y/%m/%d} {employee}さん: {message}" for message in date_warnings]
+        # 読み込んだときのバージョンを渡し、他のユーザーの更新を上書きしないようにする
+        writes.append((target_date, employee, shift_str, snapshot.expected_version(target_date, employee)))
+    st.session_state.shift_conflicts = []
+    st.session_state.shift_check = {'errors': errors, 'warnings': warnings}
+    if errors:
+        st.experimental_rerun()
     
-    # キャッシュをクリア
-    get_cached_shifts.clear()
-    get_cached_shifts(current_month.year, current_month.month)
-    get_cached_shifts(next_month.year, next_month.month)
-    get_cached_shifts(previous_month.year, previous_month.month)
+    # 繰り返し登録の全日付を1回でキューに書き込み、データベースへはバックグラウンドで送信する
+    try:
+        write_queue.enqueue_shifts(writes, source=st.session_state.change_subscription.id)
+    except FrozenPeriodError as e:
+        # 画面を開いた後に他のユーザーが期間を確定した場合
+        st.session_state.shift_check = {'errors': [str(e)], 'warnings': warnings}
+        st.experimental_rerun()
+    for target_date, _, _, _ in writes:
+        # 送信して共有スナップショットに反映されるまでは、セッションの差分として表示する
+        st.session_state.shift_overlay[(target_date, employee)] = shift_str
+    st.session_state.editing_shift = False
     
     st.experimental_rerun()
 
+def save_assignment_plan(plan, year, month):
+    """割り当て案のシフトをまとめてキューに書き込む"""
+    snapshot = get_cached_shift_snapshot(year, month)
+    writes = [(row['date'], row['employee'], row['shift'], snapshot.expected_version(row['date'], row['employee']))
+              for row in plan.shift_rows()]
+    try:
+        write_queue.enqueue_shifts(writes, source=st.session_state.change_subscription.id)
+    except FrozenPeriodError as e:
+        st.session_state.shift_check = {'errors': [str(e)], 'warnings': []}
+        st.experimental_rerun()
+    for target_date, employee, shift_str, _ in writes:
+        st.session_state.shift_overlay[(target_date, employee)] = shift_str
+    st.session_state.shift_conflicts = []
+    st.session_state.shift_check = {'errors': [], 'warnings': []}
+    del st.session_state.assignment_plan
+    st.experimental_rerun()
+
+def save_imported_shifts(rows):
+    # 一括取り込みはファイルの内容で上書きする（バージョンは確認しない）
+    write_queue.enqueue_shifts([(row['date'], row['employee'], row['shift'], None) for row in rows],
+                               source=st.session_state.change_subscription.id)
+    for row in rows:
+        st.session_state.shift_overlay[(pd.Timestamp(row['date']), row['employee'])] = row['shift']
+
+def save_imported_store_help_requests(rows):
+    write_queue.enqueue_store_help_requests([(row['date'], row['store'], row['help_time']) for row in rows],
+                                            source=st.session_state.change_subscription.id)
+
+def run_import(uploaded_file, kind, skip_invalid):
+    """アップロードされたファイルを検証し、正しいセルをまとめてキューに書き込む"""
+    save = save_imported_shifts if kind == IMPORT_SHIFTS else save_imported_store_help_requests
+    try:
+        result = import_file(uploaded_file, kind, save, filename=uploaded_file.name, skip_invalid=skip_invalid,
+                             is_frozen=lambda date: frozen_periods.is_frozen(*period_of(date)))
+    except ValueError as e:
+        st.session_state.import_result = None
+        st.error(f"ファイルを読み込めませんでした: {e}")
+        return
+    st.session_state.import_result = result
+    if result.saved and result.imported:
+        st.experimental_rerun()
+
+def display_import_result():
+    result = st.session_state.get('import_result')
+    if result is None:
+        return
+    if result.saved:
+        st.success(f"{result.imported}件を取り込みました（{result.rows}行）")
+    elif result.issues:
+        st.error(f"エラーが{len(result.issues)}件あるため取り込んでいません。修正するか、エラーのあるセルを除いて取り込んでください。")
+    if result.issues:
+        st.dataframe(result.issues_frame(), hide_index=True, use_container_width=True)
+
+def _load_range_period(kind, year, month):
+    """範囲の出力・集計用に期間の表を読み込む（キャッシュにない期間は読み込んでもキャッシュに残さない）"""
+    data = period_cache.peek(kind, year, month)
+    if data is None:
+        data = load_period_data(db, kind, year, month)
+    return data.frame if kind == KIND_SHIFTS else data
+
+def create_export(kind, layout, fmt, start_date, end_date):
+    """保存済みのデータ（期間ごとのスナップショット）を出力し、ダウンロードするファイルをセッションに保持する"""
+    buffer = io.BytesIO()
+    try:
+        rows = export_data(_load_range_period, kind, layout, fmt, buffer, start_date, end_date)
+    except (ValueError, DatabaseUnavailableError) as e:
+        st.session_state.export_file = None
+        st.error(f"出力できませんでした: {e}")
+        return
+    name = 'シフト' if kind == KIND_SHIFTS else '店舗ヘルプ希望'
+    file_name = f'{name}_{start_date.strftime("%Y%m%d")}-{end_date.strftime("%Y%m%d")}.{fmt}'
+    st.session_state.export_file = (file_name, buffer.getvalue(), FORMATS[fmt], rows)
+
 def initialize_shift_data(year, month):
-    if 'shift_data' not in st.session_state or st.session_state.current_year != year or st.session_state.current_month != month:
-        start_date = pd.Timestamp(year, month, 16)
-        end_date = start_date + pd.DateOffset(months=1) - pd.Timedelta(days=1)
-        date_range = pd.date_range(start=start_date, end=end_date)
-        st.session_state.shift_data = pd.DataFrame(
-            index=date_range,
-            columns=EMPLOYEES,
-            data='-'
-        )
+    # シフトの表は全セッションで共有し、セッションには未反映の編集（差分）だけを保持する
+    if 'shift_overlay' not in st.session_state or st.session_state.current_year != year or st.session_state.current_month != month:
+        st.session_state.shift_overlay = {}
+        st.session_state.shift_conflicts = []
+        st.session_state.shift_check = {'errors': [], 'warnings': []}
         st.session_state.current_year = year
         st.session_state.current_month = month
 
-def calculate_shift_count(shift_data):
-    def count_shift(shift):
-        if pd.isna(shift) or shift == '-':
-            return 0
-        shift_type = shift.split(',')[0] if ',' in shift else shift
-        if shift_type in ['1日可', '鹿屋', 'かご北', 'リクルート'] or shift_type.startswith('その他'):
-            return 1
-        elif shift_type in ['AM可', 'PM可']:
-            return 0.5
-        return 0
-
-    # 変更前
-    return shift_data.applymap(count_shift).sum()
-
-def display_shift_table(selected_year, selected_month):
+@timed_function()
+def display_shift_table(selected_year, selected_month, shift_data):
     start_date = pd.Timestamp(selected_year, selected_month, 16)
     end_date = start_date + pd.DateOffset(months=1) - pd.Timedelta(days=1)
     
     date_range = pd.date_range(start=start_date, end=end_date)
-    display_data = st.session_state.shift_data.loc[start_date:end_date].copy()
+    display_data = shift_data.loc[start_date:end_date].copy()
     
     for date in date_range:
         if date not in display_data.index:
@@ -103,11 +345,12 @@ def display_shift_table(selected_year, selected_month):
     """, unsafe_allow_html=True)
 
     # エリアタブの作成
-    tabs = st.tabs(list(EMPLOYEE_AREAS.keys()))
+    organisation = current_organisation()
+    tabs = st.tabs(list(organisation.employee_areas.keys()))
     
-    for area, tab in zip(EMPLOYEE_AREAS.keys(), tabs):
+    for area, tab in zip(organisation.employee_areas.keys(), tabs):
         with tab:
-            area_employees = EMPLOYEE_AREAS[area]
+            area_employees = organisation.employee_areas[area]
             area_display_data = display_data[['日付', '曜日'] + area_employees]
             
             items_per_page = 15
@@ -137,7 +380,7 @@ def display_shift_table(selected_year, selected_month):
             
             # テーブルの表示
             page_display_data = page_display_data.reset_index(drop=True)
-            styled_df = page_display_data.style.format(format_shifts, subset=area_employees)\
+            styled_df = page_display_data.style.format(shift_formatter(), subset=area_employees)\
                                             .apply(highlight_weekend_and_holiday, axis=1)
             
             st.write(styled_df.hide(axis="index").to_html(escape=False), unsafe_allow_html=True)
@@ -152,7 +395,8 @@ def display_shift_table(selected_year, selected_month):
 
             # エリアごとのPDFダウンロードボタン
             if st.button(f"{area}のヘルプ表をPDFでダウンロード", key=f'pdf_download_{area}'):
-                pdf = generate_help_table_pdf(area_display_data, selected_year, selected_month, area)
+                from pdf_generator import generate_help_table_pdf
+                pdf = pdf_cache.get_or_generate(generate_help_table_pdf, area_display_data, selected_year, selected_month, area)
                 st.download_button(
                     label=f"{area}のヘルプ表PDFをダウンロード",
                     data=pdf,
@@ -173,6 +417,7 @@ def initialize_session_state():
 
 def update_shift_input(current_shift, employee, date, selected_year, selected_month):
     initialize_session_state()
+    organisation = current_organisation()
     
     if not st.session_state.editing_shift:
         st.session_state.current_shift = current_shift
@@ -181,9 +426,9 @@ def update_shift_input(current_shift, employee, date, selected_year, selected_mo
     shift_type, times, stores = parse_shift(st.session_state.current_shift)
     
     # シフト種類選択
-    new_shift_type = st.selectbox('種類', ['AM可', 'PM可', '1日可', '-', '休み', '鹿屋', 'かご北', 'リクルート', 'その他'], 
-                                 index=['AM可', 'PM可', '1日可', '-', '休み', '鹿屋', 'かご北', 'リクルート', 'その他'].index(shift_type) 
-                                 if shift_type in ['AM可', 'PM可', '1日可', '休み', '鹿屋', 'かご北', 'リクルート', 'その他'] else 3)
+    new_shift_type = st.selectbox('種類', EDITABLE_SHIFT_TYPES, 
+                                 index=EDITABLE_SHIFT_TYPES.index(shift_type) 
+                                 if shift_type in EDITABLE_SHIFT_TYPES else EDITABLE_SHIFT_TYPES.index('-'))
         
     if new_shift_type in ['AM可', 'PM可', '1日可']:
         num_shifts = st.number_input('シフト数', min_value=1, max_value=5, value=len(times) or 1)
@@ -193,12 +438,12 @@ def update_shift_input(current_shift, employee, date, selected_year, selected_mo
         for i in range(num_shifts):
             col1, col2, col3 = st.columns(3)
             with col1:
-                area_options = list(AREAS.keys())
-                current_area = next((area for area, stores_list in AREAS.items() if stores[i] in stores_list), area_options[0]) if i < len(stores) else area_options[0]
+                area_options = list(organisation.areas.keys())
+                current_area = next((area for area, stores_list in organisation.areas.items() if stores[i] in stores_list), area_options[0]) if i < len(stores) else area_options[0]
                 area = st.selectbox(f'エリア {i+1}', area_options, index=area_options.index(current_area), key=f'shift_area_{i}')
                 
             with col2:
-                store_options = [''] + AREAS[area] if area != 'なし' else ['']
+                store_options = [''] + organisation.areas[area] if area != 'なし' else ['']
                 current_store = stores[i] if i < len(stores) and stores[i] in store_options else ''
                 store = st.selectbox(f'店舗 {i+1}', store_options, index=store_options.index(current_store), key=f'shift_store_{i}')
             
@@ -236,12 +481,12 @@ def update_shift_input(current_shift, employee, date, selected_year, selected_mo
             for i in range(num_shifts):
                 col1, col2, col3 = st.columns(3)
                 with col1:
-                    area_options = list(AREAS.keys())
-                    current_area = next((area for area, stores_list in AREAS.items() if stores[i] in stores_list), area_options[0]) if i < len(stores) else area_options[0]
+                    area_options = list(organisation.areas.keys())
+                    current_area = next((area for area, stores_list in organisation.areas.items() if stores[i] in stores_list), area_options[0]) if i < len(stores) else area_options[0]
                     area = st.selectbox(f'エリア {i+1}', area_options, index=area_options.index(current_area), key=f'other_shift_area_{i}')
                     
                 with col2:
-                    store_options = [''] + AREAS[area] if area != 'なし' else ['']
+                    store_options = [''] + organisation.areas[area] if area != 'なし' else ['']
                     current_store = stores[i] if i < len(stores) and stores[i] in store_options else ''
                     store = st.selectbox(f'店舗 {i+1}', store_options, index=store_options.index(current_store), key=f'other_shift_store_{i}')
                 
@@ -362,34 +607,37 @@ def register_store_help(help_date, store, help_time, selected_year, selected_mon
 async def save_store_help_async(help_date, store, help_time, repeat_weekly=False, selected_dates=None):
     if not repeat_weekly:
         # 単一日付の登録
-        db.save_store_help_request(help_date, store, help_time)
+        target_dates = [help_date]
     else:
         # 選択された日付すべてに登録
-        for target_date in selected_dates:
-            db.save_store_help_request(target_date, store, help_time)
+        target_dates = selected_dates
+    
+    # 送信できたら期間のキャッシュを破棄して開いているセッションへ通知する（on_writes_flushed）
+    write_queue.enqueue_store_help_requests([(target_date, store, help_time) for target_date in target_dates],
+                                            source=st.session_state.change_subscription.id)
 
-def display_store_help_requests(selected_year, selected_month):
+@timed_function()
+def display_store_help_requests(selected_year, selected_month, shift_data):
     st.header('店舗ヘルプ希望')
     
-    start_date = pd.Timestamp(selected_year, selected_month, 16)
-    end_date = start_date + pd.DateOffset(months=1) - pd.Timedelta(days=1)
-    
-    store_help_requests = db.get_store_help_requests(start_date, end_date)
+    store_help_requests = get_cached_store_help_requests(selected_year, selected_month)
     
     if store_help_requests.empty:
         st.write("ヘルプ希望はありません。")
     else:
+        # 充足状況（色分け・集計）は希望と割り当ての時間帯を突き合わせたレポートから作る
+        report = get_fulfilment_report(selected_year, selected_month, shift_data, store_help_requests)
         store_help_requests['日付'] = store_help_requests.index.strftime('%Y-%m-%d')
         store_help_requests['曜日'] = store_help_requests.index.strftime('%a').map(WEEKDAY_JA)
         
-        all_stores = [store for stores in AREAS.values() for store in stores]
-        for store in all_stores:
+        organisation = current_organisation()
+        for store in organisation.stores:
             if store not in store_help_requests.columns:
                 store_help_requests[store] = '-'
         
         store_help_requests = store_help_requests.reset_index(drop=True)
 
-        area_tabs = [area for area in AREAS.keys() if area != 'なし']
+        area_tabs = [area for area in organisation.areas.keys() if area != 'なし']
         tabs = st.tabs(area_tabs)
         
         st.markdown("""
@@ -412,26 +660,205 @@ def display_store_help_requests(selected_year, selected_month):
         
         for area, tab in zip(area_tabs, tabs):
             with tab:
-                area_stores = AREAS[area]
+                area_stores = organisation.areas[area]
                 area_data = store_help_requests[['日付', '曜日'] + area_stores]
                 area_data = area_data.fillna('-')
 
-                shift_data = st.session_state.shift_data[
-                    (st.session_state.shift_data.index >= start_date) & 
-                    (st.session_state.shift_data.index <= end_date)
-                ]
-                shift_data.index = pd.to_datetime(shift_data.index)
-
                 styled_df = area_data.style.apply(highlight_weekend_and_holiday, axis=1)\
-                                        .apply(highlight_filled_shifts, shift_data=shift_data, axis=1)
+                                        .apply(fulfilment_styles, report=report, axis=None)
 
                 st.write(styled_df.to_html(escape=False, index=False), unsafe_allow_html=True)
 
+        display_fulfilment_summary(report, selected_year, selected_month)
+
+def get_fulfilment_report(year, month, shift_data, store_help_requests):
+    # セッションの未反映の編集がなければ、共有スナップショットの索引をそのまま使う
+    if st.session_state.shift_overlay:
+        index = ShiftIntervalIndex(shift_data)
+    else:
+        index = get_cached_shift_snapshot(year, month).interval_index()
+    return fulfilment_report(store_help_requests, index)
+
+def display_fulfilment_summary(report, selected_year, selected_month):
+    st.subheader('ヘルプ希望の充足状況')
+    rollups = {'エリア別': 'area', '店舗別': 'store', '日付別': 'date'}
+    by = rollups[st.radio('集計単位', list(rollups.keys()), horizontal=True, key='fulfilment_rollup')]
+    summary = summarize_fulfilment(report, by)
+    display_summary = summary.assign(date=summary['date'].dt.strftime('%Y-%m-%d')) if by == 'date' else summary
+    st.dataframe(label_columns(display_summary, FULFILMENT_LABELS), hide_index=True, use_container_width=True)
+
+    col1, col2 = st.columns(2)
+    col1.download_button('集計をCSVでダウンロード', to_csv_bytes(summary),
+                         file_name=f'{selected_month}月_ヘルプ充足状況_{by}.csv', mime='text/csv', key='download_fulfilment_summary')
+    col2.download_button('明細をCSVでダウンロード', to_csv_bytes(report),
+                         file_name=f'{selected_month}月_ヘルプ充足状況_明細.csv', mime='text/csv', key='download_fulfilment_report')
+
+@timed_function()
+def display_shift_checks(selected_year, selected_month):
+    st.header('シフトの重複・ヘルプの過不足')
+    # 期間全体のチェックは必要なときだけ行う
+    if not st.checkbox('チェック結果を表示する', key='show_shift_checks'):
+        return
+    index = get_cached_shift_snapshot(selected_year, selected_month).interval_index()
+    overlaps = index.employee_overlaps()
+    coverage = index.store_coverage(get_cached_store_help_requests(selected_year, selected_month))
+    coverage = coverage[coverage['status'] != 'OK']
+
+    st.subheader('従業員の時間帯の重複')
+    if overlaps.empty:
+        st.write('重複はありません。')
+    else:
+        overlaps = overlaps.assign(date=overlaps['date'].dt.strftime('%Y-%m-%d'))
+        st.table(overlaps.rename(columns={'date': '日付', 'employee': '従業員', 'shift': 'シフト',
+                                          'interval': '時間帯', 'overlaps_with': '重なる時間帯'}))
+
+    st.subheader('店舗ヘルプの過不足')
+    if coverage.empty:
+        st.write('過不足はありません。')
+    else:
+        coverage = coverage.assign(date=coverage['date'].dt.strftime('%Y-%m-%d'))
+        st.dataframe(coverage.rename(columns={'date': '日付', 'store': '店舗', 'help_time': '希望時間', 'assigned': '割り当て',
+                                              'uncovered_minutes': '不足（分）', 'max_helpers': '最大人数', 'status': '状態'}),
+                     hide_index=True, use_container_width=True)
+
+@timed_function()
+def display_help_assignment(selected_year, selected_month, shift_data, period_frozen):
+    st.header('ヘルプの自動割り当て')
+    st.caption('AM可・PM可・1日可で店舗が決まっていない従業員を、同じエリアの店舗ヘルプ希望に割り当てる案を作成します。')
+    if st.button('割り当て案を作成', key='create_assignment_plan'):
+        from assignment import solve_help_assignment
+        plan = solve_help_assignment(shift_data, get_cached_store_help_requests(selected_year, selected_month))
+        st.session_state.assignment_plan = ((selected_year, selected_month), plan)
+    # 別の期間で作成した案は表示しない
+    period, plan = st.session_state.get('assignment_plan', (None, None))
+    if period != (selected_year, selected_month):
+        return
+
+    proposal = plan.to_frame()
+    st.subheader(f'割り当て案（{len(proposal)}件）')
+    if proposal.empty:
+        st.write('割り当てられる従業員はいません。')
+    else:
+        proposal = proposal.assign(date=proposal['date'].dt.strftime('%Y-%m-%d'))
+        st.dataframe(proposal.rename(columns={'date': '日付', 'employee': '従業員', 'store': '店舗', 'time': '時間帯', 'shift': 'シフト案'}),
+                     hide_index=True, use_container_width=True)
+    if not plan.unassigned.empty:
+        st.subheader(f'割り当てられない希望（{len(plan.unassigned)}件）')
+        unassigned = plan.unassigned.assign(date=plan.unassigned['date'].dt.strftime('%Y-%m-%d'))
+        st.dataframe(unassigned.rename(columns={'date': '日付', 'store': '店舗', 'help_time': '希望時間', 'time': '時間帯', 'reason': '理由'}),
+                     hide_index=True, use_container_width=True)
+
+    if plan.shifts and st.button('割り当て案を保存', key='save_assignment_plan', disabled=period_frozen):
+        save_assignment_plan(plan, selected_year, selected_month)
+
+@timed_function()
+def display_range_summary(selected_year, selected_month):
+    st.header('期間をまたぐ集計')
+    st.caption('四半期・年度などの範囲で、従業員別の出勤日数と店舗別のヘルプ充足状況を集計します（保存済みのデータが対象）。')
+    default_start, default_end = fiscal_year_range(fiscal_year_of(selected_year, selected_month))
+    date_range = st.date_input('範囲', value=(default_start.date(), default_end.date()), key='range_summary_dates')
+    rollups = {'従業員別': 'employee', '店舗別': 'store'}
+    by = rollups[st.radio('集計単位', list(rollups.keys()), horizontal=True, key='range_summary_by')]
+    if st.button('集計する', key='create_range_summary', disabled=len(date_range) != 2):
+        start_date, end_date = pd.Timestamp(date_range[0]), pd.Timestamp(date_range[1])
+        try:
+            if by == 'employee':
+                totals, monthly = employee_range_summary(_load_range_period, start_date, end_date)
+                summary = totals.merge(monthly, on='employee')
+            else:
+                summary = store_range_summary(_load_range_period, start_date, end_date)
+        except (ValueError, DatabaseUnavailableError) as e:
+            st.error(f"集計できませんでした: {e}")
+            return
+        st.session_state.range_summary = ((by, start_date, end_date), summary)
+    key, summary = st.session_state.get('range_summary', (None, None))
+    if key is None or key[0] != by:
+        return
+
+    _, start_date, end_date = key
+    st.subheader(f"{start_date.strftime('%Y/%m/%d')}～{end_date.strftime('%Y/%m/%d')}")
+    summary = label_columns(summary, RANGE_LABELS)
+    st.dataframe(summary, hide_index=True, use_container_width=True)
+    st.download_button('集計をCSVでダウンロード', summary.to_csv(index=False).encode('utf-8-sig'),
+                       file_name=f"{start_date.strftime('%Y%m%d')}-{end_date.strftime('%Y%m%d')}_{by}.csv", mime='text/csv',
+                       key='download_range_summary')
+
+@timed_function()
+def display_rollup_analytics(selected_year, selected_month):
+    st.header('実績の推移（集計済みデータ）')
+    st.caption('保存のたびに更新される集計から、年度ごとの日数・時間・回数を表示します（シフトの表は読み込みません）。')
+    current = fiscal_year_of(selected_year, selected_month)
+    fiscal_years = st.multiselect('年度', list(range(current - 4, current + 1)), default=[current - 1, current], key='rollup_fiscal_years')
+    groups = {'従業員×店舗': ['employee', 'store'], '従業員': ['employee'], '店舗': ['store'], '種類': ['shift_type']}
+    by = groups[st.radio('集計単位', list(groups.keys()), horizontal=True, key='rollup_by')]
+    metrics = {'日数': 'days', '時間': 'hours', '回数': 'count'}
+    metric = metrics[st.radio('値', list(metrics.keys()), horizontal=True, key='rollup_metric')]
+    stores_only = st.checkbox('店舗に入ったシフト（ヘルプ）だけ', value=True, key='rollup_stores_only')
+    if not fiscal_years:
+        return
+
+    first, last = min(fiscal_years), max(fiscal_years)
+    missing = rollup_store.missing_periods([period for year in range(first, last + 1)
+                                            for period in periods_in_range(*fiscal_year_range(year))
+                                            if period <= period_of(datetime.now())])
+    if missing:
+        st.warning(f"集計がない期間があります（{', '.join(f'{year}年{month}月' for year, month in missing[:6])}"
+                   f"{' ほか' if len(missing) > 6 else ''}）。python cli.py rollup-backfill で作成してください。")
+    start, _ = fiscal_year_range(first)
+    _, end = fiscal_year_range(last)
+    rollup = rollup_store.query(['fiscal_year'] + by, period_of(start), period_of(end), stores_only=stores_only)
+    rollup = rollup[rollup['fiscal_year'].isin(fiscal_years)]
+    if rollup.empty:
+        st.write('集計済みのデータがありません。')
+        return
+    # 年度を列にして前年と比べられるようにする
+    table = rollup.pivot_table(index=by, columns='fiscal_year', values=metric, aggfunc='sum', fill_value=0)
+    table = table.reindex(columns=sorted(fiscal_years), fill_value=0)
+    table.columns = [f'{year}年度' for year in table.columns]
+    table = label_columns(table.reset_index(), ROLLUP_LABELS)
+    st.dataframe(table, hide_index=True, use_container_width=True)
+    st.download_button('CSVでダウンロード', table.to_csv(index=False).encode('utf-8-sig'),
+                       file_name=f"実績_{first}-{last}年度_{'_'.join(by)}_{metric}.csv", mime='text/csv', key='download_rollup')
+
+def display_organisation_editor():
+    st.header('従業員・店舗の管理')
+    organisation = current_organisation()
+    with st.expander('従業員・店舗の一覧を編集する'):
+        # 表の行の順がエリア内の表示順になる
+        employees = st.data_editor(
+            pd.DataFrame([(area, employee) for area, employees in organisation.employee_areas.items() for employee in employees],
+                         columns=['エリア', '従業員']),
+            num_rows='dynamic', hide_index=True, use_container_width=True, key='organisation_employees')
+        stores = st.data_editor(
+            pd.DataFrame([(area, store, organisation.store_colors.get(store, '')) for area, stores in organisation.areas.items()
+                          for store in stores], columns=['エリア', '店舗', '色']),
+            num_rows='dynamic', hide_index=True, use_container_width=True, key='organisation_stores')
+        if st.button('従業員・店舗を保存', key='save_organisation'):
+            try:
+                edited = organisation_from_lists(employees.itertuples(index=False, name=None), stores.itertuples(index=False, name=None))
+                db.save_organisation(edited.employee_rows(), edited.store_rows())
+            except (ValueError, DatabaseUnavailableError) as e:
+                st.error(f"保存できませんでした: {e}")
+                return
+            # 他のプロセスは organisation_meta のバージョンが変わったことを確認して読み込み直す
+            organisation_loader.invalidate()
+            st.success('従業員・店舗を保存しました')
+            st.experimental_rerun()
+    st.caption(f'組織のマスタのバージョン: {organisation.version}')
+
 async def main():
     st.title('ヘルプ管理アプリ📝')
+    start_cache_warmer(db)
+    start_write_flusher(db, on_writes_flushed)
+    # 1回の再実行の間は同じ組織の一覧を使う
+    organisation = current_organisation()
 
     with st.sidebar:
         st.header('設定')
+        if len(TENANTS) > 1:
+            tenant_ids = list(TENANTS)
+            st.selectbox('地域', tenant_ids, index=tenant_ids.index(st.session_state.tenant),
+                         format_func=lambda tenant_id: TENANTS[tenant_id].name, key='tenant_selector')
         current_year = datetime.now().year
         years = range(current_year - 1, current_year + 10)
         current_year_index = years.index(current_year)
@@ -439,27 +866,55 @@ async def main():
         selected_month = st.selectbox('月を選択', range(1, 13), key='month_selector')
 
         initialize_shift_data(selected_year, selected_month)
-        shifts = get_cached_shifts(selected_year, selected_month)
-        update_session_state_shifts(shifts)
+        try:
+            apply_change_events(get_change_subscription(selected_year, selected_month))
+            with timed('get_cached_shifts'):
+                shifts = get_cached_shifts(selected_year, selected_month)
+            shift_conflicts = pop_shift_conflicts(st.session_state.change_subscription)
+        except DatabaseUnavailableError as e:
+            # 一度も読み込めていない期間は表示できない
+            st.error(f"シフトデータの取得エラー: {e}")
+            st.stop()
+        prune_shift_overlay()
+        shift_data = apply_shift_overlay(shifts, st.session_state.shift_overlay)
 
         st.header('シフト登録/修正')
         
+        # 固定済み（確定済み）の期間はファイルから表示しているため編集できない
+        period_frozen = frozen_periods.is_frozen(selected_year, selected_month)
+        if period_frozen:
+            st.info('この期間は確定済みのため編集できません')
+        
+        # データベースへ未送信の保存があれば件数を表示する
+        queue_stats = write_queue.stats()
+        if queue_stats['depth']:
+            st.caption(f"送信待ちの保存: {queue_stats['depth']}件（最も古いもの {queue_stats['lag_seconds']:.0f}秒前）")
+        
+        # 他のユーザーと同時に編集して保存できなかったシフトを表示
+        for conflict in shift_conflicts:
+            conflict_date = pd.Timestamp(conflict['date']).strftime('%Y/%m/%d')
+            st.warning(f"{conflict_date} {conflict['employee']}さんのシフトは他のユーザーが先に更新したため保存されませんでした"
+                       f"（現在: {conflict['shift']}）。内容を確認して再度保存してください。")
+        
+        # 保存時のチェック結果（エラーがあれば保存していない）
+        for message in st.session_state.shift_check['errors']:
+            st.error(f"{message}（保存していません）")
+        for message in st.session_state.shift_check['warnings']:
+            st.warning(message)
+        
         # エリアごとに従業員を選択できるように変更
-        area = st.selectbox('エリアを選択', list(EMPLOYEE_AREAS.keys()), key='employee_area_selector')
-        employee = st.selectbox('従業員を選択', EMPLOYEE_AREAS[area])
+        area = st.selectbox('エリアを選択', list(organisation.employee_areas.keys()), key='employee_area_selector')
+        employee = st.selectbox('従業員を選択', organisation.employee_areas[area])
         
         start_date = datetime(selected_year, selected_month, 16)
         end_date = start_date + pd.DateOffset(months=1) - pd.Timedelta(days=1)
         default_date = max(min(datetime.now().date(), end_date.date()), start_date.date())
         date = st.date_input('日付を選択', min_value=start_date.date(), max_value=end_date.date(), value=default_date)
         
-        if not isinstance(st.session_state.shift_data.index, pd.DatetimeIndex):
-            st.session_state.shift_data.index = pd.to_datetime(st.session_state.shift_data.index)
-
         date = pd.Timestamp(date)
 
-        if date in st.session_state.shift_data.index:
-            current_shift = st.session_state.shift_data.loc[date, employee]
+        if date in shift_data.index:
+            current_shift = shift_data.loc[date, employee]
             if pd.isna(current_shift) or isinstance(current_shift, (int, float)):
                 current_shift = '休み'
         else:
@@ -474,20 +929,12 @@ async def main():
         
         new_shift_str, repeat_weekly, selected_dates = update_shift_input(current_shift, employee, date, selected_year, selected_month)
 
-        if st.button('保存'):
+        if st.button('保存', disabled=period_frozen):
             await save_shift_async(date, employee, new_shift_str, repeat_weekly, selected_dates)
-            st.session_state.shift_data.loc[date, employee] = new_shift_str
-            if repeat_weekly and selected_dates:
-                for next_date in selected_dates:
-                    if next_date in st.session_state.shift_data.index:
-                        st.session_state.shift_data.loc[next_date, employee] = new_shift_str
-            st.session_state.editing_shift = False
-            st.success('保存しました')
-            st.experimental_rerun()
 
         st.header('店舗ヘルプ希望登録/修正')
-        area = st.selectbox('エリアを選択', [key for key in AREAS.keys() if key != 'なし'], key='help_area')
-        store = st.selectbox('店舗を選択', AREAS[area], key='help_store')
+        area = st.selectbox('エリアを選択', [key for key in organisation.areas.keys() if key != 'なし'], key='help_area')
+        store = st.selectbox('店舗を選択', organisation.areas[area], key='help_store')
         help_default_date = max(min(datetime.now().date(), end_date.date()), start_date.date())
         
         help_date = st.date_input('日付を選択', min_value=start_date.date(), max_value=end_date.date(), value=help_default_date, key='help_date')
@@ -496,62 +943,76 @@ async def main():
         # 繰り返し登録のオプションを追加
         repeat_weekly, selected_dates = register_store_help(pd.Timestamp(help_date), store, help_time, selected_year, selected_month)
         
-        if st.button('ヘルプ希望を登録'):
-            await save_store_help_async(help_date, store, help_time, repeat_weekly, selected_dates)
-            st.success('ヘルプ希望を登録しました')
-            st.experimental_rerun()
+        if st.button('ヘルプ希望を登録', disabled=period_frozen):
+            try:
+                await save_store_help_async(help_date, store, help_time, repeat_weekly, selected_dates)
+            except FrozenPeriodError as e:
+                st.error(str(e))
+            else:
+                st.success('ヘルプ希望を登録しました')
+                st.experimental_rerun()
+
+        st.header('CSV/Excelから一括取り込み')
+        import_kinds = {'シフト': IMPORT_SHIFTS, '店舗ヘルプ希望': IMPORT_HELP_REQUESTS}
+        import_kind = import_kinds[st.radio('取り込む内容', list(import_kinds.keys()), key='import_kind')]
+        import_file_upload = st.file_uploader('ファイル（1列目が日付の横持ち、または縦持ち）', type=['csv', 'xlsx'], key='import_file')
+        skip_invalid = st.checkbox('エラーのあるセルを除いて取り込む', key='import_skip_invalid')
+        if st.button('取り込む', disabled=import_file_upload is None):
+            run_import(import_file_upload, import_kind, skip_invalid)
+        display_import_result()
+
+        st.header('データのエクスポート')
+        export_kinds = {'シフト': KIND_SHIFTS, '店舗ヘルプ希望': KIND_HELP_REQUESTS}
+        export_kind = export_kinds[st.radio('出力する内容', list(export_kinds.keys()), key='export_kind')]
+        export_layouts = {'縦持ち（1行1セル）': LAYOUT_LONG, '横持ち（画面の表と同じ形）': LAYOUT_PIVOT}
+        export_layout = export_layouts[st.radio('表の形', list(export_layouts.keys()), key='export_layout')]
+        export_format = st.radio('形式', list(FORMATS.keys()), horizontal=True, key='export_format')
+        export_range = st.date_input('期間', value=(start_date.date(), end_date.date()), key='export_range')
+        if st.button('エクスポートを作成', disabled=len(export_range) != 2):
+            create_export(export_kind, export_layout, export_format, pd.Timestamp(export_range[0]), pd.Timestamp(export_range[1]))
+        export_file = st.session_state.get('export_file')
+        if export_file:
+            file_name, data, mime, rows = export_file
+            st.download_button(label=f"{file_name}（{rows}行）をダウンロード", data=data, file_name=file_name, mime=mime, key='export_download')
 
         st.header('個別PDFのダウンロード')
         # エリアごとに従業員を選択できるように変更
-        pdf_area = st.selectbox('エリアを選択', list(EMPLOYEE_AREAS.keys()), key='pdf_employee_area_selector')
-        selected_employee = st.selectbox('従業員を選択', EMPLOYEE_AREAS[pdf_area], key='pdf_employee_selector')
+        pdf_area = st.selectbox('エリアを選択', list(organisation.employee_areas.keys()), key='pdf_employee_area_selector')
+        selected_employee = st.selectbox('従業員を選択', organisation.employee_areas[pdf_area], key='pdf_employee_selector')
         
         if st.button('PDFを生成'):
-            employee_data = st.session_state.shift_data[selected_employee]
-            pdf_buffer = generate_individual_pdf(employee_data, selected_employee, selected_year, selected_month)
+            from pdf_generator import generate_individual_pdf
+            employee_data = shift_data[selected_employee]
+            pdf_bytes = pdf_cache.get_or_generate(generate_individual_pdf, employee_data, selected_employee, selected_year, selected_month)
             start_date = pd.Timestamp(selected_year, selected_month, 16)
             end_date = start_date + pd.DateOffset(months=1) - pd.Timedelta(days=1)
             file_name = f'{selected_employee}さん_{start_date.strftime("%Y年%m月%d日")}～{end_date.strftime("%Y年%m月%d日")}_シフト.pdf'
             st.download_button(
                 label=f"{selected_employee}さんのPDFをダウンロード",
-                data=pdf_buffer.getvalue(),
+                data=pdf_bytes,
                 file_name=file_name,
                 mime="application/pdf"
             )
 
         st.header('店舗別PDFのダウンロード')
-        selected_area = st.selectbox('エリアを選択', [key for key in AREAS.keys() if key != 'なし'], key='pdf_area_selector')
-        selected_store = st.selectbox('店舗を選択', AREAS[selected_area], key='pdf_store_selector')
+        selected_area = st.selectbox('エリアを選択', [key for key in organisation.areas.keys() if key != 'なし'], key='pdf_area_selector')
+        selected_store = st.selectbox('店舗を選択', organisation.areas[selected_area], key='pdf_store_selector')
         if st.button('店舗PDFを生成'):
-            start_date = pd.Timestamp(selected_year, selected_month, 16)
-            end_date = start_date + pd.DateOffset(months=1) - pd.Timedelta(days=1)
-            
-            # シフトデータの取得
-            store_data = st.session_state.shift_data.copy()
+            from pdf_generator import generate_store_pdf
             
             try:
-                # ヘルプ希望データの取得とデフォルト値の設定
-                store_help_requests = db.get_store_help_requests(start_date, end_date)
-                if store_help_requests.empty:
-                    # ヘルプ希望データが空の場合、すべての日付で'-'を設定
-                    date_range = pd.date_range(start=start_date, end=end_date)
-                    store_help_requests = pd.DataFrame(index=date_range, columns=[selected_store])
-                    store_help_requests[selected_store] = '-'
-                elif selected_store not in store_help_requests.columns:
-                    # 選択された店舗のデータが存在しない場合、'-'で列を追加
-                    store_help_requests[selected_store] = '-'
-                
-                # シフトデータにヘルプ希望データを追加
-                store_data[selected_store] = store_help_requests[selected_store]
+                # ヘルプ希望データを取得し、シフトデータに選択店舗の列を追加
+                store_help_requests = get_cached_store_help_requests(selected_year, selected_month)
+                store_data = build_store_pdf_data(shift_data, store_help_requests, selected_store, selected_year, selected_month)
                 
                 # PDFの生成
-                pdf_buffer = generate_store_pdf(store_data, selected_store, selected_year, selected_month)
+                pdf_bytes = pdf_cache.get_or_generate(generate_store_pdf, store_data, selected_store, selected_year, selected_month)
                 file_name = f'{selected_month}月_{selected_store}.pdf'
                 
                 # ダウンロードボタンの表示
                 st.download_button(
                     label=f"{selected_store}のPDFをダウンロード",
-                    data=pdf_buffer.getvalue(),
+                    data=pdf_bytes,
                     file_name=file_name,
                     mime="application/pdf"
                 )
@@ -559,12 +1020,28 @@ async def main():
             except Exception as e:
                 st.error(f"PDFの生成中にエラーが発生しました。: {str(e)}")
 
-    display_shift_table(selected_year, selected_month)
-    display_store_help_requests(selected_year, selected_month)
+    show_stale_data_warning(selected_year, selected_month)
+    display_shift_table(selected_year, selected_month, shift_data)
+    display_store_help_requests(selected_year, selected_month, shift_data)
+    display_shift_checks(selected_year, selected_month)
+    display_help_assignment(selected_year, selected_month, shift_data, period_frozen)
+    display_range_summary(selected_year, selected_month)
+    display_rollup_analytics(selected_year, selected_month)
+    display_organisation_editor()
+    watch_changes()
+    render_debug_panel(st, {'tenant': st.session_state.tenant,
+                            **{f'write_queue.{name}': value for name, value in write_queue.stats().items()},
+                            **{f'period_cache.{name}': value for name, value in period_cache.stats().items()}})
 
 if __name__ == '__main__':
-    if db.init_db():
-        asyncio.run(main())
-    else:
-        st.error("データベース接続に失敗しました")
+    start_rerun()
+    # asyncio.run は現在のコンテキストを引き継ぐため、main の中でも同じテナントになる
+    select_tenant()
+    with profile_rerun():
+        # 接続の確認はセッションの最初だけ行う（以降の失敗はキャッシュ済みのデータで表示を続ける）
+        if st.session_state.get('db_initialized') or db.init_db():
+            st.session_state.db_initialized = True
+            asyncio.run(main())
+        else:
+            st.error("データベース接続に失敗しました")
 
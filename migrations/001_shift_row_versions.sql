@@ -0,0 +1,48 @@
+-- shifts に行バージョンを追加し、同じ(日付, 従業員)への同時編集を検出できるようにする
+-- Supabase の SQL エディタで実行する
+
+alter table shifts add column if not exists version integer not null default 1;
+alter table shifts add column if not exists updated_at timestamptz not null default now();
+
+-- 更新のたびにバージョンを上げる（バージョンを指定しない通常のupsertでも上がる）
+create or replace function bump_shift_version() returns trigger
+language plpgsql as $$
+begin
+  new.version := old.version + 1;
+  new.updated_at := now();
+  return new;
+end;
+$$;
+
+drop trigger if exists shifts_bump_version on shifts;
+create trigger shifts_bump_version
+  before update on shifts
+  for each row execute function bump_shift_version();
+
+-- 読み込んだときのバージョンと一致する場合だけ保存する
+-- p_expected_version = 0 は「まだ行が存在しない」ことを期待する
+-- 一致しなかった場合は conflict = true と現在の行を返す
+create or replace function save_shift_versioned(
+  p_date date,
+  p_employee text,
+  p_shift text,
+  p_expected_version integer
+)
+returns table (date date, employee text, shift text, version integer, updated_at timestamptz, conflict boolean)
+language plpgsql as $$
+#variable_conflict use_column
+begin
+  if p_expected_version = 0 then
+    insert into shifts (date, employee, shift) values (p_date, p_employee, p_shift)
+      on conflict (date, employee) do nothing;
+  else
+    update shifts s set shift = p_shift
+      where s.date = p_date and s.employee = p_employee and s.version = p_expected_version;
+  end if;
+
+  return query
+    select s.date, s.employee, s.shift, s.version, s.updated_at, not found
+    from shifts s
+    where s.date = p_date and s.employee = p_employee;
+end;
+$$;
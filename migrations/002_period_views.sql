@@ -0,0 +1,22 @@
+-- 期間データを日付ごとに集計したビュー（HELP2_PERIOD_VIEWS=1 で使用する）
+-- 1セル1行で取得してクライアントでピボットする代わりに、日付ごとの {従業員: シフト} を返す
+-- 001_shift_row_versions.sql の適用後に Supabase の SQL エディタで実行する
+
+create or replace view shift_days
+  with (security_invoker = true) as
+  select date,
+         jsonb_object_agg(employee, shift) as shifts,
+         jsonb_object_agg(employee, version) as versions
+  from shifts
+  group by date;
+
+create or replace view store_help_days
+  with (security_invoker = true) as
+  select date,
+         jsonb_object_agg(store, help_time) as help_times
+  from store_help_requests
+  group by date;
+
+-- 期間（date の範囲）で絞り込むため
+create index if not exists shifts_date_idx on shifts (date);
+create index if not exists store_help_requests_date_idx on store_help_requests (date);
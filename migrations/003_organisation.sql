@@ -0,0 +1,56 @@
+-- 従業員・店舗（組織のマスタ）のテーブル（HELP2_ORGANISATION_TABLES=1 で使用する）
+-- 変更のたびに organisation_meta.version が上がり、各プロセスはバージョンだけを確認して読み込み直す
+-- 作成後に python cli.py org-seed で constants.py の内容を登録する
+-- Supabase の SQL エディタで実行する
+
+create table if not exists employees (
+  name text primary key,
+  area text not null,
+  sort_order integer not null default 0
+);
+
+create table if not exists stores (
+  name text primary key,
+  area text not null,
+  color text,
+  sort_order integer not null default 0
+);
+
+create table if not exists organisation_meta (
+  id integer primary key default 1 check (id = 1),
+  version bigint not null default 0
+);
+insert into organisation_meta (id, version) values (1, 0) on conflict (id) do nothing;
+
+create or replace function bump_organisation_version() returns trigger
+language plpgsql as $$
+begin
+  update organisation_meta set version = version + 1 where id = 1;
+  return null;
+end;
+$$;
+
+drop trigger if exists employees_bump_organisation_version on employees;
+create trigger employees_bump_organisation_version
+  after insert or update or delete on employees
+  for each statement execute function bump_organisation_version();
+
+drop trigger if exists stores_bump_organisation_version on stores;
+create trigger stores_bump_organisation_version
+  after insert or update or delete on stores
+  for each statement execute function bump_organisation_version();
+
+-- 従業員・店舗の一覧を1つのトランザクションで置き換える（p_employees / p_stores は行の配列）
+create or replace function replace_organisation(p_employees jsonb, p_stores jsonb)
+returns bigint
+language plpgsql as $$
+begin
+  delete from employees where true;
+  delete from stores where true;
+  insert into employees (name, area, sort_order)
+    select e->>'name', e->>'area', coalesce((e->>'sort_order')::integer, 0) from jsonb_array_elements(p_employees) e;
+  insert into stores (name, area, color, sort_order)
+    select s->>'name', s->>'area', s->>'color', coalesce((s->>'sort_order')::integer, 0) from jsonb_array_elements(p_stores) s;
+  return (select version from organisation_meta where id = 1);
+end;
+$$;
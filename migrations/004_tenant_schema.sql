@@ -0,0 +1,27 @@
+-- テナント（地域・会社）ごとのスキーマを作成する（tenants.py の設定ファイルの schema と同じ名前にする）
+-- 既定のテナントは public のテーブルをそのまま使う。追加するテナントごとに次を行う:
+--   1. select create_tenant_schema('miyazaki');
+--   2. SQL エディタで set search_path to miyazaki; を実行してから 001～003 のマイグレーションを実行する
+--   3. Supabase の設定（API > Exposed schemas）にスキーマを追加する
+--   4. HELP2_TENANTS の設定ファイルにテナントを追加し、python cli.py --tenant miyazaki org-import ... で従業員・店舗を登録する
+-- Supabase の SQL エディタで実行する
+
+create or replace function create_tenant_schema(p_schema text) returns void
+language plpgsql as $$
+begin
+  if p_schema !~ '^[a-z0-9_]+$' then
+    raise exception 'スキーマ名は英小文字・数字・_ で指定してください: %', p_schema;
+  end if;
+  execute format('create schema if not exists %I', p_schema);
+  execute format('create table if not exists %I.shifts (date date not null, employee text not null, shift text, '
+                 'primary key (date, employee))', p_schema);
+  execute format('create table if not exists %I.store_help_requests (date date not null, store text not null, help_time text, '
+                 'primary key (date, store))', p_schema);
+  -- PostgREST（APIのロール）からテナントのスキーマを参照できるようにする
+  execute format('grant usage on schema %I to anon, authenticated, service_role', p_schema);
+  execute format('grant all on all tables in schema %I to anon, authenticated, service_role', p_schema);
+  execute format('grant all on all functions in schema %I to anon, authenticated, service_role', p_schema);
+  execute format('alter default privileges in schema %I grant all on tables to anon, authenticated, service_role', p_schema);
+  execute format('alter default privileges in schema %I grant all on functions to anon, authenticated, service_role', p_schema);
+end;
+$$;
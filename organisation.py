@@ -0,0 +1,171 @@
+"""従業員・エリア・店舗・店舗の色（組織のマスタ）をデータベースから読み込み、バージョン付きで保持する
+
+マスタは employees / stores テーブル（migrations/003_organisation.sql）にあり、変更するたびに
+organisation_meta のバージョンが上がる。プロセスは ORGANISATION_CHECK_INTERVAL 秒ごとにバージョンだけを確認し、
+変わっていればマスタを読み込み直すため、従業員の入れ替えに再起動は要らない。
+テーブルがない・空の場合は constants.py の値を使う（python cli.py org-seed でテーブルに登録できる）。
+マスタはテナント（tenants.py）ごとのデータベースにあり、テナントごとに別々に読み込む。
+
+Organisation.version はマスタの内容から作るため、期間のスナップショット・PDFのキャッシュのキーに含めると
+マスタが変わったときだけ、すべてのプロセスで確実に作り直される。
+
+環境変数:
+    HELP2_ORGANISATION_CHECK_INTERVAL   データベースのバージョンを確認する間隔（秒）
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+import constants
+from tenants import TenantScoped
+
+logger = logging.getLogger(__name__)
+
+ORGANISATION_CHECK_INTERVAL = float(os.environ.get('HELP2_ORGANISATION_CHECK_INTERVAL', 30))
+# 店舗を選ぶ画面で「店舗なし」として先頭に置くエリア
+NO_AREA = 'なし'
+DEFAULT_STORE_COLOR = '#000000'
+
+
+class Organisation:
+    """従業員・店舗のエリアと店舗の色（constants.py と同じ形式の辞書）"""
+
+    def __init__(self, employee_areas, areas, store_colors):
+        self.employee_areas = {area: list(employees) for area, employees in employee_areas.items()}
+        self.areas = {NO_AREA: [], **{area: list(stores) for area, stores in areas.items() if area != NO_AREA}}
+        self.store_colors = dict(store_colors)
+        self.employees = [employee for employees in self.employee_areas.values() for employee in employees]
+        self.stores = [store for stores in self.areas.values() for store in stores]
+        content = json.dumps([self.employee_areas, self.areas, sorted(self.store_colors.items())], ensure_ascii=False)
+        self.version = hashlib.sha256(content.encode('utf-8')).hexdigest()[:12]
+
+    def store_color(self, store, default=DEFAULT_STORE_COLOR):
+        return self.store_colors.get(store) or default
+
+    def employee_rows(self):
+        """employees テーブルの行（name, area, sort_order）"""
+        return [{'name': employee, 'area': area, 'sort_order': i}
+                for i, (area, employee) in enumerate((area, employee) for area, employees in self.employee_areas.items()
+                                                     for employee in employees)]
+
+    def store_rows(self):
+        """stores テーブルの行（name, area, color, sort_order）"""
+        return [{'name': store, 'area': area, 'color': self.store_colors.get(store), 'sort_order': i}
+                for i, (area, store) in enumerate((area, store) for area, stores in self.areas.items() for store in stores)]
+
+    @classmethod
+    def from_rows(cls, employee_rows, store_rows):
+        """テーブルの行から作成（エリアは最初に現れた順、エリア内は sort_order の順）"""
+        employee_areas, areas, store_colors = {}, {}, {}
+        for row in sorted(employee_rows, key=lambda row: (row.get('sort_order') or 0, row['name'])):
+            employee_areas.setdefault(row['area'], []).append(row['name'])
+        for row in sorted(store_rows, key=lambda row: (row.get('sort_order') or 0, row['name'])):
+            areas.setdefault(row['area'], []).append(row['name'])
+            if row.get('color'):
+                store_colors[row['name']] = row['color']
+        return cls(employee_areas, areas, store_colors)
+
+
+def organisation_from_lists(employees, stores):
+    """(エリア, 従業員) と (エリア, 店舗, 色) の一覧（画面で編集した表の順）から作成する（不正な場合は ValueError）"""
+    errors = []
+    employee_rows, store_rows = [], []
+    for label, items, rows in (('従業員', employees, employee_rows), ('店舗', stores, store_rows)):
+        seen = set()
+        for i, (area, name, *rest) in enumerate(items):
+            area, name = str(area or '').strip(), str(name or '').strip()
+            if not area and not name:
+                continue
+            if not area or not name:
+                errors.append(f'{label} {i + 1}行目: エリアと名前を入力してください')
+            elif name in seen:
+                errors.append(f'{label} {i + 1}行目: {name} が重複しています')
+            elif label == '従業員' and area == NO_AREA:
+                errors.append(f'{label} {i + 1}行目: エリア「{NO_AREA}」には従業員を登録できません')
+            else:
+                seen.add(name)
+                color = str(rest[0]).strip() if rest and rest[0] else None
+                rows.append({'name': name, 'area': area, 'color': color, 'sort_order': len(rows)})
+    if not employee_rows:
+        errors.append('従業員を1人以上登録してください')
+    if errors:
+        raise ValueError('\n'.join(errors))
+    return Organisation.from_rows(employee_rows, store_rows)
+
+
+DEFAULT_ORGANISATION = Organisation(constants.EMPLOYEE_AREAS, constants.AREAS, constants.STORE_COLORS)
+
+
+class OrganisationLoader:
+    """組織のマスタを保持し、check_interval 秒ごとにデータベースのバージョンを確認して読み込み直す"""
+
+    def __init__(self, db=None, check_interval=ORGANISATION_CHECK_INTERVAL, tenant=None):
+        self._db = db
+        self.tenant = tenant
+        self.check_interval = check_interval
+        self._organisation = None
+        self._db_version = None
+        self._checked_at = 0.0
+        self._override = None
+        self._lock = threading.Lock()
+
+    @property
+    def db(self):
+        if self._db is None:
+            # database から組織のマスタを参照するため、最初に使うときにインポートする
+            from database import db
+            self._db = db.for_tenant(self.tenant)
+        return self._db
+
+    def current(self):
+        """現在の組織（データベースに接続できない場合は最後に読み込めたもの）"""
+        if self._override is not None:
+            return self._override
+        if self._organisation is not None and time.time() - self._checked_at < self.check_interval:
+            return self._organisation
+        with self._lock:
+            if self._organisation is None or time.time() - self._checked_at >= self.check_interval:
+                self._refresh()
+        return self._organisation
+
+    def _refresh(self):
+        try:
+            db_version = self.db.get_organisation_version()
+            if self._organisation is None or db_version != self._db_version:
+                # バージョンを確認してから読み込むまでに変更されても、次の確認で読み込み直す
+                employee_rows, store_rows = self.db.get_organisation() if db_version is not None else ([], [])
+                organisation = Organisation.from_rows(employee_rows, store_rows) if employee_rows else DEFAULT_ORGANISATION
+                if self._organisation is not None and organisation.version != self._organisation.version:
+                    logger.info('組織のマスタを読み込み直しました（バージョン %s）', organisation.version)
+                self._organisation = organisation
+                self._db_version = db_version
+        except Exception as e:
+            if self._organisation is None:
+                self._organisation = DEFAULT_ORGANISATION
+            logger.warning('組織のマスタを確認できないため、前回の内容を使います: %s', e)
+        self._checked_at = time.time()
+
+    def invalidate(self):
+        """次の参照でデータベースのバージョンを確認させる（このプロセスでマスタを保存した直後に使う）"""
+        self._checked_at = 0.0
+
+    @contextmanager
+    def override(self, organisation):
+        """ベンチマークなどで、組織をデータベースを参照せずに差し替える"""
+        previous = self._override
+        self._override = organisation
+        try:
+            yield organisation
+        finally:
+            self._override = previous
+
+
+# 組織のマスタのシングルトンインスタンスを作成（テナントごと）
+organisation_loader = TenantScoped(lambda tenant: OrganisationLoader(tenant=tenant))
+
+
+def current_organisation():
+    return organisation_loader.current()
@@ -0,0 +1,154 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import pandas as pd
+from constants import PDF_TEMPLATE_VERSION
+from organisation import current_organisation
+from tenants import TenantScoped
+
+# メモリ上に保持するPDFの合計サイズの上限（バイト）
+PDF_CACHE_MAX_BYTES = int(os.environ.get('PDF_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+# 指定された場合のみディスクにもPDFを保存する
+PDF_CACHE_DIR = os.environ.get('PDF_CACHE_DIR')
+PDF_CACHE_DISK_MAX_BYTES = int(os.environ.get('PDF_CACHE_DISK_MAX_BYTES', 512 * 1024 * 1024))
+
+
+def _update_hash(h, value):
+    """入力値をハッシュに追加（DataFrame/Seriesは内容からハッシュ化）"""
+    if isinstance(value, pd.DataFrame):
+        h.update(b'DataFrame')
+        h.update(repr(list(value.columns)).encode('utf-8'))
+        h.update(pd.util.hash_pandas_object(value.astype(object), index=True).values.tobytes())
+    elif isinstance(value, pd.Series):
+        h.update(b'Series')
+        h.update(repr(value.name).encode('utf-8'))
+        h.update(pd.util.hash_pandas_object(value.astype(object), index=True).values.tobytes())
+    elif isinstance(value, (list, tuple)):
+        h.update(b'[')
+        for item in value:
+            _update_hash(h, item)
+        h.update(b']')
+    else:
+        h.update(repr(value).encode('utf-8'))
+    h.update(b'\x00')
+
+
+def make_pdf_cache_key(generator_name, inputs, snapshot_version=None, template_version=PDF_TEMPLATE_VERSION,
+                       organisation_version=None):
+    """(生成関数, 入力, 期間スナップショットのバージョン, テンプレートのバージョン, 組織のマスタのバージョン)からキーを作成"""
+    h = hashlib.sha256()
+    for value in (generator_name, template_version, snapshot_version, organisation_version):
+        _update_hash(h, value)
+    for value in inputs:
+        _update_hash(h, value)
+    return h.hexdigest()
+
+
+class PdfCache:
+    def __init__(self, max_bytes=PDF_CACHE_MAX_BYTES, cache_dir=PDF_CACHE_DIR, disk_max_bytes=PDF_CACHE_DISK_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.pdf')
+
+    def _store_in_memory(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._size -= len(self._entries.pop(key))
+        self._entries[key] = data
+        self._size += len(data)
+        # 古いものから削除してサイズ上限に収める
+        while self._size > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    def _evict_disk(self):
+        try:
+            files = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir) if name.endswith('.pdf')]
+            files = sorted(((os.path.getmtime(path), os.path.getsize(path), path) for path in files))
+        except OSError:
+            return
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+
+        if self.cache_dir:
+            path = self._disk_path(key)
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                os.utime(path)
+            except OSError:
+                data = None
+            if data is not None:
+                with self._lock:
+                    self._store_in_memory(key, data)
+                    self.hits += 1
+                return data
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, data):
+        with self._lock:
+            self._store_in_memory(key, data)
+
+        if self.cache_dir:
+            # 書き込み途中のファイルを読まないよう一時ファイル経由で保存
+            path = self._disk_path(key)
+            tmp_path = f'{path}.{threading.get_ident()}.tmp'
+            try:
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except OSError:
+                return
+            self._evict_disk()
+
+    def get_or_generate(self, generator, *args, snapshot_version=None, **kwargs):
+        """キャッシュにあればそのバイト列を返し、なければ生成して保存（従業員・店舗の色が変わったら作り直す）"""
+        key = make_pdf_cache_key(generator.__name__, list(args) + sorted(kwargs.items()), snapshot_version,
+                                 organisation_version=current_organisation().version)
+        data = self.get(key)
+        if data is not None:
+            return data
+
+        result = generator(*args, **kwargs)
+        data = result.getvalue() if hasattr(result, 'getvalue') else bytes(result)
+        self.put(key, data)
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+# PDFキャッシュのシングルトンインスタンスを作成（テナントごとにメモリの上限を持つ）
+pdf_cache = TenantScoped(lambda tenant: PdfCache(
+    max_bytes=PDF_CACHE_MAX_BYTES if tenant.pdf_cache_bytes is None else tenant.pdf_cache_bytes, cache_dir=tenant.path(PDF_CACHE_DIR)))
@@ -9,51 +9,76 @@ from reportlab.lib.units import mm
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.lib.colors import Color
-from constants import EMPLOYEE_AREAS,STORE_COLORS, WEEKDAY_JA, SATURDAY_BG_COLOR, SUNDAY_BG_COLOR, EMPLOYEES, HOLIDAY_BG_COLOR
+from constants import WEEKDAY_JA, SATURDAY_BG_COLOR, SUNDAY_BG_COLOR, HOLIDAY_BG_COLOR
+from organisation import current_organisation
 from io import BytesIO
 from utils import parse_shift  # parse_shift関数をutils.pyからインポート
 from datetime import datetime
 from reportlab.lib.enums import TA_CENTER
 from constants import HOLIDAY_BG_COLOR, KANOYA_BG_COLOR, KAGOKITA_BG_COLOR, DARK_GREY_TEXT_COLOR, SPECIAL_SHIFT_TYPES,RECRUIT_BG_COLOR
 import jpholiday
-
-# グローバルスコープでスタイルを定義
-styles = getSampleStyleSheet()
-
-title_style = ParagraphStyle('Title', 
-                             parent=styles['Heading1'], 
-                             fontName='NotoSansJP-Bold', 
-                             fontSize=16, 
-                             textColor=colors.HexColor("#373737"))
-
-normal_style = ParagraphStyle('Normal', 
-                              parent=styles['Normal'], 
-                              fontName='NotoSansJP', 
-                              fontSize=7, 
-                              alignment=TA_CENTER, 
-                              textColor=colors.HexColor("#373737"))
-
-bold_style = ParagraphStyle('Bold', 
-                            parent=normal_style, 
-                            fontName='NotoSansJP-Bold', 
-                            fontSize=8, 
-                            textColor=colors.white)
-
-bold_style2 = ParagraphStyle('Bold2', 
-                             parent=normal_style, 
-                             fontName='NotoSansJP-Bold', 
-                             fontSize=7, 
-                             textColor=colors.HexColor("#595959"))
-
-header_style = ParagraphStyle('Header', 
-                              parent=bold_style, 
-                              fontSize=10,
-                              textColor=colors.white)
-
-special_shift_style = ParagraphStyle('SpecialShift', 
-                                     parent=bold_style2, 
+from profiling import timed_function
+
+# スタイルとフォントは最初のPDF生成時に一度だけ作成する（インポート時の負荷を減らすため）
+_base_styles = None
+_fonts_registered = False
+
+def _get_base_styles():
+    global _base_styles
+    if _base_styles is None:
+        styles = getSampleStyleSheet()
+
+        title_style = ParagraphStyle('Title', 
+                                     parent=styles['Heading1'], 
+                                     fontName='NotoSansJP-Bold', 
+                                     fontSize=16, 
+                                     textColor=colors.HexColor("#373737"))
+
+        normal_style = ParagraphStyle('Normal', 
+                                      parent=styles['Normal'], 
+                                      fontName='NotoSansJP', 
+                                      fontSize=7, 
+                                      alignment=TA_CENTER, 
+                                      textColor=colors.HexColor("#373737"))
+
+        bold_style = ParagraphStyle('Bold', 
+                                    parent=normal_style, 
+                                    fontName='NotoSansJP-Bold', 
+                                    fontSize=8, 
+                                    textColor=colors.white)
+
+        bold_style2 = ParagraphStyle('Bold2', 
+                                     parent=normal_style, 
+                                     fontName='NotoSansJP-Bold', 
+                                     fontSize=7, 
                                      textColor=colors.HexColor("#595959"))
 
+        header_style = ParagraphStyle('Header', 
+                                      parent=bold_style, 
+                                      fontSize=10,
+                                      textColor=colors.white)
+
+        special_shift_style = ParagraphStyle('SpecialShift', 
+                                             parent=bold_style2, 
+                                             textColor=colors.HexColor("#595959"))
+
+        _base_styles = {
+            'title': title_style,
+            'normal': normal_style,
+            'bold': bold_style,
+            'bold2': bold_style2,
+            'header': header_style,
+            'special_shift': special_shift_style,
+        }
+    return _base_styles
+
+def register_fonts():
+    global _fonts_registered
+    if not _fonts_registered:
+        pdfmetrics.registerFont(TTFont('NotoSansJP', 'NotoSansJP-VariableFont_wght.ttf'))
+        pdfmetrics.registerFont(TTFont('NotoSansJP-Bold', 'NotoSansJP-Bold.ttf'))
+        _fonts_registered = True
+
 def hex_to_rgb(hex_color):
     hex_color = hex_color.lstrip('#')
     return tuple(int(hex_color[i:i+2], 16) / 255.0 for i in (0, 2, 4))
@@ -70,6 +95,8 @@ def format_shift_for_individual_pdf(shift_type, times, stores):
     Returns:
         list: Paragraphオブジェクトのリスト
     """
+    bold_style2 = _get_base_styles()['bold2']
+
     # シフトが空の場合の処理
     if pd.isna(shift_type) or shift_type == '-' or isinstance(shift_type, (int, float)):
         return [Paragraph('-', bold_style2)]
@@ -104,7 +131,7 @@ def format_shift_for_individual_pdf(shift_type, times, stores):
                 time = times[i + 1] if i + 1 < len(times) else None
                 store = stores[i]
                 if time and store:
-                    color = STORE_COLORS.get(store, "#000000")
+                    color = current_organisation().store_color(store)
                     formatted_shifts.append(
                         Paragraph(f'<font color="{color}"><b>{time}@{store}</b></font>',
                                 bold_style2)
@@ -120,7 +147,7 @@ def format_shift_for_individual_pdf(shift_type, times, stores):
         
         for time, store in zip(times, stores):
             if time and store:
-                color = STORE_COLORS.get(store, "#000000")
+                color = current_organisation().store_color(store)
                 formatted_shifts.append(
                     Paragraph(f'<font color="{color}"><b>{time}@{store}</b></font>',
                             bold_style2)
@@ -130,6 +157,7 @@ def format_shift_for_individual_pdf(shift_type, times, stores):
     # 予期しないシフトタイプの場合
     return [Paragraph('-', bold_style2)]
 
+@timed_function()
 def generate_help_table_pdf(data, year, month, area=None):
     buffer = io.BytesIO()
     # ページサイズを少し大きくする
@@ -137,8 +165,7 @@ def generate_help_table_pdf(data, year, month, area=None):
     doc = SimpleDocTemplate(buffer, pagesize=custom_page_size, rightMargin=5*mm, leftMargin=5*mm, topMargin=10*mm, bottomMargin=10*mm)
     elements = []
 
-    pdfmetrics.registerFont(TTFont('NotoSansJP', 'NotoSansJP-VariableFont_wght.ttf'))
-    pdfmetrics.registerFont(TTFont('NotoSansJP-Bold', 'NotoSansJP-Bold.ttf'))
+    register_fonts()
 
     styles = getSampleStyleSheet()
 
@@ -176,11 +203,12 @@ def generate_help_table_pdf(data, year, month, area=None):
     ]
 
     # エリアに基づいて従業員リストを取得
-    if area and area in EMPLOYEE_AREAS:
-        employees = EMPLOYEE_AREAS[area]
+    organisation = current_organisation()
+    if area and area in organisation.employee_areas:
+        employees = organisation.employee_areas[area]
         title_prefix = f"{area} "
     else:
-        employees = EMPLOYEES
+        employees = organisation.employees
         title_prefix = ""
 
     for i, (range_start, range_end) in enumerate(date_ranges):
@@ -248,6 +276,8 @@ def generate_help_table_pdf(data, year, month, area=None):
 
 
 def format_shift_for_pdf(shift):
+    normal_style = _get_base_styles()['normal']
+    bold_style = _get_base_styles()['bold']
     if pd.isna(shift) or shift == '-':
         return Paragraph('-', normal_style)
     
@@ -293,20 +323,22 @@ def format_shift_for_pdf(shift):
     for part in shift_parts[1:]:
         if '@' in part:
             time, store = part.split('@')
-            color = STORE_COLORS.get(store, "#373737")
+            color = current_organisation().store_color(store, "#373737")
             formatted_parts.append(Paragraph(f'<font color="{color}"><b>{time}@{store}</b></font>', bold_style))
         else:
             formatted_parts.append(Paragraph(f'<b>{part}</b>', bold_style))
     
     return formatted_parts
 
+@timed_function()
 def generate_individual_pdf(data, employee, year, month):
     buffer = BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=10*mm, leftMargin=10*mm, topMargin=10*mm, bottomMargin=10*mm)
     elements = []
 
-    pdfmetrics.registerFont(TTFont('NotoSansJP', 'NotoSansJP-VariableFont_wght.ttf'))
-    pdfmetrics.registerFont(TTFont('NotoSansJP-Bold', 'NotoSansJP-Bold.ttf'))
+    register_fonts()
+    title_style = _get_base_styles()['title']
+    bold_style2 = _get_base_styles()['bold2']
 
     title = Paragraph(f"{employee}さん {year}年{month}月 シフト表", title_style)
     elements.append(title)
@@ -406,6 +438,7 @@ def time_to_minutes(time_str):
         # 時間の解析に失敗した場合は、非常に遅い時間として扱う
         return 24 * 60  # 24:00 = 1440分
 
+@timed_function()
 def generate_store_pdf(store_data, selected_store, selected_year, selected_month):
     """店舗別のPDFを生成する関数"""
     buffer = io.BytesIO()
@@ -413,8 +446,7 @@ def generate_store_pdf(store_data, selected_store, selected_year, selected_month
     elements = []
 
     # フォントの登録
-    pdfmetrics.registerFont(TTFont('NotoSansJP', 'NotoSansJP-VariableFont_wght.ttf'))
-    pdfmetrics.registerFont(TTFont('NotoSansJP-Bold', 'NotoSansJP-Bold.ttf'))
+    register_fonts()
 
     # スタイルの定義
     styles = getSampleStyleSheet()
@@ -467,7 +499,7 @@ def generate_store_pdf(store_data, selected_store, selected_year, selected_month
         shifts = []
 
         # 各従業員のシフトを処理
-        for emp in EMPLOYEES:
+        for emp in current_organisation().employees:
             shift = row.get(emp, '-')
             if shift != '-' and not pd.isna(shift):
                 shift_type, shift_times, shift_stores = parse_shift(shift)
@@ -0,0 +1,224 @@
+from itertools import chain
+import numpy as np
+import pandas as pd
+from organisation import current_organisation
+from frozen_periods import frozen_periods
+
+# 期間データの種類（キャッシュのキーや固定済み期間のファイル名に使う）
+KIND_SHIFTS = 'shifts'
+KIND_HELP_REQUESTS = 'store_help_requests'
+
+
+def get_period_range(year, month):
+    """対象期間（当月16日～翌月15日）の開始日と終了日を返す"""
+    start_date = pd.Timestamp(year, month, 16)
+    end_date = start_date + pd.DateOffset(months=1) - pd.Timedelta(days=1)
+    return start_date, end_date
+
+
+def encode_shift_frame(shift_data, extra_values=()):
+    """シフトの表を、全列で共通の辞書（カテゴリ）を持つカテゴリ型に変換
+
+    期間内のシフト文字列は数百種類程度しかないため、セルごとに文字列を持たずに
+    整数コードと共通の辞書で保持する。文字列に戻すのは表示するときだけ。
+    """
+    values = set(pd.unique(shift_data.to_numpy().ravel())) | set(extra_values) | {'-'}
+    dtype = pd.CategoricalDtype(sorted(value for value in values if isinstance(value, str)))
+    return shift_data.astype(dtype)
+
+
+def shift_categories(shift_data):
+    """シフトの表の共通の辞書を返す（カテゴリ型でなければNone）"""
+    for dtype in shift_data.dtypes:
+        if isinstance(dtype, pd.CategoricalDtype):
+            return dtype.categories
+    return None
+
+
+def build_shift_frame(shifts, year, month):
+    """取得したシフトを期間内の全日付×全従業員の表に展開（未登録は'-'）"""
+    start_date, end_date = get_period_range(year, month)
+    date_range = pd.date_range(start=start_date, end=end_date)
+
+    employees = current_organisation().employees
+    if shifts is None or shifts.empty:
+        return encode_shift_frame(pd.DataFrame(index=date_range, columns=employees, data='-'))
+
+    # 従業員一覧にない列（退職者など）も残す
+    columns = employees + [employee for employee in shifts.columns if employee not in employees]
+    aligned = shifts.reindex(index=date_range, columns=columns)
+    shift_data = aligned.astype(object).where(aligned.notna(), '-').astype(str)
+    shift_data.columns.name = None
+    return encode_shift_frame(shift_data)
+
+
+def apply_shift_overlay(shift_data, overlay):
+    """共有のシフト表にセッションの未反映の編集を重ねる（編集がなければ共有の表をそのまま返す）
+
+    編集は送信し終えるまで重ねる（main.prune_shift_overlay で送信し終えた編集を削除する）。
+    """
+    if not overlay:
+        return shift_data
+
+    categories = shift_categories(shift_data)
+    if categories is not None and not set(overlay.values()).issubset(categories):
+        # 辞書にないシフトがあれば辞書を拡張してから書き込む
+        shift_data = encode_shift_frame(shift_data, overlay.values())
+    else:
+        shift_data = shift_data.copy()
+    for (date, employee), shift in overlay.items():
+        if date in shift_data.index and employee in shift_data.columns:
+            shift_data.loc[date, employee] = shift
+    return shift_data
+
+
+def load_frozen_frame(kind, year, month):
+    """固定済みの期間データを読み込み、データベースから読み込んだ場合と同じ形にする
+
+    固定した後に追加した従業員・店舗の列は '-' で補う（シフトは build_shift_frame でカテゴリ型にする）。
+    """
+    frame = frozen_periods.load(kind, year, month)
+    if kind == KIND_SHIFTS:
+        return build_shift_frame(frame, year, month)
+    if frame.empty:
+        return frame
+    all_stores = current_organisation().stores
+    return frame.reindex(columns=list(frame.columns) + [store for store in all_stores if store not in frame.columns],
+                         fill_value='-')
+
+
+class ShiftSnapshot:
+    """全セッションで共有する期間のシフト表（読み取り専用）とセルごとの行バージョン"""
+
+    def __init__(self, frame, row_versions=None):
+        self.frame = frame
+        # (日付, 従業員) -> バージョン。データベースにversion列がない場合はNone
+        self.row_versions = row_versions
+        self._interval_index = None
+
+    def interval_index(self):
+        """時間帯の索引（重複・過不足のチェック用。初回に作成して保持する）"""
+        if getattr(self, '_interval_index', None) is None:
+            from intervals import ShiftIntervalIndex
+            self._interval_index = ShiftIntervalIndex(self.frame)
+        return self._interval_index
+
+    def expected_version(self, date, employee):
+        """保存時に期待するバージョン（行がなければ0、バージョン管理していなければNone）"""
+        if self.row_versions is None:
+            return None
+        return self.row_versions.get((pd.Timestamp(date), employee), 0)
+
+    def with_rows(self, rows):
+        """保存後の行（date, employee, shift, version）を反映した新しいスナップショットを返す"""
+        overlay = {}
+        row_versions = None if self.row_versions is None else dict(self.row_versions)
+        for row in rows:
+            key = (pd.Timestamp(row['date']), row['employee'])
+            overlay[key] = row['shift'] if row.get('shift') is not None else '-'
+            if row.get('version') is not None:
+                row_versions = {} if row_versions is None else row_versions
+                row_versions[key] = int(row['version'])
+        return ShiftSnapshot(apply_shift_overlay(self.frame, overlay), row_versions)
+
+
+def build_shift_snapshot(rows, year, month):
+    """1行1セル形式のシフトから共有用のスナップショットを作成"""
+    if rows is None or rows.empty:
+        return ShiftSnapshot(build_shift_frame(None, year, month))
+
+    pivot = rows.pivot(index='date', columns='employee', values='shift')
+    row_versions = None
+    if 'version' in rows.columns:
+        row_versions = dict(zip(zip(rows['date'], rows['employee']), rows['version'].astype(int)))
+    return ShiftSnapshot(build_shift_frame(pivot, year, month), row_versions)
+
+
+def build_day_frame(days, index, columns, fill='-'):
+    """日付ごとの {列名: 値}（(日付, 辞書) の一覧）から index×columns の表を作成
+
+    全列をあらかじめ確保した配列に、行・列の位置を指定してまとめて書き込む（ピボットや列の追加をしない）。
+    columns にない列名（退職者・廃止した店舗など）は末尾に追加する。
+    """
+    index = pd.DatetimeIndex(index)
+    cells = [cell for _, cell in days]
+    names = list(chain.from_iterable(cells))
+    values = np.array(list(chain.from_iterable(cell.values() for cell in cells)), dtype=object)
+    columns = list(columns) + [name for name in pd.unique(np.array(names, dtype=object)) if name not in set(columns)]
+
+    data = np.full((len(index), len(columns)), fill, dtype=object)
+    if names:
+        rows = np.repeat(index.get_indexer(pd.DatetimeIndex([date for date, _ in days])), [len(cell) for cell in cells])
+        cols = pd.Index(columns).get_indexer(names)
+        values[pd.isna(values)] = fill
+        valid = rows >= 0
+        data[rows[valid], cols[valid]] = values[valid]
+    return pd.DataFrame(data, index=index, columns=columns)
+
+
+def build_shift_snapshot_from_days(days, year, month):
+    """日付ごとに集計済みのシフト（(日付, {従業員: シフト}, {従業員: バージョン}) の一覧）からスナップショットを作成"""
+    start_date, end_date = get_period_range(year, month)
+    frame = build_day_frame([(date, shifts) for date, shifts, _ in days], pd.date_range(start=start_date, end=end_date),
+                            current_organisation().employees)
+    row_versions = {(pd.Timestamp(date), employee): int(version)
+                    for date, _, versions in days for employee, version in (versions or {}).items() if version is not None}
+    return ShiftSnapshot(encode_shift_frame(frame), row_versions or None)
+
+
+def build_store_help_frame(days):
+    """日付ごとに集計済みの店舗ヘルプ希望（(日付, {店舗: 時間帯}) の一覧）から、ヘルプ希望のある日付×全店舗の表を作成"""
+    if not days:
+        return pd.DataFrame()
+    all_stores = current_organisation().stores
+    index = pd.DatetimeIndex(sorted(pd.Timestamp(date) for date, _ in days), name='date')
+    frame = build_day_frame(days, index, all_stores)
+    frame.columns.name = 'store'
+    return frame
+
+
+def build_store_pdf_data(shift_data, store_help_requests, store, year, month):
+    """店舗別PDF用に、シフトデータへ選択店舗のヘルプ希望列を追加"""
+    start_date, end_date = get_period_range(year, month)
+    store_data = shift_data.copy()
+
+    if store_help_requests.empty:
+        # ヘルプ希望データが空の場合、すべての日付で'-'を設定
+        date_range = pd.date_range(start=start_date, end=end_date)
+        store_help_requests = pd.DataFrame(index=date_range, columns=[store])
+        store_help_requests[store] = '-'
+    elif store not in store_help_requests.columns:
+        # 選択された店舗のデータが存在しない場合、'-'で列を追加
+        store_help_requests = store_help_requests.copy()
+        store_help_requests[store] = '-'
+
+    # シフトデータにヘルプ希望データを追加
+    store_data[store] = store_help_requests[store]
+    return store_data
+
+
+class PeriodData:
+    """1期間分のシフトと店舗ヘルプ希望をまとめて保持"""
+
+    def __init__(self, year, month, shifts, store_help_requests):
+        self.year = year
+        self.month = month
+        self.start_date, self.end_date = get_period_range(year, month)
+        self.shifts = shifts
+        self.store_help_requests = store_help_requests
+
+
+def load_period(db, year, month):
+    """データベースから1期間分のデータを一度だけ取得（固定済みの期間はファイルから読み込む）"""
+    start_date, end_date = get_period_range(year, month)
+    if frozen_periods.is_frozen(year, month):
+        shifts = load_frozen_frame(KIND_SHIFTS, year, month)
+        store_help_requests = load_frozen_frame(KIND_HELP_REQUESTS, year, month)
+    elif getattr(db, 'period_views', False):
+        # 日付ごとに集計済みのビューから直接表を作る
+        shifts = build_shift_snapshot_from_days(db.get_shift_days(start_date, end_date), year, month).frame
+        store_help_requests = build_store_help_frame(db.get_store_help_days(start_date, end_date))
+    else:
+        shifts = build_shift_frame(db.get_shifts(start_date, end_date), year, month)
+        store_help_requests = db.get_store_help_requests(start_date, end_date)
+    return PeriodData(year, month, shifts, store_help_requests)
@@ -0,0 +1,361 @@
+"""期間データ（シフト・店舗ヘルプ希望）のキャッシュとバックグラウンドでの事前読み込み
+
+プロセス内のキャッシュに加え、HELP2_SHARED_CACHE で共有キャッシュを指定すると
+他のプロセスが読み込んだスナップショットを再利用する（cache_backends.py を参照）。
+キャッシュはテナントごとに分かれ、保持する期間データの数の上限（HELP2_CACHE_MAX_PERIODS、テナントの cache_periods）を
+テナントごとに持つため、多くの期間を開くテナントがあっても他のテナントの期間データは破棄されない。
+"""
+import os
+import time
+import logging
+import threading
+from datetime import datetime
+import pandas as pd
+from period import (get_period_range, build_shift_snapshot, build_shift_snapshot_from_days, build_store_help_frame, ShiftSnapshot,
+                    load_frozen_frame, KIND_SHIFTS, KIND_HELP_REQUESTS)
+from frozen_periods import frozen_periods
+from cache_backends import create_backend
+from organisation import organisation_loader
+from tenants import TenantScoped, current_tenant, set_current_tenant
+
+logger = logging.getLogger(__name__)
+
+PERIOD_CACHE_TTL = int(os.environ.get('HELP2_CACHE_TTL', 3600))
+# 有効期限のこの秒数前になったらバックグラウンドで再読み込みする
+WARM_REFRESH_MARGIN = int(os.environ.get('HELP2_WARM_REFRESH_MARGIN', 300))
+WARM_INTERVAL = int(os.environ.get('HELP2_WARM_INTERVAL', 60))
+# テナントごとに保持する期間データ（種類×期間）の上限。超えたら最後に参照された時刻の古いものから破棄する（0なら無制限）
+PERIOD_CACHE_MAX_ENTRIES = int(os.environ.get('HELP2_CACHE_MAX_PERIODS', 48))
+# 読み込みに失敗したときに返す最後のデータの上限（max_entries が無制限でも、この数を超えたら古いものから破棄する）
+PERIOD_CACHE_MAX_LAST_GOOD = int(os.environ.get('HELP2_CACHE_MAX_LAST_GOOD', 48))
+
+
+def period_of(date):
+    """日付が属する期間（16日始まり）の(年, 月)を返す"""
+    date = pd.Timestamp(date)
+    if date.day >= 16:
+        return date.year, date.month
+    previous = date - pd.DateOffset(months=1)
+    return previous.year, previous.month
+
+
+def adjacent_periods(year, month):
+    """前の期間・指定期間・次の期間の(年, 月)を返す"""
+    current = pd.Timestamp(year, month, 1)
+    return [((current + pd.DateOffset(months=offset)).year, (current + pd.DateOffset(months=offset)).month)
+            for offset in (-1, 0, 1)]
+
+
+def load_period_data(db, kind, year, month, use_frozen=True):
+    if use_frozen and frozen_periods.is_frozen(year, month):
+        # 固定済みの期間はデータベースに問い合わせない（保存できないため行バージョンは持たない）
+        frame = load_frozen_frame(kind, year, month)
+        return ShiftSnapshot(frame) if kind == KIND_SHIFTS else frame
+    start_date, end_date = get_period_range(year, month)
+    # 日付ごとに集計済みのビューがあれば、ピボットせずに表を作る
+    period_views = getattr(db, 'period_views', False)
+    if kind == KIND_SHIFTS:
+        # 全セッションで共有するため、期間内の全日付×全従業員の表にしてから保持する
+        if period_views:
+            snapshot = build_shift_snapshot_from_days(db.get_shift_days(start_date, end_date), year, month)
+        else:
+            snapshot = build_shift_snapshot(db.get_shift_rows(start_date, end_date), year, month)
+        _verify_rollups(year, month, snapshot.frame)
+        return snapshot
+    if period_views:
+        return build_store_help_frame(db.get_store_help_days(start_date, end_date))
+    return db.get_store_help_requests(start_date, end_date)
+
+
+def _verify_rollups(year, month, frame):
+    """読み込んだシフトで期間の集計が最新か確認する（集計を確認できなくても読み込みは続ける）"""
+    # rollups は period_range 経由でこのモジュールを参照するため、使うときにインポートする
+    from rollups import rollup_store
+    try:
+        rollup_store.verify_period(year, month, frame)
+    except Exception as e:
+        logger.warning('集計を確認できませんでした %d年%d月: %s', year, month, e)
+
+
+class PeriodCache:
+    """(種類, 年, 月)ごとに期間データを保持する（同じキーの同時読み込みは1回にまとめる）
+
+    backend を指定すると、スナップショットとバージョンを他のプロセスと共有する。
+    保存時に invalidate でバージョンを上げると、他のプロセスの古いスナップショットも使われなくなる。
+    context() を指定すると、その値（組織のマスタのバージョン）が変わったスナップショットは使わない
+    （共有するスナップショットにも context を付けて保存し、マスタの異なるプロセスのものは読み込み直す）。
+    namespace は共有キャッシュのキーの接頭辞（テナントごとに分ける）、max_entries は保持する期間データの上限。
+    """
+
+    def __init__(self, ttl=PERIOD_CACHE_TTL, backend=None, context=None, namespace=None, max_entries=PERIOD_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.backend = backend
+        self.context = context
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.evictions = 0
+        # キー -> (値, 保存時刻, バージョン)
+        self._entries = {}
+        # キー -> 読み込んだときの context() の値
+        self._contexts = {}
+        self._accessed = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+        # 無効化のたびに増やし、無効化前に読み込み始めた古いデータを保存しないようにする
+        self._generation = 0
+        # 読み込みに失敗したため古いデータを返しているキー -> そのデータの保存時刻
+        self._stale = {}
+        # 有効期限切れ・無効化後も、読み込みに失敗したときに返すための最後に読み込めたデータ
+        self._last_good = {}
+
+    def _context(self):
+        return None if self.context is None else self.context()
+
+    def shared_key(self, key):
+        kind, year, month = key
+        return ('' if self.namespace is None else f'{self.namespace}/') + f'{kind}:{year}-{month:02d}'
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _fresh_entry(self, key):
+        entry = self._entries.get(key)
+        if entry is None or time.time() - entry[1] >= self.ttl:
+            return None
+        # 組織のマスタが変わった場合は使わない
+        context = self._context()
+        if self._contexts.get(key) != context:
+            return None
+        # 他のプロセスで更新された場合は使わない
+        if self.backend is not None and self.backend.current_version(self.shared_key(key)) != entry[2]:
+            return None
+        return entry
+
+    def get(self, kind, year, month, loader):
+        key = (kind, year, month)
+        self._accessed[key] = time.time()
+        entry = self._fresh_entry(key)
+        if entry is not None:
+            return entry[0]
+
+        # 同じ期間を複数のセッションが同時に要求しても、データベースへの問い合わせは1回だけ行う
+        with self._key_lock(key):
+            entry = self._fresh_entry(key)
+            if entry is not None:
+                return entry[0]
+            try:
+                return self._load(key, loader, max_shared_age=self.ttl)
+            except Exception as e:
+                # データベースに接続できない場合は、最後に読み込めたデータを返す
+                last_good = self._last_good.get(key)
+                if last_good is None:
+                    raise
+                logger.warning('期間データを読み込めないため、前回のデータを使います %s: %s', key, e)
+                self._stale[key] = last_good[1]
+                return last_good[0]
+
+    def peek(self, kind, year, month):
+        """保持している有効な期間データを返す（なければNone。読み込まず、参照したことにもしない）
+
+        範囲の集計のように多くの期間を一度ずつ読む処理で、キャッシュに全期間を溜めないために使う。
+        """
+        entry = self._fresh_entry((kind, year, month))
+        return None if entry is None else entry[0]
+
+    def stale_since(self, kind, year, month):
+        """前回のデータを返している場合はその保存時刻、最新であればNoneを返す"""
+        return self._stale.get((kind, year, month))
+
+    def _load(self, key, loader, max_shared_age):
+        generation = self._generation
+        context = self._context()
+        version = 0
+        value = None
+        stored_at = None
+        if self.backend is not None:
+            shared_key = self.shared_key(key)
+            version = self.backend.current_version(shared_key)
+            shared = self.backend.get(shared_key)
+            if (shared is not None and shared[0] == version and time.time() - shared[1] < max_shared_age
+                    and isinstance(shared[2], tuple) and shared[2][0] == context):
+                stored_at, value = shared[1], shared[2][1]
+
+        if stored_at is None:
+            value = loader(*key)
+            stored_at = time.time()
+            if self.backend is not None:
+                self.backend.put(self.shared_key(key), version, (context, value))
+
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = (value, stored_at, version)
+                self._contexts[key] = context
+            self._last_good[key] = (value, stored_at)
+            self._stale.pop(key, None)
+            self._evict()
+        return value
+
+    def _evict(self):
+        """max_entries を超えた分を、最後に参照された時刻の古いものから破棄する（self._lock を取得して呼ぶ）"""
+        if not self.max_entries:
+            self._trim_last_good()
+            return
+        excess = len(self._last_good) - self.max_entries
+        if excess <= 0:
+            return
+        # 読み込んだだけで参照されていない期間（事前読み込み）は読み込んだ時刻で比べる
+        keys = sorted(self._last_good, key=lambda key: self._accessed.get(key, self._last_good[key][1]))[:excess]
+        for key in keys:
+            for entries in (self._entries, self._contexts, self._last_good, self._stale, self._accessed):
+                entries.pop(key, None)
+        self.evictions += len(keys)
+
+    def _trim_last_good(self):
+        """最後に読み込めたデータを PERIOD_CACHE_MAX_LAST_GOOD 件までにする（有効なデータのない・古いキーから破棄する）"""
+        excess = len(self._last_good) - PERIOD_CACHE_MAX_LAST_GOOD
+        if excess <= 0:
+            return
+        keys = sorted(self._last_good, key=lambda key: (key in self._entries, self._accessed.get(key, self._last_good[key][1])))
+        for key in keys[:excess]:
+            self._last_good.pop(key, None)
+            self._stale.pop(key, None)
+
+    def refresh(self, kind, year, month, loader, max_shared_age=0):
+        """再読み込みして差し替える（読み込み中も古いデータを返し続ける）
+
+        max_shared_age 秒以内に他のプロセスが保存した共有スナップショットがあれば、それを使う。
+        """
+        key = (kind, year, month)
+        with self._key_lock(key):
+            return self._load(key, loader, max_shared_age)
+
+    def patch(self, kind, year, month, update):
+        """保持している期間データを update(値) の結果に差し替える（保持していなければ破棄する）
+
+        保存した行だけを反映するために使い、期間全体の再読み込みを避ける。
+        """
+        key = (kind, year, month)
+        with self._key_lock(key):
+            entry = self._fresh_entry(key)
+            if entry is None:
+                self.invalidate(kind, year, month)
+                return None
+            value = update(entry[0])
+            version = entry[2]
+            if self.backend is not None:
+                shared_key = self.shared_key(key)
+                version = self.backend.bump_version(shared_key)
+                self.backend.put(shared_key, version, (self._contexts.get(key), value))
+            with self._lock:
+                # 差し替え前に読み込み始めたデータで上書きしないようにする
+                self._generation += 1
+                self._entries[key] = (value, entry[1], version)
+                self._last_good[key] = (value, entry[1])
+                # 差し替えたデータは最新なので、古いデータを返している状態を解除する
+                self._stale.pop(key, None)
+            return value
+
+    def invalidate(self, kind=None, year=None, month=None):
+        with self._lock:
+            self._generation += 1
+            keys = [key for key in self._entries
+                    if (kind is None or key[0] == kind) and (year is None or key[1] == year) and (month is None or key[2] == month)]
+            for key in keys:
+                del self._entries[key]
+        if self.backend is not None:
+            if kind is not None and year is not None and month is not None:
+                keys = set(keys) | {(kind, year, month)}
+            for key in keys:
+                self.backend.bump_version(self.shared_key(key))
+
+    def version(self, kind, year, month):
+        """保持している期間データの(バージョン, 保存時刻)を返す（なければNone）"""
+        entry = self._entries.get((kind, year, month))
+        return None if entry is None else (entry[2], entry[1])
+
+    def expiring_keys(self, margin):
+        """有効期限まで margin 秒未満のキーのうち、有効期間内に参照されたものを返す"""
+        now = time.time()
+        return [key for key, (_, stored_at, _) in list(self._entries.items())
+                if now - stored_at >= self.ttl - margin and now - self._accessed.get(key, stored_at) < self.ttl]
+
+    def stats(self):
+        """保持している期間データの数・上限・破棄した数を返す"""
+        return {'entries': len(self._last_good), 'max_entries': self.max_entries, 'evictions': self.evictions}
+
+    def __contains__(self, key):
+        return self._fresh_entry(key) is not None
+
+
+class CacheWarmer(threading.Thread):
+    """現在・前後の期間を起動時に読み込み、有効期限の少し前に再読み込みするバックグラウンドスレッド"""
+
+    def __init__(self, cache, loader, interval=WARM_INTERVAL, margin=WARM_REFRESH_MARGIN, tenant=None):
+        super().__init__(name='help2-cache-warmer' + ('' if tenant is None else f'-{tenant.id}'), daemon=True)
+        self.tenant = tenant
+        self.cache = cache
+        self.loader = loader
+        self.interval = interval
+        self.margin = margin
+        self._requests = set()
+        self._requests_lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+    def request_refresh(self, keys):
+        """指定したキーをバックグラウンドで読み込むよう依頼する"""
+        with self._requests_lock:
+            self._requests.update(keys)
+        self._wakeup.set()
+
+    def _target_keys(self):
+        year, month = period_of(datetime.now())
+        return [(kind, y, m) for y, m in adjacent_periods(year, month) for kind in (KIND_SHIFTS, KIND_HELP_REQUESTS)]
+
+    def _refresh(self, key):
+        try:
+            # 他のプロセスが直前に再読み込みしていれば、そのスナップショットを使う
+            self.cache.refresh(*key, self.loader, max_shared_age=self.cache.ttl - self.margin)
+        except Exception as e:
+            logger.warning('期間データの事前読み込みに失敗しました %s: %s', key, e)
+
+    def run(self):
+        if self.tenant is not None:
+            # 読み込みで参照するデータベース・組織のマスタをこのテナントのものにする
+            set_current_tenant(self.tenant)
+        while True:
+            self._wakeup.clear()
+            with self._requests_lock:
+                requested, self._requests = self._requests, set()
+            keys = set(requested) | set(self.cache.expiring_keys(self.margin))
+            keys |= {key for key in self._target_keys() if key not in self.cache}
+            for key in sorted(keys):
+                self._refresh(key)
+            self._wakeup.wait(self.interval)
+
+
+def _tenant_period_cache(tenant):
+    loader = organisation_loader.for_tenant(tenant)
+    return PeriodCache(backend=_shared_backend, context=lambda: loader.current().version,
+                       namespace=None if tenant.is_default else tenant.id,
+                       max_entries=PERIOD_CACHE_MAX_ENTRIES if tenant.cache_periods is None else tenant.cache_periods)
+
+
+# 期間キャッシュのシングルトンインスタンスを作成（テナントごと。共有キャッシュの保存先は全テナントで1つ）
+_shared_backend = create_backend()
+period_cache = TenantScoped(_tenant_period_cache)
+_warmers = {}
+_warmer_lock = threading.Lock()
+
+
+def start_cache_warmer(db):
+    """プロセスごと・テナントごとに1回だけ事前読み込みスレッドを起動する"""
+    tenant = current_tenant()
+    with _warmer_lock:
+        warmer = _warmers.get(tenant.id)
+        if warmer is None:
+            warmer = _warmers[tenant.id] = CacheWarmer(period_cache.for_tenant(tenant),
+                                                       lambda kind, year, month: load_period_data(db, kind, year, month),
+                                                       tenant=tenant)
+            warmer.start()
+    return warmer
@@ -0,0 +1,150 @@
+"""期間（16日～翌月15日）をまたぐ日付の範囲（四半期・年度など）の読み込みと集計
+
+範囲を含む期間を1つずつ load(種類, 年, 月) で取得し、範囲内の日付だけを切り出して処理する。
+全期間をつないだ大きな表は作らず、期間ごとの集計結果（従業員・店舗ごとの数行）だけを足し合わせるため、
+範囲が1年でもメモリに載る期間の表は1つだけになる。
+
+    python cli.py range-summary --fiscal-year 2024 --by store
+"""
+import numpy as np
+import pandas as pd
+from organisation import current_organisation
+from period import get_period_range, KIND_SHIFTS, KIND_HELP_REQUESTS
+from period_cache import period_of
+from utils import parse_shift, count_shift
+
+# 年度の最初の期間の月（4月16日～翌年4月15日）
+FISCAL_FIRST_MONTH = 4
+# 従業員ごとに日数を数えるシフトの種類（半日は0.5日ではなく1回として数える）
+SUMMARY_SHIFT_TYPES = ['1日可', 'AM可', 'PM可', 'その他', '休み', '鹿屋', 'かご北', 'リクルート']
+EMPLOYEE_COLUMNS = ['area', 'employee', 'days', 'help_days'] + SUMMARY_SHIFT_TYPES
+STORE_COLUMNS = ['area', 'store', 'requests', '充足', '一部', '未充足', 'requested_minutes', 'covered_minutes',
+                 'coverage_rate', 'helper_days']
+COLUMN_LABELS = {
+    'area': 'エリア', 'employee': '従業員', 'store': '店舗', 'days': '出勤日数', 'help_days': 'ヘルプ日数',
+    'requests': '希望件数', 'requested_minutes': '希望（分）', 'covered_minutes': '割り当て済み（分）',
+    'coverage_rate': '充足率', 'helper_days': 'ヘルプ人日',
+}
+
+
+def periods_in_range(start_date, end_date):
+    """日付の範囲を含む期間（16日始まり）の(年, 月)の一覧"""
+    periods = []
+    year, month = period_of(start_date)
+    last = period_of(end_date)
+    while (year, month) <= last:
+        periods.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return periods
+
+
+def period_label(year, month):
+    return f'{year}年{month}月'
+
+
+def iter_range_frames(load, kind, start_date, end_date):
+    """範囲を含む期間ごとに (年, 月, 範囲内の日付, 範囲内の日付だけの表) を返す
+
+    load(種類, 年, 月) は期間の表（シフトは日付×従業員、ヘルプ希望は日付×店舗）を返す。
+    ヘルプ希望のない期間は、範囲内の日付だけの列のない表を返す。
+    """
+    start_date, end_date = pd.Timestamp(start_date).normalize(), pd.Timestamp(end_date).normalize()
+    if end_date < start_date:
+        raise ValueError('終了日が開始日より前です')
+    for year, month in periods_in_range(start_date, end_date):
+        period_start, period_end = get_period_range(year, month)
+        dates = pd.date_range(max(start_date, period_start), min(end_date, period_end))
+        frame = load(kind, year, month)
+        if frame is None or frame.empty:
+            frame = pd.DataFrame(index=dates)
+        yield year, month, dates, frame.reindex(index=dates)
+
+
+def _employee_period_summary(frame):
+    """1期間分のシフトの表から、従業員ごとの出勤日数・種類ごとの日数・ヘルプ日数を求める（値の種類ごとに一度だけ解析する）"""
+    values = frame.to_numpy(dtype=object)
+    codes, uniques = pd.factorize(values.ravel())
+    codes = np.where(codes < 0, len(uniques), codes).reshape(values.shape)
+    parsed = [parse_shift(value) for value in uniques]
+    # 末尾は欠損値用
+    weights = {'days': np.array([count_shift(value) for value in uniques] + [0], dtype=float),
+               'help_days': np.array([any(stores) for _, _, stores in parsed] + [False], dtype=float)}
+    for shift_type in SUMMARY_SHIFT_TYPES:
+        weights[shift_type] = np.array([parsed_type == shift_type for parsed_type, _, _ in parsed] + [False], dtype=float)
+    return pd.DataFrame({name: weight[codes].sum(axis=0) for name, weight in weights.items()}, index=frame.columns)
+
+
+def employee_range_summary(load, start_date, end_date, employee_areas=None):
+    """範囲内の従業員ごとの集計と、期間ごとの出勤日数の表を返す
+
+    集計（EMPLOYEE_COLUMNS）: 出勤日数（1日可は1日、AM可・PM可は0.5日）・ヘルプ日数・シフトの種類ごとの日数
+    期間ごとの表: 従業員×期間（'2024年4月'）の出勤日数
+    """
+    employee_areas = current_organisation().employee_areas if employee_areas is None else employee_areas
+    employee_area = {employee: area for area, employees in employee_areas.items() for employee in employees}
+    employees = [employee for employees in employee_areas.values() for employee in employees]
+
+    totals = None
+    monthly = {}
+    for year, month, _, frame in iter_range_frames(load, KIND_SHIFTS, start_date, end_date):
+        summary = _employee_period_summary(frame)
+        monthly[period_label(year, month)] = summary['days']
+        totals = summary if totals is None else totals.add(summary, fill_value=0)
+
+    # 一覧にない従業員（退職者など）も、範囲内にシフトがあれば末尾に残す
+    extra = [] if totals is None else [employee for employee in totals.index if employee not in employee_area]
+    index = pd.Index(employees + extra)
+    totals = (totals if totals is not None else pd.DataFrame(columns=EMPLOYEE_COLUMNS[2:], dtype=float)).reindex(index, fill_value=0)
+    totals = totals.reindex(columns=EMPLOYEE_COLUMNS[2:], fill_value=0)
+    counts = ['help_days'] + SUMMARY_SHIFT_TYPES
+    totals[counts] = totals[counts].astype(np.int64)
+    totals.insert(0, 'employee', index)
+    totals.insert(0, 'area', [employee_area.get(employee, '') for employee in index])
+    monthly = pd.DataFrame(monthly, index=index).fillna(0)
+    monthly['合計'] = monthly.sum(axis=1)
+    monthly.index.name = 'employee'
+    return totals.reset_index(drop=True), monthly.reset_index()
+
+
+def store_range_summary(load, start_date, end_date, areas=None):
+    """範囲内の店舗ごとのヘルプ希望の充足状況（STORE_COLUMNS）を返す
+
+    期間ごとに fulfilment.fulfilment_report を作って店舗ごとに集計し、件数と分数を足し合わせる。
+    ヘルプ人日は、店舗に割り当てられた (日付, 従業員) の数。
+    """
+    from intervals import ShiftIntervalIndex
+    from fulfilment import fulfilment_report, summarize_fulfilment
+
+    areas = current_organisation().areas if areas is None else areas
+    stores = [(area, store) for area, area_stores in areas.items() for store in area_stores]
+    numeric = [column for column in STORE_COLUMNS[2:] if column != 'coverage_rate']
+    totals = pd.DataFrame(0.0, index=pd.MultiIndex.from_tuples(stores, names=['area', 'store']), columns=numeric)
+
+    shift_frames = iter_range_frames(load, KIND_SHIFTS, start_date, end_date)
+    help_frames = iter_range_frames(load, KIND_HELP_REQUESTS, start_date, end_date)
+    for (_, _, _, shifts), (_, _, _, store_help_requests) in zip(shift_frames, help_frames):
+        index = ShiftIntervalIndex(shifts)
+        summary = summarize_fulfilment(fulfilment_report(store_help_requests, index, areas), 'store').set_index(['area', 'store'])
+        summary = summary.reindex(index=totals.index, columns=numeric, fill_value=0)
+        assigned = pd.concat([index.intervals[['date', 'store', 'employee']], index.untimed[['date', 'store', 'employee']]])
+        helper_days = assigned.drop_duplicates().groupby('store').size()
+        summary['helper_days'] = helper_days.reindex(totals.index.get_level_values('store'), fill_value=0).to_numpy()
+        totals += summary.fillna(0)
+
+    totals['coverage_rate'] = (totals['covered_minutes'] / totals['requested_minutes'].where(totals['requested_minutes'] > 0)).round(3)
+    counts = ['requests', '充足', '一部', '未充足', 'helper_days']
+    totals[counts] = totals[counts].astype(np.int64)
+    return totals.reset_index().reindex(columns=STORE_COLUMNS)
+
+
+def fiscal_year_of(year, month, first_month=FISCAL_FIRST_MONTH):
+    """期間（年, 月）が属する年度"""
+    return year if month >= first_month else year - 1
+
+
+def fiscal_year_range(year, first_month=FISCAL_FIRST_MONTH):
+    """first_month 月の期間から始まる1年間（12期間）の開始日と終了日"""
+    start_date, _ = get_period_range(year, first_month)
+    last_year, last_month = (year, first_month - 1) if first_month > 1 else (year - 1, 12)
+    _, end_date = get_period_range(last_year + 1, last_month)
+    return start_date, end_date
@@ -0,0 +1,117 @@
+"""処理時間の計測（リランごとのフェーズ計測・構造化ログ・cProfile出力）
+
+環境変数:
+    HELP2_TIMING_LOG=1        計測結果をJSON形式でログ出力（標準エラー）
+    HELP2_DEBUG_PANEL=1       サイドバーに計測結果のパネルを表示（URLに ?debug=1 でも可）
+    HELP2_PROFILE_DIR=path    リランごとにcProfileの結果を path に保存
+"""
+import os
+import json
+import time
+import logging
+import cProfile
+import functools
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger('help2.timing')
+
+if os.environ.get('HELP2_TIMING_LOG'):
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+PROFILE_DIR = os.environ.get('HELP2_PROFILE_DIR')
+
+# 現在のリランで計測した (フェーズ名, 秒数) の一覧
+_current_timings = contextvars.ContextVar('help2_timings', default=None)
+
+
+def start_rerun():
+    """リランの開始時に呼び出し、計測結果をリセットする"""
+    timings = []
+    _current_timings.set(timings)
+    return timings
+
+
+def get_rerun_timings():
+    """現在のリランで計測した (フェーズ名, 秒数) の一覧を返す"""
+    return list(_current_timings.get() or [])
+
+
+def record_timing(phase, seconds, **fields):
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.append((phase, seconds))
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({'event': 'timing', 'phase': phase, 'ms': round(seconds * 1000, 3), **fields},
+                               ensure_ascii=False, default=str))
+
+
+@contextmanager
+def timed(phase, **fields):
+    """with文で囲んだ処理の時間を計測する"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(phase, time.perf_counter() - started, **fields)
+
+
+def timed_function(phase=None):
+    """関数の実行時間を計測するデコレータ"""
+    def decorator(func):
+        name = phase or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def profile_rerun(profile_dir=PROFILE_DIR):
+    """profile_dirが指定されている場合のみ、リラン全体をcProfileで計測して保存"""
+    if not profile_dir:
+        yield
+        return
+
+    os.makedirs(profile_dir, exist_ok=True)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        path = os.path.join(profile_dir, f"rerun_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.prof")
+        profiler.dump_stats(path)
+        logger.info(json.dumps({'event': 'profile', 'path': path}, ensure_ascii=False))
+
+
+def is_debug_panel_enabled(st):
+    if os.environ.get('HELP2_DEBUG_PANEL'):
+        return True
+    try:
+        return st.query_params.get('debug') == '1'
+    except Exception:
+        return False
+
+
+def render_debug_panel(st, metrics=None):
+    """サイドバーに現在のリランの計測結果と、指定された指標（名前 -> 値）を表示"""
+    if not is_debug_panel_enabled(st):
+        return
+    timings = get_rerun_timings()
+    with st.sidebar.expander('処理時間（デバッグ）', expanded=False):
+        if metrics:
+            st.table([{'指標': name, '値': str(value)} for name, value in metrics.items()])
+        if not timings:
+            st.write('計測結果はありません')
+            return
+        st.table([{'処理': phase, 'ミリ秒': f'{seconds * 1000:.1f}'} for phase, seconds in timings])
@@ -0,0 +1,164 @@
+"""データベース呼び出しのリトライとサーキットブレーカー
+
+店舗からは不安定なモバイル回線で接続するため、一時的な失敗は間隔をあけて再試行し、
+失敗が続く場合はしばらく呼び出しを止めてキャッシュ済みのデータを表示させる。
+入力の誤り・制約違反・存在しないRPCなど、何度実行しても同じ結果になる失敗（4xx）は再試行せず、
+ブレーカーの失敗にも数えない（1件の誤った要求で全員の呼び出しを止めないため）。
+"""
+import os
+import time
+import random
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# 1回の呼び出しのタイムアウト（秒）
+DB_TIMEOUT = float(os.environ.get('HELP2_DB_TIMEOUT', 10))
+# 失敗時の再試行回数と待ち時間（秒）
+DB_RETRIES = int(os.environ.get('HELP2_DB_RETRIES', 2))
+DB_RETRY_BACKOFF = float(os.environ.get('HELP2_DB_RETRY_BACKOFF', 0.5))
+DB_RETRY_MAX_BACKOFF = float(os.environ.get('HELP2_DB_RETRY_MAX_BACKOFF', 5))
+# この回数続けて失敗したら、指定秒数のあいだ呼び出しを止める
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get('HELP2_DB_BREAKER_THRESHOLD', 5))
+BREAKER_RESET_TIMEOUT = float(os.environ.get('HELP2_DB_BREAKER_RESET', 30))
+
+# 再試行するHTTPステータス（5xx 以外）
+TRANSIENT_STATUS_CODES = {408, 429}
+# 再試行するPostgreSQLのエラーコード（SQLSTATE）の分類: 接続・トランザクションの競合・リソース不足・停止中・システムエラー
+TRANSIENT_SQLSTATE_CLASSES = ('08', '40', '53', '57', '58')
+# PostgRESTがデータベースに接続できなかった場合のエラーコード
+TRANSIENT_POSTGREST_CODES = {'PGRST000', 'PGRST001', 'PGRST002', 'PGRST003'}
+
+
+class DatabaseUnavailableError(Exception):
+    """再試行しても失敗した、またはサーキットブレーカーが開いている"""
+
+
+class CircuitBreaker:
+    """連続した失敗を数え、しきい値を超えたら一定時間呼び出しを止める
+
+    closed: 通常どおり呼び出す
+    open: 呼び出さずに DatabaseUnavailableError を送出する
+    half_open: 停止時間が過ぎたら1件だけ試し、成功すれば closed に戻す
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def before_call(self):
+        """呼び出してよければ何もせず、止めている間は DatabaseUnavailableError を送出する"""
+        with self._lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return
+            if state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return
+        raise DatabaseUnavailableError('データベースへの接続を一時的に停止しています')
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info('データベースへの接続が回復しました')
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            trial_failed = self._trial_running
+            self._trial_running = False
+            if trial_failed or self.failures >= self.failure_threshold:
+                if self.opened_at is None or trial_failed:
+                    logger.warning('データベースの呼び出しが %d 回続けて失敗したため、%.0f 秒間停止します',
+                                   self.failures, self.reset_timeout)
+                self.opened_at = time.monotonic()
+
+
+def _transient_status(status):
+    return status >= 500 or status in TRANSIENT_STATUS_CODES
+
+
+def is_transient_error(error):
+    """再試行してよい一時的な失敗（タイムアウト・接続エラー・5xx）かどうか"""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    # supabase の通信（httpx）のタイムアウト・接続エラーとHTTPステータスの失敗
+    try:
+        import httpx
+    except ImportError:
+        httpx = None
+    if httpx is not None:
+        if isinstance(error, httpx.TransportError):
+            return True
+        if isinstance(error, httpx.HTTPStatusError):
+            return _transient_status(error.response.status_code)
+    # postgrest の APIError: code はSQLSTATE・PostgRESTのエラーコード、応答がJSONでなければHTTPステータス
+    code = getattr(error, 'code', None)
+    if isinstance(code, int):
+        return _transient_status(code)
+    if isinstance(code, str):
+        return code in TRANSIENT_POSTGREST_CODES or code[:2] in TRANSIENT_SQLSTATE_CLASSES
+    return False
+
+
+def backoff_delay(attempt, base=DB_RETRY_BACKOFF, maximum=DB_RETRY_MAX_BACKOFF):
+    """attempt 回目（0始まり）の再試行までの待ち時間（指数的に伸ばし、0～上限の範囲でばらつかせる）"""
+    return random.uniform(0, min(maximum, base * (2 ** attempt)))
+
+
+def call_with_retry(func, breaker=None, retries=DB_RETRIES, description='データベースの呼び出し', sleep=time.sleep):
+    """func() を呼び出し、一時的な失敗（is_transient_error）なら retries 回まで再試行する
+
+    すべて失敗した場合、またはブレーカーが開いている場合は DatabaseUnavailableError を送出する。
+    一時的でない失敗（4xx など）は再試行せず、ブレーカーの失敗にも数えずにそのまま送出する。
+    再試行してよいのは何度実行しても結果が変わらない呼び出し（読み込み・upsert）だけ。
+    """
+    last_error = None
+    for attempt in range(retries + 1):
+        if breaker is not None:
+            breaker.before_call()
+        try:
+            result = func()
+        except Exception as e:
+            if not is_transient_error(e):
+                if breaker is not None:
+                    # データベースは応答しているため、停止から試している呼び出しは成功とみなす
+                    breaker.record_success()
+                raise
+            last_error = e
+            if breaker is not None:
+                breaker.record_failure()
+            if attempt < retries:
+                delay = backoff_delay(attempt)
+                logger.warning('%s に失敗しました（%d/%d 回目、%.2f 秒後に再試行）: %s',
+                               description, attempt + 1, retries + 1, delay, e)
+                sleep(delay)
+            continue
+        if breaker is not None:
+            breaker.record_success()
+        return result
+    raise DatabaseUnavailableError(f'{description} に失敗しました: {last_error}') from last_error
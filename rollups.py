@@ -0,0 +1,217 @@
+"""期間×従業員×店舗×シフトの種類ごとの集計（日数・時間・回数）を保持するローカルのSQLite
+
+年間の「従業員ごと・店舗ごとのヘルプ日数」などを、12期間分のシフトを読み込んで解析せずに
+集計済みの表から求める。保存のたびに、保存した従業員のその期間の行だけを作り直す。
+過去の期間はまとめて作成（backfill）する。
+
+    日数: 1日可などは1日、AM可・PM可は0.5日（複数の店舗に入った日は店舗数で割る）
+    時間: 店舗ごとの時間帯の合計（分で保持する。時間を解釈できない時間帯は含まない）
+    回数: そのシフトが入っているセルの数（店舗ごと）
+店舗に入っていないシフト（休み、店舗の決まっていないAM可など）は店舗を '' として保持する。
+
+集計はホストごとのファイルのため、他のプロセス・ホストからの保存やデータベースの直接の編集は反映されない。
+期間の集計には作成に使ったシフトの表の指紋（値のあるセルのハッシュ）を記録し、このプロセスが期間を
+データベースから読み込むたびに（period_cache.load_period_data）指紋を比べ、異なれば作り直しが必要な期間にする。
+
+環境変数:
+    HELP2_ROLLUPS   集計のSQLiteファイル（既定はアプリと同じディレクトリの rollups.db）
+
+    python cli.py rollup-backfill --fiscal-year 2024
+    python cli.py rollup-report --fiscal-year 2023 --fiscal-year 2024 --by fiscal_year --by store --stores-only
+"""
+import os
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from utils import parse_shift, count_shift
+from intervals import shift_intervals, untimed_stores
+from period_range import FISCAL_FIRST_MONTH
+from tenants import TenantScoped
+
+logger = logging.getLogger(__name__)
+
+ROLLUPS_PATH = os.environ.get('HELP2_ROLLUPS', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rollups.db'))
+
+ROLLUP_KEYS = ['employee', 'store', 'shift_type']
+ROLLUP_VALUES = ['days', 'minutes', 'count']
+# 集計の単位（rollup-report の --by と画面の選択肢）
+ROLLUP_GROUPS = ['fiscal_year', 'year', 'month', 'employee', 'store', 'shift_type']
+COLUMN_LABELS = {
+    'fiscal_year': '年度', 'year': '年', 'month': '月', 'employee': '従業員', 'store': '店舗', 'shift_type': '種類',
+    'days': '日数', 'hours': '時間', 'count': '回数',
+}
+
+
+def shift_contributions(shift):
+    """1セルのシフトの (店舗, 種類, 日数, 分, 回数) の一覧（'-' や空欄は空）"""
+    if not isinstance(shift, str) or shift in ('-', ''):
+        return []
+    shift_type = parse_shift(shift)[0] or ''
+    minutes = {}
+    for start, end, store in shift_intervals(shift):
+        minutes[store] = minutes.get(store, 0) + end - start
+    stores = [store for store in dict.fromkeys([*minutes, *untimed_stores(shift)]) if store] or ['']
+    days = count_shift(shift) / len(stores)
+    # 店舗に入っている場合、店舗のない時間帯（例: 1日可,9-12,13-17@本店 の 9-12）は店舗なしの時間に含めない
+    return [(store, shift_type, days, minutes.get(store, 0), 1) for store in stores]
+
+
+def frame_fingerprint(frame):
+    """期間のシフトの表の、値のあるセル（'-' と空欄以外）の内容から作るハッシュ"""
+    cells = frame.stack()
+    cells = cells[~cells.isin(['-', ''])].astype(str).sort_index()
+    digest = hashlib.sha256(pd.util.hash_pandas_object(cells, index=True).to_numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+
+def period_rollup(frame, employees=None):
+    """期間のシフトの表（日付×従業員）を ROLLUP_KEYS + ROLLUP_VALUES の表に集計する（値の種類ごとに一度だけ解析する）"""
+    if employees is not None:
+        frame = frame[[employee for employee in employees if employee in frame.columns]]
+    values = frame.to_numpy(dtype=object)
+    codes, uniques = pd.factorize(values.ravel())
+    n_uniques = len(uniques)
+    if not n_uniques:
+        return pd.DataFrame(columns=ROLLUP_KEYS + ROLLUP_VALUES)
+    # 従業員×値の種類ごとのセルの数
+    columns = np.tile(np.arange(values.shape[1]), values.shape[0])
+    valid = codes >= 0
+    counts = np.bincount(columns[valid] * n_uniques + codes[valid], minlength=values.shape[1] * n_uniques)
+    employee_index, unique_index = np.divmod(np.flatnonzero(counts), n_uniques)
+
+    contributions = [shift_contributions(value) for value in uniques]
+    rows = []
+    for employee, unique, cells in zip(frame.columns[employee_index], unique_index, counts[counts > 0]):
+        for store, shift_type, days, minutes, count in contributions[unique]:
+            rows.append((employee, store, shift_type, days * cells, minutes * cells, count * cells))
+    rollup = pd.DataFrame(rows, columns=ROLLUP_KEYS + ROLLUP_VALUES)
+    return rollup.groupby(ROLLUP_KEYS, as_index=False, sort=False)[ROLLUP_VALUES].sum()
+
+
+class RollupStore:
+    """集計済みの表（shift_rollups）と、作成済みの期間（rollup_periods）を保持する"""
+
+    def __init__(self, path=ROLLUPS_PATH):
+        self.path = path
+        self._local = threading.local()
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._transaction() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS shift_rollups (year INTEGER NOT NULL, month INTEGER NOT NULL, '
+                         'employee TEXT NOT NULL, store TEXT NOT NULL, shift_type TEXT NOT NULL, days REAL NOT NULL, '
+                         'minutes INTEGER NOT NULL, count INTEGER NOT NULL, PRIMARY KEY (year, month, employee, store, shift_type))')
+            # complete = 0 の期間は、保存時に作り直せなかったため作り直しが必要
+            conn.execute('CREATE TABLE IF NOT EXISTS rollup_periods (year INTEGER NOT NULL, month INTEGER NOT NULL, '
+                         'complete INTEGER NOT NULL, updated_at REAL NOT NULL, fingerprint TEXT, PRIMARY KEY (year, month))')
+            # 指紋の列がない以前のファイルは列を追加する（指紋のない期間は、次に読み込んだときに作り直しが必要になる）
+            if 'fingerprint' not in {row[1] for row in conn.execute('PRAGMA table_info(rollup_periods)')}:
+                conn.execute('ALTER TABLE rollup_periods ADD COLUMN fingerprint TEXT')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            if self.path != ':memory:':
+                conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def is_complete(self, year, month):
+        row = self._connection().execute('SELECT complete FROM rollup_periods WHERE year = ? AND month = ?', (year, month)).fetchone()
+        return bool(row and row[0])
+
+    def update_period(self, year, month, frame, employees=None):
+        """期間の集計を作り直す（employees を指定するとその従業員の行だけ。期間の集計がなければ期間全体）
+
+        frame は期間全体のシフトの表（employees を指定した場合も、指紋の記録に使う）。
+        """
+        if employees is not None and not self.is_complete(year, month):
+            employees = None
+        rollup = period_rollup(frame, employees)
+        fingerprint = frame_fingerprint(frame)
+        with self._transaction() as conn:
+            if employees is None:
+                conn.execute('DELETE FROM shift_rollups WHERE year = ? AND month = ?', (year, month))
+            else:
+                conn.executemany('DELETE FROM shift_rollups WHERE year = ? AND month = ? AND employee = ?',
+                                 [(year, month, employee) for employee in employees])
+            conn.executemany('INSERT INTO shift_rollups (year, month, employee, store, shift_type, days, minutes, count) '
+                             'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                             [(year, month, *row) for row in rollup.itertuples(index=False, name=None)])
+            conn.execute('INSERT INTO rollup_periods (year, month, complete, updated_at, fingerprint) VALUES (?, ?, 1, ?, ?) '
+                         'ON CONFLICT (year, month) DO UPDATE SET complete = 1, updated_at = excluded.updated_at, '
+                         'fingerprint = excluded.fingerprint', (year, month, time.time(), fingerprint))
+        return len(rollup)
+
+    def verify_period(self, year, month, frame):
+        """データベースから読み込んだ期間のシフトの表と集計の指紋を比べ、異なれば作り直しが必要な期間にする
+
+        このプロセスが送信していない保存（他のプロセス・ホスト、データベースの直接の編集）を検出する。
+        集計のない期間は何もしない。作り直しが必要になった場合は True を返す。
+        """
+        row = self._connection().execute('SELECT complete, fingerprint FROM rollup_periods WHERE year = ? AND month = ?',
+                                         (year, month)).fetchone()
+        if not row or not row[0] or row[1] == frame_fingerprint(frame):
+            return False
+        self.mark_incomplete(year, month)
+        logger.info('%d年%d月の集計は、このプロセス以外の保存が反映されていないため作り直しが必要です', year, month)
+        return True
+
+    def mark_incomplete(self, year, month):
+        """保存時に作り直せなかった期間を記録する（次の backfill で作り直す）"""
+        with self._transaction() as conn:
+            conn.execute('UPDATE rollup_periods SET complete = 0, updated_at = ? WHERE year = ? AND month = ?',
+                         (time.time(), year, month))
+
+    def missing_periods(self, periods):
+        """(年, 月) の一覧のうち、集計がない・作り直しが必要な期間"""
+        complete = {(year, month) for year, month in
+                    self._connection().execute('SELECT year, month FROM rollup_periods WHERE complete = 1').fetchall()}
+        return [period for period in periods if period not in complete]
+
+    def query(self, by, start=None, end=None, stores_only=False):
+        """(年, 月) の範囲の集計を by（ROLLUP_GROUPS の列）ごとに合計した表（日数・時間・回数）を返す
+
+        stores_only=True の場合は店舗に入っているシフト（ヘルプ）だけを集計する。
+        """
+        unknown = [column for column in by if column not in ROLLUP_GROUPS]
+        if unknown:
+            raise ValueError(f"集計の単位が不正です: {', '.join(unknown)}")
+        expressions = {column: column for column in ROLLUP_GROUPS}
+        expressions['fiscal_year'] = f'CASE WHEN month >= {FISCAL_FIRST_MONTH} THEN year ELSE year - 1 END'
+        conditions, params = [], []
+        if start is not None:
+            conditions.append('year * 100 + month >= ?')
+            params.append(start[0] * 100 + start[1])
+        if end is not None:
+            conditions.append('year * 100 + month <= ?')
+            params.append(end[0] * 100 + end[1])
+        if stores_only:
+            conditions.append("store != ''")
+        select = ', '.join(f'{expressions[column]} AS {column}' for column in by)
+        group = ', '.join(str(i) for i in range(1, len(by) + 1))
+        sql = (f"SELECT {select}{', ' if by else ''}SUM(days) AS days, SUM(minutes) / 60.0 AS hours, SUM(count) AS count "
+               f"FROM shift_rollups{' WHERE ' + ' AND '.join(conditions) if conditions else ''}"
+               f"{' GROUP BY ' + group + ' ORDER BY ' + group if by else ''}")
+        frame = pd.read_sql_query(sql, self._connection(), params=params)
+        return frame[frame['count'].notna()].reset_index(drop=True)
+
+
+# 集計のシングルトンインスタンスを作成（テナントごと）
+rollup_store = TenantScoped(lambda tenant: RollupStore(tenant.path(ROLLUPS_PATH)))
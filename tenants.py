@@ -0,0 +1,150 @@
+"""複数の地域・会社（テナント）で1つのデプロイを共有するためのテナントの設定と切り替え
+
+テナントごとにデータベース（SQLiteのファイル、またはSupabaseのスキーマ）・組織のマスタ・
+期間キャッシュ・PDFキャッシュ・書き込みキュー・固定済みの期間・集計を分ける。
+各モジュールのシングルトン（db・period_cache など）は TenantScoped で包んであり、
+呼び出し側はそのままで現在のテナントのインスタンスが使われる。
+現在のテナントは画面ではセッションごと（?tenant=ID または サイドバーの選択）、CLIでは --tenant で決まる。
+テナントはデータを分けるためのもので、アクセス制御ではない（画面では誰でも ?tenant=ID・サイドバーで
+どのテナントにも切り替えられる）。テナントごとに利用者を制限する場合は、デプロイを分けるか前段の認証で制限する。
+
+HELP2_TENANTS を指定しない場合は既定のテナント（default）だけで、これまでと同じファイル・スキーマを使う。
+設定ファイル（JSON）の例:
+    [
+        {"id": "default", "name": "鹿児島"},
+        {"id": "miyazaki", "name": "宮崎", "schema": "miyazaki", "cache_periods": 24, "pdf_cache_bytes": 33554432},
+        {"id": "kumamoto", "name": "熊本", "database": "sqlite:////data/kumamoto.db"}
+    ]
+    database         データベース（HELP2_DATABASE と同じ形式。省略時は HELP2_DATABASE）
+    schema           Supabaseのスキーマ（migrations/004_tenant_schema.sql で作成する。既定のテナント以外の既定はID）
+    cache_periods    期間キャッシュに保持する期間データの上限（既定は HELP2_CACHE_MAX_PERIODS）
+    pdf_cache_bytes  PDFキャッシュのメモリ上限（既定は PDF_CACHE_MAX_BYTES）
+既定のテナント以外のローカルのファイル（書き込みキュー・集計・固定済みの期間など）は、
+元のファイルと同じディレクトリの tenants/<ID>/ に置く。
+
+環境変数:
+    HELP2_TENANTS   テナントの設定ファイル（JSON）
+    HELP2_TENANT    CLI・バックグラウンド処理で使うテナント（既定は設定ファイルの最初のテナント）
+"""
+import os
+import re
+import json
+import threading
+import contextvars
+from contextlib import contextmanager
+
+DEFAULT_TENANT_ID = 'default'
+TENANT_ID_PATTERN = re.compile(r'^[a-z0-9_]+$')
+
+
+class Tenant:
+    """1つのテナントの設定（未指定の項目はNoneで、各モジュールの既定値を使う）"""
+
+    def __init__(self, id, name=None, database=None, schema=None, cache_periods=None, pdf_cache_bytes=None):
+        if not TENANT_ID_PATTERN.match(str(id)):
+            raise ValueError(f'テナントのIDは英小文字・数字・_ で指定してください: {id}')
+        self.id = id
+        self.name = name or id
+        self.database = database
+        self.schema = schema if schema or id == DEFAULT_TENANT_ID else id
+        self.cache_periods = None if cache_periods is None else int(cache_periods)
+        self.pdf_cache_bytes = None if pdf_cache_bytes is None else int(pdf_cache_bytes)
+
+    @property
+    def is_default(self):
+        return self.id == DEFAULT_TENANT_ID
+
+    def path(self, path):
+        """テナントごとのファイル・ディレクトリ（既定のテナントは path のまま、それ以外は同じディレクトリの tenants/<ID>/ の下）"""
+        if path is None or path == ':memory:' or self.is_default:
+            return path
+        path = os.path.abspath(path)
+        return os.path.join(os.path.dirname(path), 'tenants', self.id, os.path.basename(path))
+
+    def __repr__(self):
+        return f'Tenant(id={self.id!r}, name={self.name!r})'
+
+
+def load_tenants(path=None):
+    """設定ファイルからテナントの一覧（ID -> Tenant、ファイルの順）を読み込む"""
+    path = path if path is not None else os.environ.get('HELP2_TENANTS', '')
+    if not path:
+        return {DEFAULT_TENANT_ID: Tenant(DEFAULT_TENANT_ID)}
+    with open(path, encoding='utf-8') as f:
+        entries = json.load(f)
+    tenants = {}
+    for entry in entries:
+        tenant = Tenant(**entry)
+        if tenant.id in tenants:
+            raise ValueError(f'テナントのIDが重複しています: {tenant.id}')
+        tenants[tenant.id] = tenant
+    if not tenants:
+        raise ValueError(f'テナントが設定されていません: {path}')
+    return tenants
+
+
+TENANTS = load_tenants()
+# 現在のテナント（セッション・CLI・バックグラウンドのスレッドごとに設定する）
+_current = contextvars.ContextVar('help2_tenant', default=None)
+
+
+def get_tenant(tenant_id):
+    tenant = TENANTS.get(tenant_id)
+    if tenant is None:
+        raise ValueError(f"テナントが見つかりません: {tenant_id}（{', '.join(TENANTS)}）")
+    return tenant
+
+
+def default_tenant():
+    tenant_id = os.environ.get('HELP2_TENANT')
+    return get_tenant(tenant_id) if tenant_id else next(iter(TENANTS.values()))
+
+
+def current_tenant():
+    return _current.get() or default_tenant()
+
+
+def set_current_tenant(tenant):
+    """以降の処理（このスレッド・タスク）のテナントを設定する（Tenant または ID）"""
+    tenant = get_tenant(tenant) if isinstance(tenant, str) else tenant
+    _current.set(tenant)
+    return tenant
+
+
+@contextmanager
+def use_tenant(tenant):
+    """with の間だけテナントを切り替える"""
+    token = _current.set(get_tenant(tenant) if isinstance(tenant, str) else tenant)
+    try:
+        yield _current.get()
+    finally:
+        _current.reset(token)
+
+
+class TenantScoped:
+    """テナントごとのインスタンスを factory(テナント) で最初に使うときに作成し、属性の参照を現在のテナントのものに委ねる"""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._instances = {}
+        self._lock = threading.Lock()
+
+    def for_tenant(self, tenant=None):
+        tenant = current_tenant() if tenant is None else tenant
+        instance = self._instances.get(tenant.id)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(tenant.id)
+                if instance is None:
+                    instance = self._instances[tenant.id] = self._factory(tenant)
+        return instance
+
+    def instances(self):
+        """作成済みのインスタンス（テナントID -> インスタンス）"""
+        return dict(self._instances)
+
+    def __getattr__(self, name):
+        return getattr(self.for_tenant(), name)
+
+    def __contains__(self, item):
+        return item in self.for_tenant()
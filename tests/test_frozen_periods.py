@@ -0,0 +1,65 @@
+"""固定済みの期間を、固定した後に組織を変更してから読み込む場合のテスト"""
+import pandas as pd
+import pytest
+import period
+import period_cache
+from benchmarks.synthetic import make_organisation, generate_period, use_organisation
+from frozen_periods import FrozenPeriodStore
+from period import KIND_SHIFTS, KIND_HELP_REQUESTS, build_shift_frame, shift_categories
+
+YEAR, MONTH = 2024, 4
+
+
+@pytest.fixture
+def frozen_store(tmp_path, monkeypatch):
+    store = FrozenPeriodStore(str(tmp_path))
+    monkeypatch.setattr(period, 'frozen_periods', store)
+    monkeypatch.setattr(period_cache, 'frozen_periods', store)
+    return store
+
+
+def _freeze_then_add_staff(frozen_store):
+    """21人・27店舗で固定し、1人・1店舗を追加した組織と、追加した従業員・店舗を返す"""
+    before = make_organisation(21, 27)
+    shifts, help_requests = generate_period(YEAR, MONTH, before)
+    with use_organisation(before):
+        frozen_store.freeze(YEAR, MONTH, {KIND_SHIFTS: build_shift_frame(shifts, YEAR, MONTH),
+                                          KIND_HELP_REQUESTS: help_requests})
+    after = make_organisation(22, 28)
+    [new_employee] = set(after.employees) - set(before.employees)
+    [new_store] = set(after.stores) - set(before.stores)
+    return after, new_employee, new_store
+
+
+def test_frozen_shifts_have_current_employees(frozen_store):
+    after, new_employee, _ = _freeze_then_add_staff(frozen_store)
+    with use_organisation(after):
+        frame = period_cache.load_period_data(None, KIND_SHIFTS, YEAR, MONTH).frame
+        live = build_shift_frame(None, YEAR, MONTH)
+
+    assert frame.shape == live.shape
+    assert list(frame.columns) == after.employees
+    assert (frame[new_employee] == '-').all()
+    assert shift_categories(frame) is not None
+    # 画面の表示・シフト登録と同じ参照ができる
+    frame.loc[pd.Timestamp(YEAR, MONTH, 16), new_employee]
+
+
+def test_frozen_period_data_has_current_stores(frozen_store):
+    after, _, new_store = _freeze_then_add_staff(frozen_store)
+    with use_organisation(after):
+        data = period.load_period(None, YEAR, MONTH)
+
+    assert list(data.shifts.columns) == after.employees
+    assert set(after.stores) <= set(data.store_help_requests.columns)
+    assert (data.store_help_requests[new_store] == '-').all()
+
+
+def test_frozen_period_without_files_is_empty_period(frozen_store):
+    organisation = make_organisation(21, 27)
+    with use_organisation(organisation):
+        frozen_store.freeze(YEAR, MONTH, {KIND_SHIFTS: pd.DataFrame(), KIND_HELP_REQUESTS: pd.DataFrame()})
+        frame = period_cache.load_period_data(None, KIND_SHIFTS, YEAR, MONTH).frame
+
+    assert list(frame.columns) == organisation.employees
+    assert (frame == '-').all().all()
@@ -0,0 +1,75 @@
+"""データベース呼び出しの再試行とサーキットブレーカーのテスト"""
+import httpx
+import pytest
+from postgrest.exceptions import APIError
+from resilience import CircuitBreaker, DatabaseUnavailableError, call_with_retry, is_transient_error
+
+
+def _failing(error, failures=None, result=None):
+    """failures 回（Noneなら毎回）error を送出し、その後は result を返す関数と呼び出しの記録を返す"""
+    calls = []
+
+    def func():
+        calls.append(1)
+        if failures is None or len(calls) <= failures:
+            raise error
+        return result
+    return func, calls
+
+
+@pytest.mark.parametrize('error', [
+    TimeoutError('timed out'),
+    ConnectionResetError('reset'),
+    httpx.ConnectTimeout('timed out'),
+    httpx.ReadError('read error'),
+    APIError({'code': 502, 'message': 'JSON could not be generated'}),
+    APIError({'code': 'PGRST000', 'message': 'Could not connect with the database'}),
+    APIError({'code': '57014', 'message': 'canceling statement due to statement timeout'}),
+    APIError({'code': '40001', 'message': 'could not serialize access'}),
+])
+def test_transient_errors_are_retried(error):
+    func, calls = _failing(error)
+    breaker = CircuitBreaker(failure_threshold=10)
+    with pytest.raises(DatabaseUnavailableError):
+        call_with_retry(func, breaker, retries=2, sleep=lambda delay: None)
+    assert is_transient_error(error)
+    assert len(calls) == 3
+    assert breaker.failures == 3
+
+
+def test_transient_error_then_success():
+    func, calls = _failing(httpx.ConnectError('unreachable'), failures=1, result='ok')
+    breaker = CircuitBreaker()
+    assert call_with_retry(func, breaker, retries=2, sleep=lambda delay: None) == 'ok'
+    assert len(calls) == 2
+    assert breaker.failures == 0
+
+
+@pytest.mark.parametrize('error', [
+    APIError({'code': '23505', 'message': 'duplicate key value violates unique constraint'}),
+    APIError({'code': 'PGRST202', 'message': 'Could not find the function public.save_shift_versioned'}),
+    APIError({'code': '22P02', 'message': 'invalid input syntax for type integer'}),
+    APIError({'code': 400, 'message': 'JSON could not be generated'}),
+    ValueError('bad input'),
+])
+def test_client_errors_are_raised_without_retry(error):
+    func, calls = _failing(error)
+    breaker = CircuitBreaker(failure_threshold=1)
+    with pytest.raises(type(error)) as raised:
+        call_with_retry(func, breaker, retries=2, sleep=lambda delay: None)
+    assert raised.value is error
+    assert not is_transient_error(error)
+    assert len(calls) == 1
+    assert breaker.failures == 0
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_client_error_does_not_keep_breaker_open():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    # 停止時間が過ぎた後の試しの呼び出しが4xxでも、次の呼び出しを止めない
+    func, _ = _failing(APIError({'code': '23505', 'message': 'duplicate key'}))
+    with pytest.raises(APIError):
+        call_with_retry(func, breaker, retries=0, sleep=lambda delay: None)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert call_with_retry(lambda: 'ok', breaker, retries=0) == 'ok'
@@ -1,7 +1,7 @@
+import numpy as np
 import pandas as pd
-import streamlit as st
-import jpholiday
-from constants import AREAS, SHIFT_TYPES, STORE_COLORS, FILLED_HELP_BG_COLOR, SATURDAY_BG_COLOR,HOLIDAY_BG_COLOR, KANOYA_BG_COLOR, KAGOKITA_BG_COLOR,RECRUIT_BG_COLOR
+from constants import SHIFT_TYPES, SATURDAY_BG_COLOR,HOLIDAY_BG_COLOR, KANOYA_BG_COLOR, KAGOKITA_BG_COLOR,RECRUIT_BG_COLOR
+from organisation import current_organisation
 
 #シフト文字列を解析し、シフトタイプ、時間、店舗に分割
 def parse_shift(shift_str):
@@ -75,7 +75,7 @@ def format_shifts(val):
             for part in parts[2:]:
                 if '@' in part:
                     time, store = part.strip().split('@')
-                    color = STORE_COLORS.get(store, "#000000")
+                    color = current_organisation().store_color(store)
                     shift_parts.append(f'<span style="color: {color}">{time}@{store}</span>')
                 else:
                     shift_parts.append(part.strip())
@@ -98,7 +98,7 @@ def format_shifts(val):
                     formatted_shifts.append(f'<span style="background-color: {KAGOKITA_BG_COLOR}">{time}@{store}</span>')
                 else:
                     # その他の店舗は通常の色のみ
-                    color = STORE_COLORS.get(store, "#000000")
+                    color = current_organisation().store_color(store)
                     formatted_shifts.append(f'<span style="color: {color}">{time}@{store}</span>')
             else:
                 formatted_shifts.append(part.strip())
@@ -114,18 +114,51 @@ def format_shifts(val):
         print(f"Error formatting shift: {val}. Error: {e}")
         return str(val)
     
-#セッション状態のシフトデータを更新
-def update_session_state_shifts(shifts):
-    for date, row in shifts.iterrows():
-        if date in st.session_state.shift_data.index:
-            for employee, shift in row.items():
-                if pd.notna(shift):
-                    st.session_state.shift_data.loc[date, employee] = str(shift)
-                else:
-                    st.session_state.shift_data.loc[date, employee] = '-'
+#カテゴリ（シフト文字列の辞書）の値ごとに一度だけ表示用のHTMLを作成
+def shift_formatter():
+    cache = {}
+
+    def formatter(val):
+        if isinstance(val, str):
+            if val not in cache:
+                cache[val] = format_shifts(val)
+            return cache[val]
+        return format_shifts(val)
+
+    return formatter
+
+def count_shift(shift):
+    if pd.isna(shift) or shift == '-':
+        return 0
+    shift_type = shift.split(',')[0] if ',' in shift else shift
+    if shift_type in ['1日可', '鹿屋', 'かご北', 'リクルート'] or shift_type.startswith('その他'):
+        return 1
+    elif shift_type in ['AM可', 'PM可']:
+        return 0.5
+    return 0
+
+#シフト日数を集計（1日可などは1日、AM可/PM可は0.5日）
+def calculate_shift_count(shift_data):
+    # カテゴリ型の列は辞書の値ごとに一度だけ日数を判定し、整数コードで集計する
+    weights_by_categories = {}
+    counts = {}
+    for employee, column in shift_data.items():
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            categories = column.cat.categories
+            weights = weights_by_categories.get(id(categories))
+            if weights is None:
+                # 末尾はコード-1（欠損値）用
+                weights = np.array([count_shift(shift) for shift in categories] + [0], dtype=float)
+                weights_by_categories[id(categories)] = weights
+            counts[employee] = weights[column.cat.codes.to_numpy()].sum()
+        else:
+            counts[employee] = float(column.map(count_shift).sum())
+    return pd.Series(counts, index=shift_data.columns, dtype=float)
 
 #土曜日と日曜日の行に背景色を適用
 def is_holiday(date):
+    # 祝日判定は表示時にだけ必要なため、初回呼び出し時に読み込む
+    import jpholiday
     return jpholiday.is_holiday(date)
 
 def highlight_weekend_and_holiday(row):
@@ -139,32 +172,13 @@ def highlight_weekend_and_holiday(row):
 
 
 def get_store_index(store):
-    all_stores = [s for stores in AREAS.values() for s in stores]
+    all_stores = current_organisation().stores
     return all_stores.index(store) if store in all_stores else 0
 
 def get_shift_type_index(shift_type):
     return SHIFT_TYPES.index(shift_type) if shift_type in SHIFT_TYPES else 0
 
-
-#シフトが埋まっているかどうかをチェック
-def is_shift_filled(shift):
-    if pd.isna(shift) or shift == '-':
-        return False, []
-    shift_type, times, stores = parse_shift(shift)
-    return bool(times and stores), stores
-
-
-#埋まっているシフトをハイライト
-def highlight_filled_shifts(row, shift_data):
-    styles = [''] * len(row)
-    date = pd.to_datetime(row['日付'])
-    if date not in shift_data.index:
-        return styles
-    
-    all_stores = [store for stores in AREAS.values() for store in stores]
-    for i, store in enumerate(all_stores):
-        if store in row.index:
-            store_shifts = shift_data.loc[date]
-            if any(is_shift_filled(shift)[0] and store in is_shift_filled(shift)[1] for shift in store_shifts if pd.notna(shift)):
-                styles[row.index.get_loc(store)] = FILLED_HELP_BG_COLOR
-    return styles
\ No newline at end of file
+#集計の表の列名を日本語にする（列名の対応は集計ごとに持つ）
+def label_columns(frame, labels):
+    """画面表示・CSV出力用に、labels（英語の列名 -> 日本語）で列名を日本語にする"""
+    return frame.rename(columns=labels)
@@ -0,0 +1,360 @@
+"""シフト・店舗ヘルプ希望の保存をいったんローカルのSQLiteに書き込み、バックグラウンドでまとめて送信するキュー
+
+保存ボタンではキューに書き込むだけなので待たされず、データベースに接続できない間も
+保存した内容はファイルに残る。同じセルへの保存が送信前に重なった場合は最後の内容だけを送る。
+固定済み（frozen_periods.py）の期間への保存は、キューに書き込むときに FrozenPeriodError で拒否し、
+キューに書き込んだ後に固定された場合は送信せずに破棄する（件数は stats() の rejected）。
+
+環境変数:
+    HELP2_WRITE_QUEUE               キューのSQLiteファイル（既定はアプリと同じディレクトリの write_queue.db）
+    HELP2_WRITE_QUEUE_BATCH         1回に送信する最大件数
+    HELP2_WRITE_QUEUE_INTERVAL      送信を確認する間隔（秒）
+"""
+import os
+import json
+import time
+import logging
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+import pandas as pd
+from resilience import backoff_delay
+from tenants import TenantScoped, current_tenant, set_current_tenant
+
+logger = logging.getLogger(__name__)
+
+WRITE_QUEUE_PATH = os.environ.get('HELP2_WRITE_QUEUE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'write_queue.db'))
+WRITE_QUEUE_BATCH = int(os.environ.get('HELP2_WRITE_QUEUE_BATCH', 50))
+WRITE_QUEUE_INTERVAL = float(os.environ.get('HELP2_WRITE_QUEUE_INTERVAL', 1))
+# 送信中のまま（プロセスが落ちたなど）この秒数が過ぎた書き込みは、別のプロセスが送信し直す
+WRITE_QUEUE_LEASE = float(os.environ.get('HELP2_WRITE_QUEUE_LEASE', 60))
+# 送信に失敗した書き込みを再送するまでの待ち時間（秒）
+WRITE_RETRY_BACKOFF = 1.0
+WRITE_RETRY_MAX_BACKOFF = 60.0
+
+# 書き込みの種類
+WRITE_SHIFT = 'shift'
+WRITE_STORE_HELP = 'store_help'
+
+
+class FrozenPeriodError(ValueError):
+    """固定済みの期間への保存（キューに書き込まない）"""
+
+
+class FlushedWrite:
+    """送信し終えた書き込み（row は保存後の行。conflict が True なら保存されず、row は最新の行）"""
+
+    def __init__(self, kind, payload, row=None, conflict=False):
+        self.kind = kind
+        self.payload = payload
+        self.row = row
+        self.conflict = conflict
+
+    def __repr__(self):
+        return f'FlushedWrite(kind={self.kind!r}, payload={self.payload}, conflict={self.conflict})'
+
+
+class WriteQueue:
+    """SQLiteに保存する書き込みキュー（同じファイルを参照する複数のプロセスで共有できる）"""
+
+    def __init__(self, path=WRITE_QUEUE_PATH, batch_size=WRITE_QUEUE_BATCH, lease=WRITE_QUEUE_LEASE, is_frozen=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.lease = lease
+        # is_frozen(日付) が真の日付（固定済みの期間）への保存は受け付けず、送信もしない
+        self.is_frozen = is_frozen
+        # 送信するプロセスを区別するID（送信中の書き込みを他のプロセスが重ねて送らないようにする）
+        self.worker_id = uuid.uuid4().hex
+        self.wakeup = threading.Event()
+        self._local = threading.local()
+        self._counters = {'enqueued': 0, 'coalesced': 0, 'flushed': 0, 'conflicts': 0, 'failures': 0, 'rejected': 0}
+        self._counters_lock = threading.Lock()
+        self.last_flush_at = None
+        self.last_error = None
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._transaction() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS pending_writes (kind TEXT NOT NULL, key TEXT NOT NULL, payload TEXT NOT NULL, '
+                         'seq INTEGER NOT NULL, enqueued_at REAL NOT NULL, updated_at REAL NOT NULL, '
+                         'attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL NOT NULL DEFAULT 0, last_error TEXT, '
+                         'claimed_by TEXT, claimed_at REAL, PRIMARY KEY (kind, key))')
+            conn.execute('CREATE TABLE IF NOT EXISTS write_conflicts (id INTEGER PRIMARY KEY AUTOINCREMENT, source TEXT, '
+                         'payload TEXT NOT NULL, row TEXT, created_at REAL NOT NULL)')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # トランザクションは _transaction で明示的に開始する
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            if self.path != ':memory:':
+                conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _count(self, name, amount=1):
+        with self._counters_lock:
+            self._counters[name] += amount
+
+    def _frozen_dates(self, dates):
+        """日付（'YYYY-MM-DD'）の一覧のうち、固定済みの期間のものを返す"""
+        if self.is_frozen is None:
+            return set()
+        return {date for date in set(dates) if self.is_frozen(pd.Timestamp(date))}
+
+    def _enqueue(self, writes):
+        """(種類, キー, 内容) の一覧を1つのトランザクションでキューに追加する（固定済みの期間があれば何も追加しない）"""
+        frozen = self._frozen_dates(payload['date'] for _, _, payload in writes)
+        if frozen:
+            raise FrozenPeriodError(f"確定済みの期間のため保存できません: {', '.join(sorted(frozen))}")
+        now = time.time()
+        coalesced = 0
+        with self._transaction() as conn:
+            for kind, key, payload in writes:
+                existing = conn.execute('SELECT payload FROM pending_writes WHERE kind = ? AND key = ?', (kind, key)).fetchone()
+                if existing is not None:
+                    coalesced += 1
+                    if kind == WRITE_SHIFT:
+                        # 最初に読み込んだときのバージョンで競合を判定する
+                        payload = dict(payload, expected_version=json.loads(existing[0]).get('expected_version'))
+                conn.execute('INSERT INTO pending_writes (kind, key, payload, seq, enqueued_at, updated_at) VALUES (?, ?, ?, 1, ?, ?) '
+                             'ON CONFLICT(kind, key) DO UPDATE SET payload = excluded.payload, seq = seq + 1, '
+                             'updated_at = excluded.updated_at, attempts = 0, next_attempt_at = 0, last_error = NULL',
+                             (kind, key, json.dumps(payload, ensure_ascii=False), now, now))
+        self._count('enqueued', len(writes))
+        self._count('coalesced', coalesced)
+        self.wakeup.set()
+
+    def enqueue_shifts(self, shifts, source=None):
+        """(日付, 従業員, シフト, 期待するバージョン) の一覧をキューに追加する"""
+        writes = []
+        for date, employee, shift_str, expected_version in shifts:
+            date_str = pd.Timestamp(date).strftime('%Y-%m-%d')
+            payload = {'date': date_str, 'employee': employee, 'shift': shift_str,
+                       'expected_version': None if expected_version is None else int(expected_version), 'source': source}
+            writes.append((WRITE_SHIFT, f'{date_str}|{employee}', payload))
+        self._enqueue(writes)
+
+    def enqueue_store_help_requests(self, requests, source=None):
+        """(日付, 店舗, 時間帯) の一覧をキューに追加する"""
+        writes = []
+        for date, store, help_time in requests:
+            date_str = pd.Timestamp(date).strftime('%Y-%m-%d')
+            payload = {'date': date_str, 'store': store, 'help_time': help_time, 'source': source}
+            writes.append((WRITE_STORE_HELP, f'{date_str}|{store}', payload))
+        self._enqueue(writes)
+
+    def _claim(self, limit):
+        """送信する書き込みを古い順に取り出し、このプロセスが送信中であることを記録する"""
+        now = time.time()
+        with self._transaction() as conn:
+            rows = conn.execute('SELECT kind, key, payload, seq, attempts FROM pending_writes '
+                                'WHERE next_attempt_at <= ? AND (claimed_by IS NULL OR claimed_at < ?) '
+                                'ORDER BY enqueued_at LIMIT ?', (now, now - self.lease, limit)).fetchall()
+            conn.executemany('UPDATE pending_writes SET claimed_by = ?, claimed_at = ? WHERE kind = ? AND key = ?',
+                             [(self.worker_id, now, kind, key) for kind, key, _, _, _ in rows])
+        return [(kind, key, json.loads(payload), seq, attempts) for kind, key, payload, seq, attempts in rows]
+
+    def _complete(self, conn, kind, key, seq, row=None, conflict=False):
+        # 送信中に同じセルへ新しい保存があった場合は、その保存を残して送信し直す
+        deleted = conn.execute('DELETE FROM pending_writes WHERE kind = ? AND key = ? AND seq = ?', (kind, key, seq)).rowcount
+        if deleted:
+            return
+        current = conn.execute('SELECT payload FROM pending_writes WHERE kind = ? AND key = ?', (kind, key)).fetchone()
+        if current is None:
+            return
+        # 保存できた場合だけ、新しい保存の期待するバージョンを保存後のものにする
+        # （競合した場合は元のバージョンのままにし、他の人の保存を上書きせずに新しい保存も競合させる）
+        if kind == WRITE_SHIFT and not conflict and row is not None and row.get('version') is not None:
+            payload = json.loads(current[0])
+            if payload.get('expected_version') is not None:
+                payload['expected_version'] = int(row['version'])
+            conn.execute('UPDATE pending_writes SET payload = ? WHERE kind = ? AND key = ?',
+                         (json.dumps(payload, ensure_ascii=False), kind, key))
+        conn.execute('UPDATE pending_writes SET claimed_by = NULL, claimed_at = NULL WHERE kind = ? AND key = ?', (kind, key))
+
+    def _fail(self, claimed, error):
+        now = time.time()
+        with self._transaction() as conn:
+            for kind, key, _, _, attempts in claimed:
+                delay = backoff_delay(attempts, WRITE_RETRY_BACKOFF, WRITE_RETRY_MAX_BACKOFF)
+                conn.execute('UPDATE pending_writes SET claimed_by = NULL, claimed_at = NULL, attempts = attempts + 1, '
+                             'next_attempt_at = ?, last_error = ? WHERE kind = ? AND key = ?',
+                             (now + delay, str(error), kind, key))
+        self._count('failures', len(claimed))
+        self.last_error = str(error)
+        logger.warning('%d 件の保存を送信できませんでした（後で再送します）: %s', len(claimed), error)
+
+    def _reject(self, claimed):
+        """送信する前に固定された期間への書き込みを、送信せずにキューから削除する"""
+        with self._transaction() as conn:
+            conn.executemany('DELETE FROM pending_writes WHERE kind = ? AND key = ?', [(kind, key) for kind, key, _, _, _ in claimed])
+        self._count('rejected', len(claimed))
+        logger.warning('%d 件の保存は確定済みの期間のため送信しませんでした: %s', len(claimed),
+                       ', '.join(sorted({payload['date'] for _, _, payload, _, _ in claimed})))
+
+    def _finish(self, claimed, results):
+        """送信できた書き込みをキューから削除し、競合した書き込みを記録する"""
+        flushed = []
+        with self._transaction() as conn:
+            for (kind, key, payload, seq, _), (row, conflict) in zip(claimed, results):
+                self._complete(conn, kind, key, seq, row, conflict)
+                if conflict:
+                    conn.execute('INSERT INTO write_conflicts (source, payload, row, created_at) VALUES (?, ?, ?, ?)',
+                                 (payload.get('source'), json.dumps(payload, ensure_ascii=False),
+                                  json.dumps(row, ensure_ascii=False, default=str), time.time()))
+                flushed.append(FlushedWrite(kind, payload, row, conflict))
+        self._count('flushed', sum(not write.conflict for write in flushed))
+        self._count('conflicts', sum(write.conflict for write in flushed))
+        return flushed
+
+    def flush(self, db, limit=None):
+        """キューの書き込みを最大 limit 件送信し、送信し終えた書き込みを返す
+
+        店舗ヘルプ希望とバージョン指定のないシフトはまとめて1回のUpsertで送り、
+        バージョン指定のあるシフトは競合を判定するため1件ずつ送る。
+        """
+        claimed = self._claim(limit or self.batch_size)
+        if not claimed:
+            return []
+        # キューに書き込んだ後で固定された期間への書き込みは送信しない
+        frozen = self._frozen_dates(payload['date'] for _, _, payload, _, _ in claimed)
+        if frozen:
+            self._reject([item for item in claimed if item[2]['date'] in frozen])
+            claimed = [item for item in claimed if item[2]['date'] not in frozen]
+
+        groups = {}
+        for item in claimed:
+            kind, _, payload, _, _ = item
+            batched = kind == WRITE_STORE_HELP or payload.get('expected_version') is None
+            groups.setdefault((kind, batched), []).append(item)
+
+        flushed = []
+        for (kind, batched), items in groups.items():
+            try:
+                if kind == WRITE_STORE_HELP:
+                    db.save_store_help_requests([{'date': p['date'], 'store': p['store'], 'help_time': p['help_time']}
+                                                 for _, _, p, _, _ in items])
+                    results = [(None, False)] * len(items)
+                elif batched:
+                    rows = db.save_shifts([{'date': p['date'], 'employee': p['employee'], 'shift': p['shift']}
+                                           for _, _, p, _, _ in items])
+                    saved = {(str(row.get('date')), row.get('employee')): row for row in rows}
+                    results = [(saved.get((p['date'], p['employee']),
+                                          {'date': p['date'], 'employee': p['employee'], 'shift': p['shift']}), False)
+                               for _, _, p, _, _ in items]
+                else:
+                    results = []
+                    for _, _, p, _, _ in items:
+                        result = db.save_shift_row(p['date'], p['employee'], p['shift'], p['expected_version'])
+                        row = result.row or {'date': p['date'], 'employee': p['employee'], 'shift': p['shift']}
+                        results.append((row, result.conflict))
+            except Exception as e:
+                self._fail(items, e)
+                continue
+            flushed.extend(self._finish(items, results))
+        self.last_flush_at = time.time()
+        return flushed
+
+    def pending_shifts(self, cells):
+        """(日付, 従業員) の一覧のうち、送信し終えていない（キューに残っている）シフトの保存があるものを返す"""
+        keys = {f'{pd.Timestamp(date):%Y-%m-%d}|{employee}': (date, employee) for date, employee in cells}
+        names = list(keys)
+        pending = set()
+        conn = self._connection()
+        # SQLiteのパラメータ数の上限を超えないよう分けて問い合わせる
+        for i in range(0, len(names), 500):
+            chunk = names[i:i + 500]
+            rows = conn.execute(f"SELECT key FROM pending_writes WHERE kind = ? AND key IN ({', '.join('?' * len(chunk))})",
+                                (WRITE_SHIFT, *chunk)).fetchall()
+            pending.update(keys[key] for key, in rows)
+        return pending
+
+    def pop_conflicts(self, source):
+        """source が保存して競合した書き込みの最新の行を返し、記録を削除する"""
+        with self._transaction() as conn:
+            rows = conn.execute('SELECT id, row FROM write_conflicts WHERE source = ? ORDER BY id', (source,)).fetchall()
+            conn.execute('DELETE FROM write_conflicts WHERE source = ?', (source,))
+        return [json.loads(row) for _, row in rows if row]
+
+    def stats(self):
+        """キューの件数・最も古い書き込みの待ち時間（秒）・送信結果の件数を返す"""
+        depth, oldest, retrying = self._connection().execute(
+            'SELECT COUNT(*), MIN(enqueued_at), SUM(attempts > 0) FROM pending_writes').fetchone()
+        with self._counters_lock:
+            counters = dict(self._counters)
+        return {
+            'depth': depth,
+            'lag_seconds': 0.0 if oldest is None else time.time() - oldest,
+            'retrying': retrying or 0,
+            **counters,
+            'last_flush_at': self.last_flush_at,
+            'last_error': self.last_error,
+        }
+
+
+class WriteFlusher(threading.Thread):
+    """キューの書き込みをデータベースへ送信し続けるバックグラウンドスレッド"""
+
+    def __init__(self, queue, db, on_flushed=None, interval=WRITE_QUEUE_INTERVAL, tenant=None):
+        super().__init__(name='help2-write-flusher' + ('' if tenant is None else f'-{tenant.id}'), daemon=True)
+        self.tenant = tenant
+        self.queue = queue
+        self.db = db
+        self.on_flushed = on_flushed
+        self.interval = interval
+
+    def run(self):
+        if self.tenant is not None:
+            # 送信先のデータベース・送信後に更新するキャッシュをこのテナントのものにする
+            set_current_tenant(self.tenant)
+        while True:
+            self.queue.wakeup.clear()
+            try:
+                while True:
+                    flushed = self.queue.flush(self.db)
+                    if flushed and self.on_flushed is not None:
+                        self.on_flushed(flushed)
+                    # 送信できた分がバッチの上限に達していれば続けて送る
+                    if len(flushed) < self.queue.batch_size:
+                        break
+            except Exception as e:
+                logger.warning('保存の送信中にエラーが発生しました: %s', e)
+            self.queue.wakeup.wait(self.interval)
+
+
+def _tenant_write_queue(tenant):
+    # period_cache は期間データの読み込みのためのモジュールを多く参照するため、使うときにインポートする
+    from frozen_periods import frozen_periods
+    from period_cache import period_of
+
+    store = frozen_periods.for_tenant(tenant)
+    return WriteQueue(tenant.path(WRITE_QUEUE_PATH), is_frozen=lambda date: store.is_frozen(*period_of(date)))
+
+
+# 書き込みキューのシングルトンインスタンスを作成（テナントごとに別のファイル）
+write_queue = TenantScoped(_tenant_write_queue)
+_flushers = {}
+_flusher_lock = threading.Lock()
+
+
+def start_write_flusher(db, on_flushed=None):
+    """プロセスごと・テナントごとに1回だけ送信スレッドを起動する"""
+    tenant = current_tenant()
+    with _flusher_lock:
+        flusher = _flushers.get(tenant.id)
+        if flusher is None:
+            flusher = _flushers[tenant.id] = WriteFlusher(write_queue.for_tenant(tenant), db, on_flushed, tenant=tenant)
+            flusher.start()
+    return flusher